@@ -1,3 +1,6 @@
 #!/bin/bash
 
+python3 src/state_test.py || exit 1
+python3 src/scrum_test.py || exit 1
+python3 src/wait_proxy_test.py || exit 1
 exec python3 src/game_test.py
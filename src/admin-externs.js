@@ -125,13 +125,24 @@ class LogEntry {
     }
 }
 
+class LogPage {
+    constructor() {
+        /** @type{Array<LogEntry>} */
+        this.entries;
+        /** @type{number} */
+        this.start;
+        /** @type{number} */
+        this.end;
+    }
+}
+
 class TeamPageData {
     constructor() {
         /** @type{Array<OpenPuzzle>} */
         this.open_puzzles;
         /** @type{?Array<number>} */
         this.fastpasses;
-        /** @type{Array<LogEntry>} */
+        /** @type{LogPage} */
         this.log;
         /** @type{string} */
         this.svg;
@@ -154,9 +165,13 @@ class PuzzlePageData {
         this.submitted_count;
         /** @type{number} */
         this.solve_count;
+        /** @type{Array<number>} */
+        this.solve_percentiles;
         /** @type{Array<number, string>} */
         this.incorrect_answers;
-        /** @type{Array<LogEntry>} */
+        /** @type{number} */
+        this.incorrect_distinct;
+        /** @type{LogPage} */
         this.log;
         /** @type{number} */
         this.hint_time;
@@ -247,6 +262,8 @@ class ServerPageData {
         this.sessions;
         /** @type{Array<number>} */
         this.proxy_waits;
+        /** @type{Object<string, number>} */
+        this.stats;
     }
 }
 
@@ -639,29 +639,6 @@ class A2020_Autocomplete {
 
 }
 
-function A2020_DisplayLog(el, log) {
-    if (!log || log.length == 0) {
-        el.innerHTML = "No activity.";
-        return;
-    }
-    el.innerHTML = "";
-    for (var i = 0; i < log.length; ++i) {
-        var e = log[i];
-        var td = goog.dom.createDom("TD");
-        for (var j = 0; j < e.htmls.length; ++j) {
-            if (j > 0) td.appendChild(goog.dom.createDom("BR"));
-            var sp = goog.dom.createDom("SPAN");
-            sp.innerHTML = e.htmls[j];
-            td.appendChild(sp);
-        }
-        var tr = goog.dom.createDom("TR",
-                                    null,
-                                    goog.dom.createDom("TH", null, admin2020.time_formatter.format(e.when)),
-                                    td);
-        el.appendChild(tr);
-    }
-}
-
 class A2020_ServerPage {
     constructor() {
         /** @type{Element} */
@@ -670,6 +647,8 @@ class A2020_ServerPage {
         this.sessions = goog.dom.getElement("stsessions");
         /** @type{Element} */
         this.proxy_waits = goog.dom.getElement("stproxies");
+        /** @type{Element} */
+        this.stats = goog.dom.getElement("ststats");
 
         this.flusher = new Common_enabler(
             "srvflushenable", "srvflush",
@@ -695,6 +674,15 @@ class A2020_ServerPage {
             this.proxy_waits.appendChild(
                 goog.dom.createDom("SPAN", "proxyload", ""+data.proxy_waits[i]));
         }
+
+        this.stats.innerHTML = "";
+        var keys = Object.keys(data.stats).sort();
+        for (var i = 0; i < keys.length; ++i) {
+            this.stats.appendChild(
+                goog.dom.createDom("TR", null,
+                                   goog.dom.createDom("TH", null, keys[i]),
+                                   goog.dom.createDom("TD", null, ""+data.stats[keys[i]])));
+        }
     }
 }
 
@@ -710,6 +698,10 @@ class A2020_TeamPage {
         this.tpfastpass = goog.dom.getElement("tpfastpass");
         /** @type{Element} */
         this.tplog = goog.dom.getElement("tplog");
+        this.log_view = new Common_LogView(this.tplog, admin2020.time_formatter, function(before, cb) {
+            goog.net.XhrIo.send("/admin/js/team/" + team_username + "?log_before=" + before,
+                                Common_invoke_with_json(null, function(data) { cb(data.log); }));
+        });
         /** @type{Element} */
         this.tpsvg = goog.dom.getElement("tpsvg");
         /** @type{Element} */
@@ -754,7 +746,7 @@ class A2020_TeamPage {
     }
 
     update() {
-        goog.net.XhrIo.send("/admin/js/team/" + team_username,
+        goog.net.XhrIo.send("/admin/js/team/" + team_username + "?" + this.log_view.query(),
                             Common_invoke_with_json(this, this.build));
     }
 
@@ -813,7 +805,7 @@ class A2020_TeamPage {
             el.style.display = "none";
         }
 
-        A2020_DisplayLog(this.tplog, data.log);
+        this.log_view.add_newer(data.log);
 
         this.tpsvg.innerHTML = data.svg;
         this.tpscore.innerHTML = "" + data.score;
@@ -837,9 +829,17 @@ class A2020_PuzzlePage {
         /** @type{Element} */
         this.ppmediansolve = goog.dom.getElement("ppmediansolve");
         /** @type{Element} */
+        this.ppsolvepercentiles = goog.dom.getElement("ppsolvepercentiles");
+        /** @type{Element} */
         this.ppbadsubmit = goog.dom.getElement("ppbadsubmit");
+        /** @type{number} */
+        this.incorrect_limit = 50;
          /** @type{Element} */
         this.pplog = goog.dom.getElement("pplog");
+        this.log_view = new Common_LogView(this.pplog, admin2020.time_formatter, function(before, cb) {
+            goog.net.XhrIo.send("/admin/js/puzzle/" + puzzle_id + "?incorrect_limit=0&log_before=" + before,
+                                Common_invoke_with_json(null, function(data) { cb(data.log); }));
+        });
          /** @type{Element} */
         this.pphinttime = goog.dom.getElement("pphinttime");
          /** @type{Element} */
@@ -873,7 +873,9 @@ class A2020_PuzzlePage {
     }
 
     update() {
-        goog.net.XhrIo.send("/admin/js/puzzle/" + puzzle_id,
+        goog.net.XhrIo.send("/admin/js/puzzle/" + puzzle_id +
+                            "?incorrect_limit=" + this.incorrect_limit +
+                            "&" + this.log_view.query(),
                             Common_invoke_with_json(this, this.build));
     }
 
@@ -884,8 +886,14 @@ class A2020_PuzzlePage {
         this.ppsolvedcount.innerHTML = "" + data.solve_count;
         if (data.solve_count > 0) {
             this.ppmediansolve.innerHTML = admin2020.time_formatter.duration(data.median_solve);
+            var pct = [];
+            for (var i = 0; i < data.solve_percentiles.length; ++i) {
+                pct.push(admin2020.time_formatter.duration(data.solve_percentiles[i]));
+            }
+            this.ppsolvepercentiles.innerHTML = pct.join(" / ");
         } else {
             this.ppmediansolve.innerHTML = "\u2014";
+            this.ppsolvepercentiles.innerHTML = "\u2014";
         }
 
         this.ppbadsubmit.innerHTML = "";
@@ -897,10 +905,21 @@ class A2020_PuzzlePage {
             this.ppbadsubmit.appendChild(goog.dom.createTextNode(": "));
             this.ppbadsubmit.appendChild(goog.dom.createDom("SPAN", "badsubmit", ""+data.incorrect_answers[i][1]));
         }
+        var more = data.incorrect_distinct - data.incorrect_answers.length;
+        if (more > 0) {
+            var more_el = goog.dom.createDom("A", {href: "#"}, "" + more + " more\u2026");
+            goog.events.listen(more_el, goog.events.EventType.CLICK, goog.bind(function(e) {
+                e.preventDefault();
+                this.incorrect_limit += 200;
+                this.update();
+            }, this));
+            this.ppbadsubmit.appendChild(goog.dom.createDom("BR"));
+            this.ppbadsubmit.appendChild(more_el);
+        }
 
         this.pphinttime.innerHTML = admin2020.time_formatter.duration(data.hint_time);
 
-        A2020_DisplayLog(this.pplog, data.log);
+        this.log_view.add_newer(data.log);
 
         if (data.errata && data.errata.length > 0) {
             this.pperrata.style.display = "block";
@@ -15,6 +15,8 @@ import login
 import util
 import wait_proxy
 
+from state import save_state
+
 OPTIONS = None
 
 class AdminHomePage(util.AdminPageHandler):
@@ -66,9 +68,14 @@ class ServerDataHandler(util.AdminHandler):
       proxy_load.append(proxy_waits)
       waits += proxy_waits
 
+    server_stats = save_state.get_stats()
+    server_stats.update(game.Team.get_map_cache_stats())
+    server_stats.update(game.Submission.get_queue_stats())
+
     d = {"waits": waits,
          "sessions": len(keys),
-         "proxy_waits": proxy_load}
+         "proxy_waits": proxy_load,
+         "stats": dict((k, round(v, 2)) for (k, v) in server_stats.items())}
 
     self.return_json(d)
 
@@ -124,7 +131,7 @@ class TeamDataHandler(util.AdminHandler):
 
     d = {"open_puzzles": open_list,
          "fastpasses": team.fastpasses_available,
-         "log": team.admin_log.get_data(),
+         "log": util.get_log_page(self, team.admin_log),
          "svg": team.bb_data()["svg"],
          "score": team.score,
          "phone": html.escape(team.attrs.get("phone", "(unknown)")),
@@ -182,6 +189,7 @@ class PuzzleDataHandler(util.AdminHandler):
   @login.required("admin")
   def get(self, shortname):
     puzzle = self.get_puzzle(shortname)
+    limit = util.get_int_argument(self, "incorrect_limit", 50)
 
     errata = [e.to_json() for e in itertools.chain(game.Global.STATE.errata,
                                                    game.Global.STATE.reloads) if e.puzzle == puzzle]
@@ -191,9 +199,11 @@ class PuzzleDataHandler(util.AdminHandler):
          "open_count": len(puzzle.open_teams),
          "submitted_count": len(puzzle.submitted_teams),
          "solve_count": len(puzzle.solve_durations),
-         "incorrect_answers": puzzle.incorrect_counts,
+         "solve_percentiles": [puzzle.solve_duration_percentile(p) for p in (25, 75, 90)],
+         "incorrect_answers": puzzle.get_incorrect_counts(limit=limit),
+         "incorrect_distinct": len(puzzle.incorrect_ranking),
          "hint_time": puzzle.hints_available_time,
-         "log": puzzle.puzzle_log.get_data(),
+         "log": util.get_log_page(self, puzzle.puzzle_log),
          "errata": errata,
          "hint_replies": puzzle.get_hint_reply_data()}
     self.return_json(d)
@@ -579,7 +589,7 @@ class ActionHandler(util.AdminHandler):
       _, username, shortname = task_key.split("-")
       team = self.get_team(username)
       puzzle = self.get_puzzle(shortname)
-      ps = team.puzzle_state[puzzle]
+      ps = team.materialize_puzzle_state(puzzle)
       if unclaim:
         if ps.claim:
           ps.claim = None
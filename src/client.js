@@ -1759,36 +1759,22 @@ class H2020_ActivityLog {
     constructor() {
         /** @type{Element} */
         this.log = goog.dom.getElement("log");
+        this.view = new Common_LogView(this.log, hunt2020.time_formatter, function(before, cb) {
+            goog.net.XhrIo.send("/js/log?log_before=" + before,
+                                Common_invoke_with_json(null, function(data) { cb(data.log); }));
+        });
 
         this.update();
     }
 
     update() {
-        goog.net.XhrIo.send("/js/log", Common_invoke_with_json(this, this.build));
+        goog.net.XhrIo.send("/js/log?" + this.view.query(),
+                            Common_invoke_with_json(this, this.build));
     }
 
     /** param{ActivityLogData} data */
     build(data) {
-        if (data.log.length == 0) {
-            this.log.innerHTML = "No activity.";
-            return;
-        }
-        this.log.innerHTML = "";
-        for (var i = 0; i < data.log.length; ++i) {
-            var e = data.log[i];
-            var td = goog.dom.createDom("TD");
-            for (var j = 0; j < e.htmls.length; ++j) {
-                if (j > 0) td.appendChild(goog.dom.createDom("BR"));
-                var sp = goog.dom.createDom("SPAN");
-                sp.innerHTML = e.htmls[j];
-                td.appendChild(sp);
-            }
-            var tr = goog.dom.createDom("TR",
-                                        null,
-                                        goog.dom.createDom("TH", null, hunt2020.time_formatter.format(e.when)),
-                                        td);
-            this.log.appendChild(tr);
-        }
+        this.view.add_newer(data.log);
     }
 }
 
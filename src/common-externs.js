@@ -2,3 +2,7 @@
 /** @type{number} */
 var wid;
 
+
+// wait proxy shard, if the proxies are sharded by team
+/** @type{?number} */
+var wait_shard;
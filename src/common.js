@@ -93,6 +93,105 @@ class Common_Counter {
     }
 }
 
+class Common_LogView {
+    /** @param{Element} el
+        @param{Common_TimeFormatter} time_formatter
+        @param{function(number, function(LogPage))} fetch_older */
+    constructor(el, time_formatter, fetch_older) {
+        this.el = el;
+        this.time_formatter = time_formatter;
+        this.fetch_older = fetch_older;
+        /** @type{?number} */
+        this.start = null;
+        /** @type{?number} */
+        this.end = null;
+        /** @type{Element} */
+        this.newest = null;
+        /** @type{Element} */
+        this.more = null;
+    }
+
+    /** Query args asking for the entries this view doesn't have yet. */
+    query() {
+        if (this.end === null) return "log_limit=100";
+        return "log_since=" + Math.max(0, this.end - 1);
+    }
+
+    /** @param{LogEntry} e */
+    make_row(e) {
+        var td = goog.dom.createDom("TD");
+        for (var j = 0; j < e.htmls.length; ++j) {
+            if (j > 0) td.appendChild(goog.dom.createDom("BR"));
+            var sp = goog.dom.createDom("SPAN");
+            sp.innerHTML = e.htmls[j];
+            td.appendChild(sp);
+        }
+        return goog.dom.createDom("TR", null,
+                                  goog.dom.createDom("TH", null, this.time_formatter.format(e.when)),
+                                  td);
+    }
+
+    /** Merge in a page fetched with query().
+        @param{LogPage} page */
+    add_newer(page) {
+        if (this.end === null || page.start >= this.end || page.start < this.end - 1) {
+            // First fetch, or the page doesn't join up with what we
+            // have; start over.
+            this.el.innerHTML = "";
+            this.newest = null;
+            this.more = null;
+            this.start = page.start;
+        } else if (this.newest && page.entries.length > 0) {
+            // The page repeats our newest entry, which may have grown.
+            goog.dom.removeNode(this.newest);
+            this.newest = null;
+        }
+        this.end = page.end;
+
+        var before = this.el.firstChild;
+        for (var i = 0; i < page.entries.length; ++i) {
+            var tr = this.make_row(page.entries[i]);
+            if (i == 0) this.newest = tr;
+            this.el.insertBefore(tr, before);
+        }
+        if (this.end == 0) {
+            this.el.innerHTML = "No activity.";
+        }
+        this.update_more();
+    }
+
+    /** @param{LogPage} page */
+    add_older(page) {
+        if (page.end != this.start) return;
+        if (this.more) goog.dom.removeNode(this.more);
+        this.more = null;
+        for (var i = 0; i < page.entries.length; ++i) {
+            this.el.appendChild(this.make_row(page.entries[i]));
+        }
+        this.start = page.start;
+        this.update_more();
+    }
+
+    update_more() {
+        if (this.more) {
+            goog.dom.removeNode(this.more);
+            this.more = null;
+        }
+        if (!this.start) return;
+        var a = goog.dom.createDom("A", {href: "#"}, "older\u2026");
+        var self = this;
+        goog.events.listen(a, goog.events.EventType.CLICK, function(e) {
+            e.preventDefault();
+            self.fetch_older(/** @type{number} */ (self.start),
+                             function(page) { self.add_older(page); });
+        });
+        this.more = goog.dom.createDom("TR", null,
+                                       goog.dom.createDom("TH"),
+                                       goog.dom.createDom("TD", null, a));
+        this.el.appendChild(this.more);
+    }
+}
+
 class Common_Waiter {
     /** @param{Object} dispatcher */
     /** @param{string} base_url */
@@ -103,6 +202,9 @@ class Common_Waiter {
         this.dispatcher = dispatcher;
         this.notify_fn = notify_fn;
         this.storage = storage;
+
+        // Sharded proxies: only one of them gets our messages.
+        if (wait_shard !== null) base_url += "/p" + wait_shard;
         this.serial = start_serial;
 
         var protocol = null;
@@ -186,6 +288,12 @@ class Common_Waiter {
             for (var i = 0; i < msgs.length; ++i) {
                 this.serial = /** @type{number} */ (msgs[i][0]);
                 var msg = /** @type{Object} */ (msgs[i][1]);
+                if (msg.method == "resync") {
+                    // We missed messages the server no longer has;
+                    // start over from a fresh copy of the page.
+                    location.reload();
+                    return;
+                }
                 if (goog.DEBUG) {
                     console.log("dispatching", this.serial, msg);
                 }
@@ -54,6 +54,7 @@ class MapDataHandler(util.TeamHandler):
   @login.required("team")
   def get(self, shortname):
     if shortname == "mainmap":
+      land = game.Land.BY_SHORTNAME["mainmap"]
       j = self.team.get_mainmap_data()
     else:
       land = game.Land.BY_SHORTNAME.get(shortname, None)
@@ -62,7 +63,16 @@ class MapDataHandler(util.TeamHandler):
       if land not in self.team.open_lands:
         return self.not_found()
       j = self.team.get_land_data(land)
-    self.return_json(j)
+
+    # Let the browser keep the map and revalidate it, so an unchanged
+    # map costs a 304 instead of the whole JSON.
+    self.set_header("Content-Type", "application/json")
+    self.set_header("Cache-Control", "private, no-cache")
+    self.set_header("ETag", self.team.get_map_etag(land))
+    if self.check_etag_header():
+      self.set_status(http.client.NOT_MODIFIED.value)
+      return
+    self.write(j)
 
 
 class PlayerHomePage(LandMapPage):
@@ -111,7 +121,7 @@ class ActivityLogPage(util.TeamPageHandler):
 class ActivityLogDataHandler(util.TeamHandler):
   @login.required("team")
   def get(self):
-    d = {"log": self.team.activity_log.get_data()}
+    d = {"log": util.get_log_page(self, self.team.activity_log)}
     self.return_json(d)
 
 class CurrentHeaderDataHandler(util.TeamHandler):
@@ -268,7 +278,7 @@ class HintHistoryHandler(util.TeamHandler):
   @login.required("team", on_fail=http.client.UNAUTHORIZED)
   def get(self, shortname):
     ps = self.team.get_puzzle_state(shortname)
-    if not ps:
+    if not ps or ps.state == game.PuzzleState.CLOSED:
       return self.not_found()
     d = {"history": ps.get_hint_data_team(),
          "puzzle_id": ps.puzzle.shortname}
@@ -388,8 +398,9 @@ class ActionHandler(util.AdminHandler):
     land = game.Land.BY_SHORTNAME[land]
     icon = land.icons[icon]
     icon.offset = [icon.offset[0] + dx, icon.offset[1] + dy, icon.offset[2] + dw]
-    self.team.dirty_lands.add(land.shortname)
-    self.team.cached_mapdata.pop(land, None)
+    self.team.invalidate_map(land)
+    # Other teams' cached views of the land are stale too.
+    game.Team.SHARED_MAPDATA.clear()
     self.set_status(http.client.NO_CONTENT.value)
 
 class OffsetsPage(util.TeamPageHandler):
@@ -241,9 +241,20 @@ class LogEntry {
     }
 }
 
-class ActivityLogData {
+class LogPage {
     constructor() {
         /** @type{Array<LogEntry>} */
+        this.entries;
+        /** @type{number} */
+        this.start;
+        /** @type{number} */
+        this.end;
+    }
+}
+
+class ActivityLogData {
+    constructor() {
+        /** @type{LogPage} */
         this.log;
     }
 }
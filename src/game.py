@@ -1,4 +1,5 @@
 import asyncio
+import bisect
 import collections
 import copy
 import csv
@@ -8,9 +9,9 @@ import heapq
 import html
 import itertools
 import json
+import math
 import os
 import re
-import statistics
 import string
 import time
 import unicodedata
@@ -23,25 +24,283 @@ import wait_proxy
 
 OPTIONS = None
 
-class Log:
-  Entry = collections.namedtuple("Entry", ("when", "htmls"))
+LogEntry = collections.namedtuple("LogEntry", ("when", "events"))
 
-  def __init__(self):
+class Log:
+  """An append-only log of (when, events) entries.  Entries are kept
+  oldest first, and an entry's index is its cursor: a reader that has
+  seen up to cursor `end` asks for everything since end-1 (the newest
+  entry can still gain events with the same timestamp).
+
+  Events are tuples of (kind, args...), often shared between a team's
+  logs and a puzzle's.  They're only turned into HTML, by this log's
+  view in LOG_VIEWS, when a page of the log is asked for."""
+  Entry = LogEntry
+
+  def __init__(self, view):
+    self.view = view
     self.entries = []
-    self.data = []
 
-  def add(self, when, html):
-    if self.entries and when == self.entries[0].when:
-      self.entries[0].htmls.append(html)
+  def add(self, when, event):
+    if self.entries and when == self.entries[-1].when:
+      self.entries[-1].events.append(event)
     else:
-      self.entries.insert(0, Log.Entry(when, [html]))
-      self.data.insert(0, self.entries[0]._asdict())
+      self.entries.append(Log.Entry(when, [event]))
+
+  def __len__(self):
+    return len(self.entries)
+
+  def render(self, entry):
+    view = LOG_VIEWS[self.view]
+    return {"when": entry.when,
+            "htmls": [view[ev[0]](*ev[1:]) for ev in entry.events]}
 
   def get_data(self):
-    return self.data
+    """All entries, newest first."""
+    return [self.render(e) for e in reversed(self.entries)]
+
+  def get_page(self, since=None, before=None, limit=None):
+    """Entries with cursors in [since, before), newest first.  If
+    limit is given, only the newest limit of them are returned.
+    start and end are the cursors of the oldest entry returned and
+    one past the newest."""
+    end = len(self.entries)
+    if before is not None: end = max(0, min(end, before))
+    start = 0 if since is None else max(0, min(end, since))
+    if limit is not None: start = max(start, end - limit)
+    return {"entries": [self.render(e) for e in reversed(self.entries[start:end])],
+            "start": start, "end": end}
+
+
+def render_submitted(ps, raw_answer, state):
+  msg = (f'{ps.admin_html_team} submitted <b>{html.escape(raw_answer)}</b>: '
+         f'<span class="submission-{state}">{state}</span>.')
+  explain = util.explain_unicode(raw_answer)
+  if explain:
+    msg += "<br><span class=explain>" + html.escape(explain) + "</span>"
+  return msg
+
+def render_video(v):
+  thumb = OPTIONS.static_content.get(f"thumb{v}.png")
+  return ("A new Park History video is available!<br>"
+          f"<a href=\"/about_the_park#history\"><img class=videothumb src=\"{thumb}\"></a>")
+
+# How each kind of event reads in each log that records it: the
+# team's own activity log, the team's admin log, and the puzzle's
+# admin log.
+LOG_VIEWS = {
+  "team": {
+    "answer": lambda ps, a: f"Got answer <b>{html.escape(a)}</b> for {ps.puzzle.html}.",
+    "pennypass": lambda: "Received a PennyPass.",
+    "pennypass_expired": lambda: "A PennyPass expired.",
+    "pennypass_used": lambda land: f"Used a PennyPass on <b>{html.escape(land.title)}</b>.",
+    "solved": lambda ps, d: f"{ps.puzzle.html} solved.",
+    "video": render_video,
+    "penny": lambda p: f"Collected the <b>{p.name}</b> penny.",
+    "hints_open": lambda ps: f"Hints available for {ps.puzzle.html}.",
+    "hint_cancel": lambda ps: f"Canceled the hint request on {ps.puzzle.html}.",
+    "hint_followup": lambda ps: f"Requested a followup hint on {ps.puzzle.html}.",
+    "hint_request": lambda ps: f"Requested a hint on {ps.puzzle.html}.",
+    "hint_reply": lambda ps, sender: f"Guest Services replied to hint request on {ps.puzzle.html}.",
+    "land_open": lambda land: f"<b>{html.escape(land.title)}</b> is now open!",
+    "opened": lambda ps: f"{ps.puzzle.html} opened.",
+    "erratum": lambda puzzle, sender: f"An erratum was posted for {puzzle.html}.",
+  },
+
+  "admin": {
+    "answer": lambda ps, a: f"Got answer <b>{html.escape(a)}</b> for {ps.admin_html_puzzle}.",
+    "phone": lambda old, new: (f"Changed contact phone from <b>{html.escape(old)}</b> to "
+                               f"<b>{html.escape(new)}</b>."),
+    "location": lambda old, new: (f"Changed team HQ location from <b>{html.escape(old)}</b> to "
+                                  f"<b>{html.escape(new)}</b>."),
+    "note": lambda fullname, text: f"<span class=\"adminnote\"><b>{fullname}</b> noted: {text}</span>",
+    "bestowed": lambda sender: f"Bestowed a PennyPass by <b>{sender.fullname}</b>.",
+    "pennypass": lambda: "Received a PennyPass.",
+    "pennypass_expired": lambda: "A PennyPass expired.",
+    "pennypass_used": lambda land: f"Used a PennyPass on <b>{html.escape(land.title)}</b>.",
+    "solved": lambda ps, d: f"{ps.admin_html_puzzle} solved ({util.format_duration(d)}).",
+    "penny": lambda p: f"Collected the <b>{p.name}</b> penny.",
+    "loony_skipped": lambda: "Skipped Loonie Toonie visit for remote-only team.",
+    "loony_visit": lambda: "Completed the Loonie Toonie visit.",
+    "penny_visit_skipped": lambda: "Skipped Penny visit for remote-only team.",
+    "penny_visit": lambda: "Completed the Penny visit.",
+    "hints_open": lambda ps: f"Hints available for {ps.admin_html_puzzle}.",
+    "hint_no_reply": lambda ps, sender: (f"<b>{sender.fullname}</b> marked hint request on "
+                                         f"{ps.admin_html_puzzle} as not needing reply."),
+    "hint_cancel": lambda ps: f"Canceled the hint request on {ps.admin_html_puzzle}.",
+    "hint_followup": lambda ps: f"Requested a followup hint on {ps.admin_html_puzzle}.",
+    "hint_request": lambda ps: f"Requested a hint on {ps.admin_html_puzzle}.",
+    "hint_reply": lambda ps, sender: (f"<b>{sender.fullname}</b> replied to hint request on "
+                                      f"{ps.admin_html_puzzle}."),
+    "opened": lambda ps: f"{ps.admin_html_puzzle} opened.",
+  },
+
+  "puzzle": {
+    "submitted": render_submitted,
+    "solved": lambda ps, d: f"Solved by {ps.admin_html_team} ({util.format_duration(d)}).",
+    "hints_open": lambda ps: f"Hints available to {ps.admin_html_team}.",
+    "hint_cancel": lambda ps: f"{ps.admin_html_team} canceled their hint request.",
+    "hint_followup": lambda ps: f"{ps.admin_html_team} requested a followup hint.",
+    "hint_request": lambda ps: f"{ps.admin_html_team} requested a hint.",
+    "hint_reply": lambda ps, sender: (f"<b>{sender.fullname}</b> replied to hint request from "
+                                      f"{ps.admin_html_team}."),
+    "opened": lambda ps: f"Opened by {ps.admin_html_team}.",
+    "hint_time": lambda t, admin_user: (f"Hint time set to {util.format_duration(t)} by "
+                                        f"{admin_user.fullname}."),
+    "erratum": lambda puzzle, sender: f"An erratum was posted by <b>{sender.fullname}</b>.",
+    "reload": lambda sender: f"Puzzle was reloaded by <b>{sender.fullname}</b>.",
+  },
+}
+
+
+class IndexedHeap:
+  """A min-heap of (key, item) pairs that knows where each item is, so
+  an item can be moved to a new key or removed in O(log n) instead of
+  leaving a dead entry behind.  Each item is in the heap at most once."""
+
+  def __init__(self):
+    self.heap = []
+    self.pos = {}
+    self.stats = collections.Counter()
+
+  def __len__(self):
+    return len(self.heap)
+
+  def __contains__(self, item):
+    return item in self.pos
+
+  def __getstate__(self):
+    return {"heap": self.heap, "stats": self.stats}
+
+  def __setstate__(self, state):
+    self.heap = state["heap"]
+    self.stats = state["stats"]
+    self.pos = dict((e[1], i) for (i, e) in enumerate(self.heap))
+
+  def peek(self):
+    return self.heap[0]
+
+  def push(self, key, item):
+    """Add item, or move it if it's already in the heap."""
+    i = self.pos.get(item)
+    if i is None:
+      self.heap.append((key, item))
+      self.pos[item] = len(self.heap) - 1
+      self.sift_up(len(self.heap) - 1)
+    else:
+      self.stats["moved"] += 1
+      old = self.heap[i]
+      self.heap[i] = (key, item)
+      if (key, item) < old:
+        self.sift_up(i)
+      else:
+        self.sift_down(i)
+
+  def pop(self):
+    entry = self.heap[0]
+    self.remove_at(0)
+    return entry
+
+  def remove(self, item):
+    i = self.pos.get(item)
+    if i is None: return False
+    self.stats["removed"] += 1
+    self.remove_at(i)
+    return True
+
+  def remove_at(self, i):
+    h = self.heap
+    del self.pos[h[i][1]]
+    last = h.pop()
+    if i < len(h):
+      h[i] = last
+      self.pos[last[1]] = i
+      self.sift_up(i)
+      self.sift_down(self.pos[last[1]])
+
+  def sift_up(self, i):
+    h = self.heap
+    entry = h[i]
+    while i > 0:
+      parent = (i - 1) // 2
+      if not entry < h[parent]: break
+      h[i] = h[parent]
+      self.pos[h[i][1]] = i
+      i = parent
+    h[i] = entry
+    self.pos[entry[1]] = i
+
+  def sift_down(self, i):
+    h = self.heap
+    n = len(h)
+    entry = h[i]
+    while True:
+      child = 2 * i + 1
+      if child >= n: break
+      if child + 1 < n and h[child+1] < h[child]: child += 1
+      if not h[child] < entry: break
+      h[i] = h[child]
+      self.pos[h[i][1]] = i
+      i = child
+    h[i] = entry
+    self.pos[entry[1]] = i
+
+
+class Scheduler:
+  """Runs the server's periodic tasks when they're due, each from a
+  loop.call_at timer, instead of having them poll.  A task is a
+  function of the current time that does whatever is due and returns
+  when it next needs to run (or None).  Anything that gives a task new
+  work calls wake() with the time the work is due.
+
+  Nothing is registered while replaying or in the offline tools, so
+  wake() does nothing there."""
+
+  # Every task runs at least this often, in case a wake() was missed.
+  MAX_IDLE = 60.0
+
+  tasks = {}
+
+  @classmethod
+  def register(cls, key, fn, min_interval=0.0):
+    """Start running fn; it runs at most once per min_interval seconds."""
+    cls.tasks[key] = {"fn": fn, "min_interval": min_interval,
+                      "due": None, "handle": None, "last_run": 0.0}
+    cls.wake(key)
+
+  @classmethod
+  def wake(cls, key, when=None):
+    """Make sure task key runs no later than when (default now)."""
+    task = cls.tasks.get(key)
+    if not task: return
+    now = time.time()
+    if when is None: when = now
+    when = max(when, task["last_run"] + task["min_interval"])
+    if task["handle"]:
+      if task["due"] <= when: return
+      task["handle"].cancel()
+    loop = asyncio.get_event_loop()
+    task["due"] = when
+    task["handle"] = loop.call_at(loop.time() + max(when - now, 0), cls.run, key)
+
+  @classmethod
+  def run(cls, key):
+    task = cls.tasks[key]
+    task["handle"] = None
+    now = time.time()
+    task["last_run"] = now
+    when = None
+    try:
+      when = task["fn"](now)
+    finally:
+      if when is None or when > now + cls.MAX_IDLE:
+        when = now + cls.MAX_IDLE
+      cls.wake(key, when)
 
 
 class HintMessage:
+  __slots__ = ("parent", "when", "sender", "text", "special")
+
   def __init__(self, parent, when, sender, text, special=None):
     self.parent = parent  # PuzzleState
     parent.cached_hint_data_team = None
@@ -58,6 +317,8 @@ class HintMessage:
     self.special = special
 
 class Task:
+  __slots__ = ("when", "team", "taskname", "text", "url", "oncomplete", "key", "claim", "kind")
+
   def __init__(self, when, team, taskname, text, url, oncomplete, kind):
     self.when = int(when)
     self.team = team
@@ -206,6 +467,12 @@ class PuzzleState:
   OPEN = "open"
   SOLVED = "solved"
 
+  # Every team has one of these for every puzzle, so keep them small.
+  __slots__ = ("team", "puzzle", "state", "submissions", "open_time", "solve_time",
+               "answers_found", "guess_buckets", "hints_available", "hints",
+               "last_hq_sender", "claim", "keeper_answers",
+               "cached_hint_data_team", "cached_hint_data_admin")
+
   def __init__(self, team, puzzle):
     self.team = team
     self.puzzle = puzzle
@@ -214,6 +481,9 @@ class PuzzleState:
     self.open_time = None
     self.solve_time = None
     self.answers_found = set()
+    # guess_buckets[i] is the guess token bucket (guesses, last_ding,
+    # last_reset) after submissions[i].
+    self.guess_buckets = []
     self.hints_available = False
     self.hints = []
     self.last_hq_sender = None # AdminUser of most recent reply
@@ -223,13 +493,19 @@ class PuzzleState:
     self.cached_hint_data_team = None
     self.cached_hint_data_admin = None
 
-    self.admin_url = f"/admin/team/{team.username}/puzzle/{puzzle.shortname}"
-    self.admin_html_puzzle = (
-      f'<a href="{self.admin_url}">{html.escape(puzzle.title)}</a> '
-      f'<span class="landtag" style="background-color: {puzzle.land.color};">{puzzle.land.symbol}</span>')
+  @property
+  def admin_url(self):
+    return f"/admin/team/{self.team.username}/puzzle/{self.puzzle.shortname}"
 
+  @property
+  def admin_html_puzzle(self):
+    land = self.puzzle.land
+    return (f'<a href="{self.admin_url}">{html.escape(self.puzzle.title)}</a> '
+            f'<span class="landtag" style="background-color: {land.color};">{land.symbol}</span>')
 
-    self.admin_html_team = f'<a href="{self.admin_url}">{html.escape(team.name)}</a>'
+  @property
+  def admin_html_team(self):
+    return f'<a href="{self.admin_url}">{html.escape(self.team.name)}</a>'
 
   def remove_pending(self):
     count = 0
@@ -240,8 +516,21 @@ class PuzzleState:
 
     after = self.submissions[-count:]
     del self.submissions[-count:]
+    self.forget_guesses(len(self.submissions))
     return after
 
+  def forget_guesses(self, index):
+    """Submissions from index on have changed or been removed."""
+    del self.guess_buckets[index:]
+
+  def submission_checked(self, sub):
+    # Search from the end; the submission just checked normally comes
+    # right before the ones still pending.
+    for i in range(len(self.submissions)-1, -1, -1):
+      if self.submissions[i] is sub:
+        self.forget_guesses(i)
+        return
+
   def requeue(self, after, now):
     for sub in after:
       sub.check_time = None
@@ -294,6 +583,39 @@ class PuzzleState:
     return out
 
 
+class ClosedPuzzleState(PuzzleState):
+  """The state of every puzzle a team hasn't opened.  There's only the
+  one, CLOSED_PUZZLE_STATE, shared by all teams and puzzles, so it
+  can't be changed; use Team.materialize_puzzle_state() to get a
+  team's own PuzzleState for a puzzle."""
+  __slots__ = ()
+
+  def __init__(self):
+    for k, v in (("team", None), ("puzzle", None), ("state", self.CLOSED),
+                 ("submissions", ()), ("open_time", None), ("solve_time", None),
+                 ("answers_found", frozenset()), ("guess_buckets", ()),
+                 ("hints_available", False), ("hints", ()), ("last_hq_sender", None),
+                 ("claim", None), ("keeper_answers", 0),
+                 ("cached_hint_data_team", []), ("cached_hint_data_admin", [])):
+      object.__setattr__(self, k, v)
+
+  def __setattr__(self, name, value):
+    raise AttributeError(f"can't set {name} on the closed puzzle state")
+
+  def __reduce__(self):
+    return "CLOSED_PUZZLE_STATE"
+
+CLOSED_PUZZLE_STATE = ClosedPuzzleState()
+
+
+class PuzzleStateMap(dict):
+  """A team's PuzzleStates, by puzzle.  Only puzzles the team has
+  opened (or otherwise touched) have one; looking up any other puzzle
+  gives CLOSED_PUZZLE_STATE, and iterating skips them."""
+  __slots__ = ()
+
+  def __missing__(self, puzzle):
+    return CLOSED_PUZZLE_STATE
 
 
 class Submission:
@@ -320,7 +642,11 @@ class Submission:
     "complete": "yellow",
     }
 
-  GLOBAL_SUBMIT_QUEUE = []
+  GLOBAL_SUBMIT_QUEUE = IndexedHeap()
+
+  __slots__ = ("state", "submit_id", "team", "puzzle", "puzzle_state", "answer",
+               "raw_answer", "sent_time", "submit_time", "check_time",
+               "extra_response", "wrong_but_reasonable", "user")
 
   def __init__(self, now, submit_id, team, puzzle, answer):
     self.state = self.PENDING
@@ -338,6 +664,7 @@ class Submission:
     self.check_time = None
     self.extra_response = None
     self.wrong_but_reasonable = None
+    self.user = None    # AdminUser, for resets
 
   def __lt__(self, other):
     return self.submit_id < other.submit_id
@@ -345,12 +672,15 @@ class Submission:
   def check_or_queue(self, now, log=True):
     self.check_time = self.compute_check_time()
     if self.check_time <= self.sent_time:
+      # A requeued submission may have been waiting.
+      self.GLOBAL_SUBMIT_QUEUE.remove(self)
       self.check_answer(self.sent_time)
     else:
       if log:
         Global.STATE.log_submit(now, self.team.username, self.puzzle.shortname,
                                 self.raw_answer, self.answer, "queued")
-      heapq.heappush(self.GLOBAL_SUBMIT_QUEUE, (self.check_time, self))
+      self.GLOBAL_SUBMIT_QUEUE.push(self.check_time, self)
+      Scheduler.wake("submit", self.check_time)
       self.team.invalidate(self.puzzle)
 
   def compute_check_time(self):
@@ -360,28 +690,34 @@ class Submission:
     guess_interval = self.puzzle.land.guess_interval
     guess_max = self.puzzle.land.guess_max
 
-    guesses = 0
-    last_ding = self.puzzle_state.open_time - guess_interval
-    last_reset = 0
-    for sub in self.puzzle_state.submissions[:-1]:
+    # Bring the token bucket up to date with the submissions before
+    # this one; normally only the previous one is new.
+    ps = self.puzzle_state
+    buckets = ps.guess_buckets
+    n = len(ps.submissions) - 1
+    del buckets[n:]
+    if buckets:
+      guesses, last_ding, last_reset = buckets[-1]
+    else:
+      guesses = 0
+      last_ding = ps.open_time - guess_interval
+      last_reset = 0
+    for sub in ps.submissions[len(buckets):n]:
       if sub.state == self.RESET:
         guesses = 0
         last_ding = sub.sent_time - guess_interval
         last_reset = sub.sent_time
-        continue
-
-      if not (sub.state in (self.PENDING, self.INCORRECT) and not sub.wrong_but_reasonable):
-        continue
-
-      interval = sub.check_time - last_ding
-      gotten = int(interval / guess_interval)
-      guesses += gotten
-      if guesses > guess_max: guesses = guess_max
-      #print(f"{sub.answer} {sub.check_time - sub.puzzle_state.open_time} {guesses}")
-      guesses -= 1
-      last_ding = sub.check_time
-
-    sub = self.puzzle_state.submissions[-1]
+      elif sub.state in (self.PENDING, self.INCORRECT) and not sub.wrong_but_reasonable:
+        interval = sub.check_time - last_ding
+        gotten = int(interval / guess_interval)
+        guesses += gotten
+        if guesses > guess_max: guesses = guess_max
+        #print(f"{sub.answer} {sub.check_time - sub.puzzle_state.open_time} {guesses}")
+        guesses -= 1
+        last_ding = sub.check_time
+      buckets.append((guesses, last_ding, last_reset))
+
+    sub = ps.submissions[-1]
     assert sub.check_time is None
     virtual_sent_time = max(sub.sent_time, last_reset)
     interval = max(virtual_sent_time - last_ding, 0)
@@ -455,19 +791,12 @@ class Submission:
 
     self.puzzle.submitted_teams.add(self.team)
     if self.state == self.INCORRECT:
-      same_answer = self.puzzle.incorrect_answers.setdefault(answer, set())
-      same_answer.add(self.team)
-      self.puzzle.incorrect_counts = [(len(v), k) for (k, v) in self.puzzle.incorrect_answers.items()]
-      self.puzzle.incorrect_counts.sort(key=lambda x: (-x[0], x[1]))
+      self.puzzle.add_incorrect_answer(answer, self.team)
 
+    self.puzzle_state.submission_checked(self)
     self.puzzle_state.requeue_pending(now)
 
-    msg = (f'{self.puzzle_state.admin_html_team} submitted <b>{html.escape(self.raw_answer)}</b>: '
-           f'<span class="submission-{self.state}">{self.state}</span>.')
-    explain = util.explain_unicode(self.raw_answer)
-    if explain:
-      msg += "<br><span class=explain>" + html.escape(explain) + "</span>"
-    self.puzzle.puzzle_log.add(now, msg)
+    self.puzzle.puzzle_log.add(now, ("submitted", self.puzzle_state, self.raw_answer, self.state))
 
     if self.state == self.CORRECT:
       self.check_answer_correct(now)
@@ -476,9 +805,9 @@ class Submission:
 
   def check_answer_correct(self, now):
       if len(self.puzzle.answers) > 1:
-        a = self.puzzle.display_answers[self.answer]
-        self.team.activity_log.add(now, f"Got answer <b>{html.escape(a)}</b> for {self.puzzle.html}.")
-        self.team.admin_log.add(now, f"Got answer <b>{html.escape(a)}</b> for {self.puzzle_state.admin_html_puzzle}.")
+        ev = ("answer", self.puzzle_state, self.puzzle.display_answers[self.answer])
+        self.team.activity_log.add(now, ev)
+        self.team.admin_log.add(now, ev)
       self.puzzle_state.answers_found.add(self.answer)
       self.team.cached_all_puzzles_data = None
       fn = getattr(self.puzzle, "on_correct_answer", None)
@@ -491,8 +820,8 @@ class Submission:
           else:
             self.extra_response = xr
       else:
-        self.team.dirty_lands.add(self.puzzle.land.shortname)
-        self.team.cached_mapdata.pop(self.puzzle.land, None)
+        self.team.invalidate_map(self.puzzle.land)
+        self.team.beam_dirty_lands.add(self.puzzle.land)
         self.team.compute_puzzle_beam(now)
 
   def json_dict(self):
@@ -511,19 +840,23 @@ class Submission:
               "submit_id": self.submit_id}
 
   @classmethod
-  async def realtime_process_submit_queue(cls):
-    while True:
-      now = time.time()
-      teams, beam = cls.process_submit_queue(now)
+  def run_submit_queue(cls, now):
+    """Scheduler task: check the answers that are due and open lands
+    whose time has come."""
+    teams, beam = cls.process_submit_queue(now)
 
-      if beam:
-        Global.STATE.compute_all_beams()
-        teams.update(Team.all_teams())
+    if beam:
+      asyncio.create_task(Global.STATE.catch_up_beams())
 
-      for team in teams:
-        asyncio.create_task(team.flush_messages())
+    for team in teams:
+      asyncio.create_task(team.flush_messages())
 
-      await asyncio.sleep(1.0)
+    due = []
+    if cls.GLOBAL_SUBMIT_QUEUE:
+      due.append(cls.GLOBAL_SUBMIT_QUEUE.peek()[0])
+    if Land.time_unlock_queue and Global.STATE.event_start_time:
+      due.append(Global.STATE.event_start_time + Land.time_unlock_queue[0][0])
+    return min(due) if due else None
 
   @classmethod
   def process_submit_queue(cls, now):
@@ -531,30 +864,37 @@ class Submission:
     set of teams it sent messages to."""
     teams = set()
     q = cls.GLOBAL_SUBMIT_QUEUE
-    while q and q[0][0] <= now:
-      ct, sub = heapq.heappop(q)
-      if sub.state != cls.PENDING: continue
-      # It's possible for sub's check_time to have changed.  If it's
-      # doesn't match the queue time, just drop this event.
-      if sub.check_time == ct:
-        msgs = sub.check_answer(ct)
-        sub.team.send_messages([{"method": "history_change", "puzzle_id": sub.puzzle.shortname}])
-        teams.add(sub.team)
+    while q and q.peek()[0] <= now:
+      ct, sub = q.pop()
+      if sub.state != cls.PENDING:
+        q.stats["stale"] += 1
+        continue
+      msgs = sub.check_answer(ct)
+      sub.team.send_messages([{"method": "history_change", "puzzle_id": sub.puzzle.shortname}])
+      teams.add(sub.team)
 
     # Check for land opening by time.
     beam = False
     if Global.STATE and Global.STATE.event_start_time:
-      for land in Land.BY_SHORTNAME.values():
-        if not land.open_at_time: continue   # None or 0
-        rel = now - Global.STATE.event_start_time
-        if rel < land.open_at_time: continue # not yet
-        if land.time_unlocked: continue # already done
+      rel = now - Global.STATE.event_start_time
+      tq = Land.time_unlock_queue
+      while tq and tq[0][0] <= rel:
+        _, shortname = heapq.heappop(tq)
+        land = Land.BY_SHORTNAME[shortname]
         land.time_unlocked = True
         print(f"recomputing all beams for {land.shortname} {rel}")
         beam = True
 
     return teams, beam
 
+  @classmethod
+  def get_queue_stats(cls):
+    q = cls.GLOBAL_SUBMIT_QUEUE
+    return {"submit_queue_live": len(q),
+            "submit_queue_moved": q.stats["moved"],
+            "submit_queue_removed": q.stats["removed"],
+            "submit_queue_stale": q.stats["stale"]}
+
 
 class Team(login.LoginUser):
   BY_USERNAME = {}
@@ -564,6 +904,16 @@ class Team(login.LoginUser):
 
   cached_bb_label_info = None
 
+  # Map JSON and ETags, keyed by (land, map_fingerprint()), so teams
+  # with identical views of a map share one copy; and hit/miss counts
+  # for the admin server page.
+  SHARED_MAPDATA = {}
+  SHARED_MAPDATA_LIMIT = 5000
+  MAP_CACHE_STATS = collections.Counter()
+
+  # Cross-check every incremental beam computation against a full one.
+  CHECK_BEAM = False
+
   def __init__(self, username, info):
     username = username.lower()
 
@@ -590,8 +940,8 @@ class Team(login.LoginUser):
     self.open_lands = {}
     self.sorted_open_lands = []
     self.open_puzzles = set()    # PuzzleState objects
-    self.activity_log = Log()    # visible to team
-    self.admin_log = Log()       # visible only to GC
+    self.activity_log = Log("team")    # visible to team
+    self.admin_log = Log("admin")      # visible only to GC
     self.score = 0
     self.last_score_change = 0
     self.score_to_go = None
@@ -610,6 +960,7 @@ class Team(login.LoginUser):
     self.pending_messages = []
     self.dirty_lands = set()
     self.dirty_header = False
+    self.map_generation = collections.Counter()
 
     self.solve_days = set()
     self.last_incorrect_answer = None
@@ -617,6 +968,19 @@ class Team(login.LoginUser):
     self.fastpasses_available = []
     self.fastpasses_used = {}
 
+    # Incremental beam state: lands that need another look, puzzles
+    # opened since the last beam computation, each land's open count,
+    # the positions in Land.threshold_scores and Land.threshold_times
+    # of the next score and time gates (None forces a full
+    # computation), and the lowest score gate of any land that's still
+    # locked.
+    self.beam_dirty_lands = set()
+    self.beam_new_open = []
+    self.beam_land_counts = {}
+    self.beam_next_threshold = None
+    self.beam_next_time = None
+    self.beam_locked_score = None
+
     self.pennies_earned = []
     self.pennies_collected = []
     self.coin_found = None
@@ -626,6 +990,7 @@ class Team(login.LoginUser):
     self.last_solve = 0
 
     self.cached_bb_data = None
+    self.cached_all_puzzles_data = None
     self.cached_mapdata = {}
     self.cached_open_hints_data = None
     self.cached_errata_data = None
@@ -647,13 +1012,15 @@ class Team(login.LoginUser):
     return changed
 
   @classmethod
-  async def realtime_trim_last_hour(cls):
-    while True:
-      await asyncio.sleep(20.0)
-      now = time.time()
-      for team in Team.all_teams():
-        if team.trim_last_hour(now):
-          team.invalidate()
+  def trim_all_last_hour(cls, now):
+    """Scheduler task: drop activity that's more than an hour old."""
+    due = None
+    for team in Team.all_teams():
+      if team.trim_last_hour(now):
+        team.invalidate()
+      if team.last_hour and (due is None or team.last_hour[0][0] < due):
+        due = team.last_hour[0][0]
+    return due + 3600 if due is not None else None
 
   def get_admin_data(self):
     if self.cached_admin_data: return self.cached_admin_data
@@ -683,10 +1050,15 @@ class Team(login.LoginUser):
     return out
 
   def post_init(self):
-    # Create a PuzzleState object for all puzzles that exist.
-    self.puzzle_state = {}
-    for puzzle in Puzzle.all_puzzles():
-      self.puzzle_state[puzzle] = PuzzleState(self, puzzle)
+    # PuzzleStates are created as puzzles are opened.
+    self.puzzle_state = PuzzleStateMap()
+
+  def materialize_puzzle_state(self, puzzle):
+    """This team's own PuzzleState for puzzle, for changing it."""
+    ps = self.puzzle_state.get(puzzle)
+    if ps is None:
+      ps = self.puzzle_state[puzzle] = PuzzleState(self, puzzle)
+    return ps
 
   def __repr__(self):
     return f"<Team {self.username}>"
@@ -734,20 +1106,14 @@ class Team(login.LoginUser):
   @save_state
   def update_phone(self, now, new_phone):
     if self.attrs["phone"] == new_phone: return
-    self.admin_log.add(
-      now, (f"Changed contact phone from "
-            f"<b>{html.escape(self.attrs.get('phone', '(unknown)'))}</b> to "
-            f"<b>{html.escape(new_phone)}</b>."))
+    self.admin_log.add(now, ("phone", self.attrs.get("phone", "(unknown)"), new_phone))
     self.attrs["phone"] = new_phone
     self.invalidate()
 
   @save_state
   def update_location(self, now, new_location):
     if self.attrs["location"] == new_location: return
-    self.admin_log.add(
-      now, (f"Changed team HQ location from "
-            f"<b>{html.escape(self.attrs.get('location', '(unknown)'))}</b> to "
-            f"<b>{html.escape(new_location)}</b>."))
+    self.admin_log.add(now, ("location", self.attrs.get("location", "(unknown)"), new_location))
     self.attrs["location"] = new_location
     self.invalidate()
 
@@ -767,7 +1133,7 @@ class Team(login.LoginUser):
 
   @save_state
   def add_admin_note(self, now, user_fullname, text):
-    self.admin_log.add(now, f"<span class=\"adminnote\"><b>{user_fullname}</b> noted: {text}</span>")
+    self.admin_log.add(now, ("note", user_fullname, text))
     self.invalidate()
 
   def get_all_puzzles_data(self):
@@ -838,13 +1204,97 @@ class Team(login.LoginUser):
         d["to_go"] = f"Generate <b>{num:,}</b> more Wonder to unlock the next land!"
     return d
 
+  def invalidate_map(self, land):
+    """Note that this team's view of a map has changed: the cached
+    JSON is stale and browsers need to refetch it."""
+    self.map_generation[land] += 1
+    self.dirty_lands.add(land.shortname)
+
+  def map_fingerprint(self, land):
+    """Everything about this team's state that its view of the map
+    depends on.  Teams with the same fingerprint see the same map."""
+    def ps_key(p):
+      ps = self.puzzle_state[p]
+      return (ps.state, frozenset(ps.answers_found))
+
+    if land.shortname == "mainmap":
+      key = [frozenset(self.open_lands)]
+      for i in land.icons.values():
+        if i.to_land in self.open_lands and i.to_land.meta_puzzle:
+          key.append(ps_key(i.to_land.meta_puzzle))
+      if "workshop" in land.icons:
+        key.append(ps_key(Workshop.PUZZLE))
+      key.append(self.puzzle_state[Runaround.PUZZLE].state)
+      return tuple(key)
+
+    # Puzzles opened in the last few minutes are flagged as new, which
+    # depends on when this team opened them.
+    now = time.time()
+    key = [self.attrs.get("show_solved", False)]
+    for i in land.icons.values():
+      if not i.puzzle: continue
+      ps = self.puzzle_state[i.puzzle]
+      if (ps.state == PuzzleState.OPEN and
+          now - ps.open_time < CONSTANTS["new_puzzle_seconds"] and
+          ps.open_time != Global.STATE.event_start_time):
+        new_open = ps.open_time
+      else:
+        new_open = None
+      key.append((ps.state, frozenset(ps.answers_found), new_open))
+    return tuple(key)
+
+  def get_cached_map(self, land):
+    """Returns (json, None) if the map is cached, or (None, key) if it
+    needs to be built and passed to cache_map() with that key."""
+    gen = self.map_generation[land]
+    entry = self.cached_mapdata.get(land)
+    if entry and entry[0] == gen:
+      Team.MAP_CACHE_STATS["hits"] += 1
+      return entry[2], None
+
+    key = (land, self.map_fingerprint(land))
+    shared = Team.SHARED_MAPDATA.get(key)
+    if shared:
+      Team.MAP_CACHE_STATS["shared"] += 1
+      self.cached_mapdata[land] = (gen, key) + shared
+      return shared[0], None
+
+    Team.MAP_CACHE_STATS["misses"] += 1
+    return None, key
+
+  def cache_map(self, key, mapdata):
+    shared = Team.SHARED_MAPDATA
+    if len(shared) >= Team.SHARED_MAPDATA_LIMIT:
+      # Forget views that no team is looking at any more.
+      keep = set(e[1] for t in Team.all_teams() for e in t.cached_mapdata.values())
+      for k in list(shared.keys()):
+        if k not in keep: del shared[k]
+
+    etag = '"' + hashlib.md5(mapdata.encode("utf-8")).hexdigest()[:16] + '"'
+    shared[key] = (mapdata, etag)
+    land = key[0]
+    self.cached_mapdata[land] = (self.map_generation[land], key, mapdata, etag)
+    return mapdata
+
+  def get_map_etag(self, land):
+    """ETag of the JSON last returned for this land's map."""
+    return self.cached_mapdata[land][3]
+
+  @classmethod
+  def get_map_cache_stats(cls):
+    st = cls.MAP_CACHE_STATS
+    return {"map_cache_hits": st["hits"],
+            "map_cache_shared": st["shared"],
+            "map_cache_misses": st["misses"],
+            "map_cache_views": len(cls.SHARED_MAPDATA),
+            "map_cache_kb": sum(len(e[0]) for e in cls.SHARED_MAPDATA.values()) / 1024}
+
   def get_mainmap_data(self, forced_lands=()):
     mainmap = Land.BY_SHORTNAME["mainmap"]
 
-    if mainmap in self.cached_mapdata:
-      #print(f" mapdata cache hit: {self.username} mainmap")
-      return self.cached_mapdata[mainmap]
-    #print(f"mapdata cache miss: {self.username} mainmap")
+    if not forced_lands:
+      mapdata, key = self.get_cached_map(mainmap)
+      if mapdata: return mapdata
 
     items = []
 
@@ -969,15 +1419,13 @@ class Team(login.LoginUser):
     mapdata["items"] = [i[1] for i in items]
 
     mapdata = json.dumps(mapdata)
-    self.cached_mapdata[mainmap] = mapdata
-    return mapdata
+    if forced_lands: return mapdata
+    return self.cache_map(key, mapdata)
 
 
   def get_land_data(self, land):
-    if land in self.cached_mapdata:
-      print(f" mapdata cache hit: {self.username} {land.shortname}")
-      return self.cached_mapdata[land]
-    print(f"mapdata cache miss: {self.username} {land.shortname}")
+    mapdata, key = self.get_cached_map(land)
+    if mapdata: return mapdata
 
     show_solved = self.attrs.get("show_solved", False)
 
@@ -1097,8 +1545,7 @@ class Team(login.LoginUser):
     mapdata["items"] = [i[1] for i in items]
 
     mapdata = json.dumps(mapdata)
-    self.cached_mapdata[land] = mapdata
-    return mapdata
+    return self.cache_map(key, mapdata)
 
   @classmethod
   def get_by_username(cls, username):
@@ -1137,6 +1584,7 @@ class Team(login.LoginUser):
       return
 
     self.last_hour.append((now, "submit"))
+    Scheduler.wake("trim", now + 3600)
     self.last_submit = now
     self.cached_admin_data = None
 
@@ -1168,7 +1616,9 @@ class Team(login.LoginUser):
         Global.STATE.log_submit(now, self.username, puzzle.shortname,
                                 sub.raw_answer, sub.answer, "canceled")
         sub.state = sub.CANCELLED
+        Submission.GLOBAL_SUBMIT_QUEUE.remove(sub)
         state.submissions.pop(i)
+        state.forget_guesses(i)
         state.requeue_pending(now)
         self.invalidate(puzzle)
         break
@@ -1181,7 +1631,7 @@ class Team(login.LoginUser):
     puzzle = Puzzle.get_by_shortname(shortname)
     if not puzzle: return
     user = login.AdminUser.get_by_username(username)
-    ps = self.puzzle_state[puzzle]
+    ps = self.materialize_puzzle_state(puzzle)
     ps.reset_and_requeue(now, user)
 
 
@@ -1211,27 +1661,26 @@ class Team(login.LoginUser):
             "usable_lands": usable}
 
   @classmethod
-  async def realtime_expire_fastpasses(cls):
+  def expire_fastpasses(cls, now):
+    """Scheduler task: expire PennyPasses and warn teams before they do."""
     gfq = cls.GLOBAL_FASTPASS_QUEUE
-    while True:
-      now = time.time()
-      while gfq and now >= gfq[0][0]:
-        _, _, team, action = heapq.heappop(gfq)
-        if action is None:
-          while team.fastpasses_available and now >= team.fastpasses_available[0]:
-            team.apply_fastpass(None)
-        else:
-          text, expire = action
-          if (expire in team.fastpasses_available and
-              team.get_fastpass_eligible_lands()):
-            team.send_messages([{"method": "warn_fastpass", "text": text}])
-            await team.flush_messages()
-      await asyncio.sleep(1.0)
+    while gfq and now >= gfq[0][0]:
+      _, _, team, action = heapq.heappop(gfq)
+      if action is None:
+        while team.fastpasses_available and now >= team.fastpasses_available[0]:
+          team.apply_fastpass(None)
+      else:
+        text, expire = action
+        if (expire in team.fastpasses_available and
+            team.get_fastpass_eligible_lands()):
+          team.send_messages([{"method": "warn_fastpass", "text": text}])
+          asyncio.create_task(team.flush_messages())
+    return gfq[0][0] if gfq else None
 
   @save_state
   def bestow_fastpass(self, now, expire, sender):
     sender = login.AdminUser.get_by_username(sender)
-    self.admin_log.add(now, f"Bestowed a PennyPass by <b>{sender.fullname}</b>.")
+    self.admin_log.add(now, ("bestowed", sender))
     self.receive_fastpass(now, expire)
 
   def receive_fastpass(self, now, expire, silent=False):
@@ -1244,9 +1693,10 @@ class Team(login.LoginUser):
     if expire > 300:
       heapq.heappush(self.GLOBAL_FASTPASS_QUEUE,
                      (now+expire-300, self.username, self, ("5 minutes", now+expire)))
-    text = "Received a PennyPass."
-    if not silent: self.activity_log.add(now, text)
-    self.admin_log.add(now, text)
+    Scheduler.wake("fastpass", self.GLOBAL_FASTPASS_QUEUE[0][0])
+    ev = ("pennypass",)
+    if not silent: self.activity_log.add(now, ev)
+    self.admin_log.add(now, ev)
     if not silent and not save_state.REPLAYING:
       self.send_messages([{"method": "receive_fastpass", "fastpass": self.get_fastpass_data()}])
       asyncio.create_task(self.flush_messages())
@@ -1263,16 +1713,17 @@ class Team(login.LoginUser):
     if not self.fastpasses_available: return
     self.fastpasses_available.pop(0)
     if not land:
-      text = "A PennyPass expired."
-      self.activity_log.add(now, text)
-      self.admin_log.add(now, text)
+      ev = ("pennypass_expired",)
+      self.activity_log.add(now, ev)
+      self.admin_log.add(now, ev)
       msg = {"method": "apply_fastpass",
              "fastpass": self.get_fastpass_data()}
     else:
       self.fastpasses_used[land] = self.fastpasses_used.get(land, 0) + 1
-      text = f'Used a PennyPass on <b>{html.escape(land.title)}</b>.'
-      self.activity_log.add(now, text)
-      self.admin_log.add(now, text)
+      self.beam_dirty_lands.add(land)
+      ev = ("pennypass_used", land)
+      self.activity_log.add(now, ev)
+      self.admin_log.add(now, ev)
       opened = self.compute_puzzle_beam(now)
       msg = {"method": "apply_fastpass",
              "land": land.shortname,
@@ -1287,26 +1738,29 @@ class Team(login.LoginUser):
     return True
 
   def open_puzzle(self, puzzle, now, opened_list):
-    ps = self.puzzle_state[puzzle]
+    ps = self.materialize_puzzle_state(puzzle)
     if ps.state == PuzzleState.CLOSED:
       ps.state = PuzzleState.OPEN
       ps.open_time = now
       if opened_list is not None: opened_list.append(puzzle)
       self.open_puzzles.add(ps)
+      self.beam_new_open.append(ps)
+      self.beam_dirty_lands.add(puzzle.land)
       Global.STATE.log_submit(now, self.username, puzzle.shortname,
                               "", "", "open")
       puzzle.open_teams.add(self)
+      heapq.heappush(puzzle.hint_queue, (now, self.username))
+      Scheduler.wake("hints", now + puzzle.hints_available_time)
       puzzle.cached_admin_data = None
       self.cached_all_puzzles_data = None
       self.cached_errata_data = None
       self.cached_admin_data = None
       if puzzle.land.land_order < 1000:
-        self.dirty_lands.add(puzzle.land.shortname)
-        self.cached_mapdata.pop(puzzle.land, None)
+        self.invalidate_map(puzzle.land)
 
   def solve_puzzle(self, puzzle, now):
     extra_response = []
-    ps = self.puzzle_state[puzzle]
+    ps = self.materialize_puzzle_state(puzzle)
     msgs = []
     if ps.state != PuzzleState.SOLVED:
       ps.state = PuzzleState.SOLVED
@@ -1314,15 +1768,21 @@ class Team(login.LoginUser):
       for sub in ps.submissions:
         if sub.state == sub.PENDING:
           sub.state = sub.MOOT
+          Submission.GLOBAL_SUBMIT_QUEUE.remove(sub)
+      ps.forget_guesses(0)
       self.score += puzzle.points
       self.dirty_header = True
       self.last_score_change = now
       self.open_puzzles.remove(ps)
+      self.beam_dirty_lands.add(puzzle.land)
       Global.STATE.log_submit(now, self.username, puzzle.shortname,
                               "", "", "solved")
 
-      self.activity_log.add(now, f"{puzzle.html} solved.")
+      solve_duration = ps.solve_time - ps.open_time
+      solved = ("solved", ps, solve_duration)
+      self.activity_log.add(now, solved)
       self.last_hour.append((now, "solve"))
+      Scheduler.wake("trim", now + 3600)
       self.last_solve = now
 
       if ps.hint_request_outstanding():
@@ -1341,16 +1801,13 @@ class Team(login.LoginUser):
         msg.update(puzzle.solve_extra)
       self.send_messages([msg])
 
-      self.dirty_lands.add(puzzle.land.shortname)
-      self.cached_mapdata.pop(puzzle.land, None)
+      self.invalidate_map(puzzle.land)
       self.cached_all_puzzles_data = None
       self.cached_jukebox_data = None
       self.cached_open_hints_data = None
       self.cached_admin_data = None
       if puzzle.meta or puzzle is Workshop.PUZZLE:
-        current_map = Land.BY_SHORTNAME["mainmap"]
-        self.cached_mapdata.pop(current_map, None)
-        self.dirty_lands.add("mainmap")
+        self.invalidate_map(Land.BY_SHORTNAME["mainmap"])
       self.invalidate(puzzle)
 
       if self.score >= CONSTANTS["outer_lands_score"] and self.outer_lands_state == "closed":
@@ -1406,14 +1863,11 @@ class Team(login.LoginUser):
                               f"Machine interaction!", None,
                               self.complete_machine_interaction, "visit")
 
-      solve_duration = ps.solve_time - ps.open_time
-      puzzle.solve_durations[self] = solve_duration
-      puzzle.median_solve_duration = statistics.median(puzzle.solve_durations.values())
+      puzzle.add_solve_duration(self, solve_duration)
       puzzle.adjust_hints_available_time()
 
-      durtxt = util.format_duration(solve_duration)
-      puzzle.puzzle_log.add(now, f"Solved by {ps.admin_html_team} ({durtxt}).")
-      self.admin_log.add(now, f"{ps.admin_html_puzzle} solved ({durtxt}).")
+      puzzle.puzzle_log.add(now, solved)
+      self.admin_log.add(now, solved)
 
       self.compute_puzzle_beam(now)
       if extra_response: return "<br>".join(extra_response)
@@ -1426,10 +1880,7 @@ class Team(login.LoginUser):
     if new_videos > self.videos:
       self.videos = new_videos
       thumb = OPTIONS.static_content.get(f"thumb{self.videos}.png")
-      self.activity_log.add(
-        when,
-        "A new Park History video is available!<br>"
-        f"<a href=\"/about_the_park#history\"><img class=videothumb src=\"{thumb}\"></a>")
+      self.activity_log.add(when, ("video", self.videos))
       self.send_messages([{"method": "video", "thumb": thumb}])
 
   # Return any pennies that are newly-earned.
@@ -1450,8 +1901,9 @@ class Team(login.LoginUser):
     p = Workshop.ALL_PENNIES[p]
     self.pennies_earned.remove(p)
     self.pennies_collected.append(p)
-    self.activity_log.add(when, f"Collected the <b>{p.name}</b> penny.")
-    self.admin_log.add(when, f"Collected the <b>{p.name}</b> penny.")
+    ev = ("penny", p)
+    self.activity_log.add(when, ev)
+    self.admin_log.add(when, ev)
     self.send_messages([{"method": "pennies"}])
     self.invalidate()
     if not save_state.REPLAYING:
@@ -1459,23 +1911,23 @@ class Team(login.LoginUser):
 
   def complete_loony_visit(self, task, when):
     if self.remote_only:
-      self.admin_log.add(when, f"Skipped Loonie Toonie visit for remote-only team.")
+      self.admin_log.add(when, ("loony_skipped",))
     else:
-      self.admin_log.add(when, f"Completed the Loonie Toonie visit.")
+      self.admin_log.add(when, ("loony_visit",))
     self.open_puzzle(Workshop.PUZZLE, when, None)
     self.cached_all_puzzles_data = None
-    self.dirty_lands.add("mainmap")
-    self.cached_mapdata.pop(Land.BY_SHORTNAME["mainmap"], None)
+    self.invalidate_map(Land.BY_SHORTNAME["mainmap"])
     self.invalidate(Workshop.PUZZLE)
     if not save_state.REPLAYING:
       asyncio.create_task(self.flush_messages())
 
   def complete_penny_visit(self, task, when):
     if self.remote_only:
-      self.admin_log.add(when, f"Skipped Penny visit for remote-only team.")
+      self.admin_log.add(when, ("penny_visit_skipped",))
     else:
-      self.admin_log.add(when, f"Completed the Penny visit.")
+      self.admin_log.add(when, ("penny_visit",))
     self.outer_lands_state = "open"
+    self.reset_beam()
     self.compute_puzzle_beam(when)
     self.invalidate()
     if not save_state.REPLAYING:
@@ -1486,8 +1938,7 @@ class Team(login.LoginUser):
     self.open_puzzle(Runaround.PUZZLE, when, None)
     self.invalidate(Runaround.PUZZLE)
     self.cached_all_puzzles_data = None
-    self.dirty_lands.add("mainmap")
-    self.cached_mapdata.pop(Land.BY_SHORTNAME["mainmap"], None)
+    self.invalidate_map(Land.BY_SHORTNAME["mainmap"])
     if not save_state.REPLAYING:
       asyncio.create_task(self.flush_messages())
 
@@ -1685,7 +2136,7 @@ class Team(login.LoginUser):
     return self.cached_open_hints_data
 
   def open_hints(self, now, puzzle):
-    ps = self.puzzle_state[puzzle]
+    ps = self.materialize_puzzle_state(puzzle)
     if ps.hints_available: return
     if ps.state == PuzzleState.SOLVED: return
     ps.hints_available = True
@@ -1693,22 +2144,23 @@ class Team(login.LoginUser):
     self.cached_open_hints_data = None
     self.cached_bb_data = None
     self.invalidate(puzzle, flush=False)
-    puzzle.puzzle_log.add(now, f"Hints available to {ps.admin_html_team}.")
-    self.activity_log.add(now, f"Hints available for {puzzle.html}.")
-    self.admin_log.add(now, f"Hints available for {ps.admin_html_puzzle}.")
+    ev = ("hints_open", ps)
+    puzzle.puzzle_log.add(now, ev)
+    self.activity_log.add(now, ev)
+    self.admin_log.add(now, ev)
     self.send_messages([{"method": "hints_open", "puzzle_id": puzzle.shortname, "title": puzzle.title}])
 
   @save_state
   def hint_no_reply(self, now, puzzle, sender):
     puzzle = Puzzle.get_by_shortname(puzzle)
     if not puzzle: return
-    ps = self.puzzle_state[puzzle]
+    ps = self.materialize_puzzle_state(puzzle)
 
     sender = login.AdminUser.get_by_username(sender)
     ps.claim = None
     Global.STATE.task_queue.remove(ps)
 
-    self.admin_log.add(now, f"<b>{sender.fullname}</b> marked hint request on {ps.admin_html_puzzle} as not needing reply.")
+    self.admin_log.add(now, ("hint_no_reply", ps, sender))
 
     msg = HintMessage(ps, now, sender, None, special="ack")
     ps.hints.append(msg)
@@ -1728,7 +2180,7 @@ class Team(login.LoginUser):
   def add_hint_text(self, now, puzzle, sender, text):
     puzzle = Puzzle.get_by_shortname(puzzle)
     if not puzzle: return
-    ps = self.puzzle_state[puzzle]
+    ps = self.materialize_puzzle_state(puzzle)
 
     team_message = {"method": "hint_history",
                     "puzzle_id": puzzle.shortname}
@@ -1737,21 +2189,24 @@ class Team(login.LoginUser):
     if sender is None:
       if text is None:
         self.current_hint_puzzlestate = None
-        puzzle.puzzle_log.add(now, f"{ps.admin_html_team} canceled their hint request.")
-        self.activity_log.add(now, f"Canceled the hint request on {puzzle.html}.")
-        self.admin_log.add(now, f"Canceled the hint request on {ps.admin_html_puzzle}.")
+        ev = ("hint_cancel", ps)
+        puzzle.puzzle_log.add(now, ev)
+        self.activity_log.add(now, ev)
+        self.admin_log.add(now, ev)
         ps.hints.append(HintMessage(ps, now, sender, None, special="cancel"))
         Global.STATE.task_queue.remove(ps)
       else:
         self.current_hint_puzzlestate = ps
         if ps.hints:
-          puzzle.puzzle_log.add(now, f"{ps.admin_html_team} requested a followup hint.")
-          self.activity_log.add(now, f"Requested a followup hint on {puzzle.html}.")
-          self.admin_log.add(now, f"Requested a followup hint on {ps.admin_html_puzzle}.")
+          ev = ("hint_followup", ps)
+          puzzle.puzzle_log.add(now, ev)
+          self.activity_log.add(now, ev)
+          self.admin_log.add(now, ev)
         else:
-          puzzle.puzzle_log.add(now, f"{ps.admin_html_team} requested a hint.")
-          self.activity_log.add(now, f"Requested a hint on {puzzle.html}.")
-          self.admin_log.add(now, f"Requested a hint on {ps.admin_html_puzzle}.")
+          ev = ("hint_request", ps)
+          puzzle.puzzle_log.add(now, ev)
+          self.activity_log.add(now, ev)
+          self.admin_log.add(now, ev)
         ps.hints.append(HintMessage(ps, now, sender, text))
         Global.STATE.task_queue.add(ps)
     else:
@@ -1766,9 +2221,10 @@ class Team(login.LoginUser):
       team_message["notify"] = True
       team_message["title"] = puzzle.title
 
-      puzzle.puzzle_log.add(now, f"<b>{sender.fullname}</b> replied to hint request from {ps.admin_html_team}.")
-      self.activity_log.add(now, f"Guest Services replied to hint request on {puzzle.html}.")
-      self.admin_log.add(now, f"<b>{sender.fullname}</b> replied to hint request on {ps.admin_html_puzzle}.")
+      ev = ("hint_reply", ps, sender)
+      puzzle.puzzle_log.add(now, ev)
+      self.activity_log.add(now, ev)
+      self.admin_log.add(now, ev)
 
     if prev != self.current_hint_puzzlestate:
       self.cached_open_hints_data = None
@@ -1783,6 +2239,7 @@ class Team(login.LoginUser):
   def open_all_lands(self, now):
     if not self.force_all_lands_open:
       self.force_all_lands_open = True
+      self.reset_beam()
       self.compute_puzzle_beam(now)
       self.invalidate()
 
@@ -1790,67 +2247,61 @@ class Team(login.LoginUser):
   def open_all_puzzles(self, now):
     if not self.puzzles_thrown_open:
       self.puzzles_thrown_open = True
+      self.reset_beam()
       self.compute_puzzle_beam(now)
       self.invalidate()
 
   # BEAM!
   def compute_puzzle_beam(self, now):
-    opened = []
-    locked = []
-
-    min_score_to_go = None
+    if self.CHECK_BEAM:
+      return self.check_puzzle_beam(now)
+    return self.update_puzzle_beam(now)
+
+  def update_puzzle_beam(self, now, full=False):
+    """Open whatever puzzles and lands the team is now entitled to.
+    Normally only the lands marked in beam_dirty_lands (plus any whose
+    score or time gate has been crossed since the last call) are
+    looked at; full=True, or after reset_beam(), walks everything."""
+    if self.beam_next_threshold is None:
+      full = True
 
+    opened = []
     regular_puzzles_open = self.force_all_puzzles_open or self.puzzles_thrown_open
-
     since_start = now - Global.STATE.event_start_time
+
+    dirty = self.beam_dirty_lands
+    self.beam_dirty_lands = set()
+    scores = Land.threshold_scores
+    times = Land.threshold_times
+    if full:
+      self.beam_next_threshold = bisect.bisect_right(scores, self.score)
+      self.beam_next_time = bisect.bisect_right(times, since_start)
+    else:
+      i = self.beam_next_threshold
+      while i < len(scores) and scores[i] <= self.score:
+        dirty.add(Land.threshold_lands[i])
+        i += 1
+      self.beam_next_threshold = i
+      i = self.beam_next_time
+      while i < len(times) and times[i] <= since_start:
+        dirty.add(Land.threshold_time_lands[i])
+        i += 1
+      self.beam_next_time = i
+
+    locked_changed = full
     for land in Land.ordered_lands:
       if not land.puzzles: continue
-
-      open_count = self.fastpasses_used.get(land, 0)
-
-      if regular_puzzles_open:
-        open_count = 1000
-      else:
-        if (self.force_all_lands_open or
-            (since_start >= land.open_at_time or
-             (self.score >= land.open_at_score and
-              (land.open_at_score < CONSTANTS["outer_lands_score"] or
-               self.outer_lands_state == "open")))):
-          open_count += land.initial_puzzles
-
-      if open_count == 0:
-        to_go = land.open_at_score - self.score
-        if min_score_to_go is None or min_score_to_go > to_go:
-          min_score_to_go = to_go
-        continue
-
-      stop_after = 1000
-      skip12 = False
-      if not regular_puzzles_open and land.shortname == "cascade":
-        skip12 = True
-        if self.puzzle_state[land.first_submeta].state == PuzzleState.SOLVED:
-          self.open_puzzle(land.second_submeta, now, opened)
-          if self.puzzle_state[land.second_submeta].state == PuzzleState.SOLVED:
-            self.open_puzzle(land.meta_puzzle, now, opened)
-          else:
-            stop_after = 13
-        else:
-          stop_after = 9
-
-      for i, p in enumerate(land.puzzles):
-        if i >= stop_after: break
-        if skip12 and 1 <= i <= 2: continue
-        if self.puzzle_state[p].state == PuzzleState.CLOSED:
-          if open_count > 0 or p.meta or p.submeta:
-            self.open_puzzle(p, now, opened)
-          else:
-            break
-        if self.puzzle_state[p].state == PuzzleState.OPEN:
-          if not p.meta and not p.submeta:
-            open_count -= 1
+      if full or land in dirty:
+        was_locked = self.beam_land_counts.get(land) == 0
+        self.beam_land(land, now, opened, regular_puzzles_open, since_start)
+        if was_locked != (self.beam_land_counts[land] == 0):
+          locked_changed = True
+        # Opening puzzles in this land doesn't make it need another look.
+        self.beam_dirty_lands.discard(land)
 
     safari = Land.BY_SHORTNAME.get("safari", None)
-    if safari and (safari in self.open_lands or regular_puzzles_open):
+    if (safari and (full or safari in dirty) and
+        (safari in self.open_lands or regular_puzzles_open)):
       answers = set()
       keepers_solved = 0
       for p in safari.puzzles:
@@ -1865,6 +2316,7 @@ class Team(login.LoginUser):
           else:
             count = sum(1 for a in kp.keeper_answers if a in answers)
             if kps.keeper_answers == 0 and count >= kp.keeper_needed:
+              kps = self.materialize_puzzle_state(kp)
               kps.keeper_answers = min(len(answers)+2, safari.total_keeper_answers)
             if 0 < kps.keeper_answers <= len(answers):
               self.open_puzzle(kp, now, opened)
@@ -1884,25 +2336,31 @@ class Team(login.LoginUser):
       else:
         self.open_runaround(None, now)
 
+    if full:
+      new_open = [st for st in self.puzzle_state.values() if st.state != PuzzleState.CLOSED]
+    else:
+      new_open = self.beam_new_open
+    self.beam_new_open = []
+
     lands_opened = set()
-    for st in self.puzzle_state.values():
-      if st.state != PuzzleState.CLOSED:
-        if st.puzzle.land.land_order >= 1000: continue
-        if st.puzzle.land not in self.open_lands:
-          self.open_lands[st.puzzle.land] = now
-          if not self.no_submit:
-            st.puzzle.land.open_teams.add(self)
-          self.sorted_open_lands = [land for land in self.open_lands.keys() if land.land_order]
-          self.sorted_open_lands.sort(key=lambda land: land.land_order)
-          self.dirty_lands.add("mainmap")
-          self.cached_mapdata.pop(Land.BY_SHORTNAME["mainmap"], None)
-          self.dirty_header = True
-          lands_opened.add(st.puzzle.land)
-          if now != Global.STATE.event_start_time:
-            title = html.escape(st.puzzle.land.title)
-            self.send_messages([{"method": "open_land",
-                                 "title": title,
-                                 "land": st.puzzle.land.shortname}])
+    for st in new_open:
+      if st.puzzle.land.land_order >= 1000: continue
+      if st.puzzle.land not in self.open_lands:
+        self.open_lands[st.puzzle.land] = now
+        # The safari keepers are only considered once the land is open.
+        self.beam_dirty_lands.add(st.puzzle.land)
+        if not self.no_submit:
+          st.puzzle.land.open_teams.add(self)
+        self.sorted_open_lands = [land for land in self.open_lands.keys() if land.land_order]
+        self.sorted_open_lands.sort(key=lambda land: land.land_order)
+        self.invalidate_map(Land.BY_SHORTNAME["mainmap"])
+        self.dirty_header = True
+        lands_opened.add(st.puzzle.land)
+        if now != Global.STATE.event_start_time:
+          title = html.escape(st.puzzle.land.title)
+          self.send_messages([{"method": "open_land",
+                               "title": title,
+                               "land": st.puzzle.land.shortname}])
 
     if lands_opened:
       self.send_messages([{"method": "update_fastpass",
@@ -1913,22 +2371,98 @@ class Team(login.LoginUser):
 
       if puzzle.land in lands_opened:
         lands_opened.discard(puzzle.land)
-        title = html.escape(puzzle.land.title)
-        self.activity_log.add(now, f"<b>{title}</b> is now open!")
+        self.activity_log.add(now, ("land_open", puzzle.land))
 
-      puzzle.puzzle_log.add(now, f"Opened by {ps.admin_html_team}.")
-      self.activity_log.add(now, f"{puzzle.html} opened.")
-      self.admin_log.add(now, f"{ps.admin_html_puzzle} opened.")
+      ev = ("opened", ps)
+      puzzle.puzzle_log.add(now, ev)
+      self.activity_log.add(now, ev)
+      self.admin_log.add(now, ev)
 
 
     current_map = Land.BY_SHORTNAME["mainmap"]
     if current_map not in self.open_lands:
       self.open_lands[current_map] = now
 
-    self.score_to_go = min_score_to_go
+    if locked_changed:
+      self.beam_locked_score = None
+      for i, land in enumerate(Land.threshold_lands):
+        if self.beam_land_counts.get(land) == 0:
+          self.beam_locked_score = scores[i]
+          break
+    if self.beam_locked_score is None:
+      self.score_to_go = None
+    else:
+      self.score_to_go = self.beam_locked_score - self.score
 
     return opened
 
+  def beam_land(self, land, now, opened, regular_puzzles_open, since_start):
+    open_count = self.fastpasses_used.get(land, 0)
+
+    if regular_puzzles_open:
+      open_count = 1000
+    else:
+      if (self.force_all_lands_open or
+          (since_start >= land.open_at_time or
+           (self.score >= land.open_at_score and
+            (land.open_at_score < CONSTANTS["outer_lands_score"] or
+             self.outer_lands_state == "open")))):
+        open_count += land.initial_puzzles
+
+    self.beam_land_counts[land] = open_count
+    if open_count == 0: return
+
+    stop_after = 1000
+    skip12 = False
+    if not regular_puzzles_open and land.shortname == "cascade":
+      skip12 = True
+      if self.puzzle_state[land.first_submeta].state == PuzzleState.SOLVED:
+        self.open_puzzle(land.second_submeta, now, opened)
+        if self.puzzle_state[land.second_submeta].state == PuzzleState.SOLVED:
+          self.open_puzzle(land.meta_puzzle, now, opened)
+        else:
+          stop_after = 13
+      else:
+        stop_after = 9
+
+    for i, p in enumerate(land.puzzles):
+      if i >= stop_after: break
+      if skip12 and 1 <= i <= 2: continue
+      if self.puzzle_state[p].state == PuzzleState.CLOSED:
+        if open_count > 0 or p.meta or p.submeta:
+          self.open_puzzle(p, now, opened)
+        else:
+          break
+      if self.puzzle_state[p].state == PuzzleState.OPEN:
+        if not p.meta and not p.submeta:
+          open_count -= 1
+
+  def reset_beam(self):
+    """Make the next compute_puzzle_beam look at everything."""
+    self.beam_next_threshold = None
+
+  def beam_behind(self, since_start):
+    """Whether a land has opened by time that this team's beam hasn't
+    caught up with yet."""
+    i = self.beam_next_time
+    return i is None or (i < len(Land.threshold_times) and
+                         Land.threshold_times[i] <= since_start)
+
+  def check_puzzle_beam(self, now):
+    """Debug mode: do the incremental computation, then a full one,
+    and complain if the full one found anything the incremental one
+    missed."""
+    opened = self.update_puzzle_beam(now)
+    before = (set(self.open_lands), self.score_to_go)
+    missed = self.update_puzzle_beam(now, full=True)
+    after = (set(self.open_lands), self.score_to_go)
+    if missed or before != after:
+      print(f"BEAM MISMATCH for {self.username} at {now}: "
+            f"missed {[p.shortname for p in missed]} "
+            f"lands {[land.shortname for land in after[0] - before[0]]} "
+            f"score_to_go {before[1]} vs {after[1]}")
+    return opened + missed
+
 class Subicon:
   def __init__(self, d):
     if d:
@@ -2057,6 +2591,27 @@ class Land:
   def __repr__(self):
     return f"<Land \"{self.title}\">"
 
+  @classmethod
+  def index_thresholds(cls):
+    """Index the lands with puzzles by the score and the time that
+    unlock them, so a team only has to look at the lands whose gates
+    it has just passed, and queue up the lands still waiting to open
+    by time."""
+    lands = [land for land in cls.ordered_lands if land.puzzles]
+    lands.sort(key=lambda land: land.open_at_score)
+    cls.threshold_scores = [land.open_at_score for land in lands]
+    cls.threshold_lands = lands
+
+    lands = [land for land in cls.ordered_lands if land.puzzles]
+    lands.sort(key=lambda land: land.open_at_time)
+    cls.threshold_times = [land.open_at_time for land in lands]
+    cls.threshold_time_lands = lands
+
+    cls.time_unlock_queue = [(land.open_at_time, land.shortname)
+                             for land in cls.BY_SHORTNAME.values()
+                             if land.open_at_time and not land.time_unlocked]
+    heapq.heapify(cls.time_unlock_queue)
+
   @classmethod
   def resolve_lands(cls):
     by_land_order = []
@@ -2069,6 +2624,7 @@ class Land:
 
     by_land_order.sort()
     cls.ordered_lands = [i[1] for i in by_land_order]
+    cls.index_thresholds()
 
     for i, land in enumerate(cls.ordered_lands):
       for j, p in enumerate(land.all_puzzles):
@@ -2114,7 +2670,7 @@ class Puzzle:
     self.hints_available_time_auto = True
     self.emojify = False
     self.explanations = {}
-    self.puzzle_log = Log()
+    self.puzzle_log = Log("puzzle")
     self.zip_version = None
     self.allow_duplicates = False
     self.wait_for_requested = False
@@ -2124,9 +2680,15 @@ class Puzzle:
 
     self.median_solve_duration = None
     self.solve_durations = {}     # {team: duration}
+    self.sorted_solve_durations = []
     self.incorrect_answers = {}   # {answer: {teams}}
-    self.incorrect_counts = []    # [(count, answer)]
+    self.incorrect_ranking = []   # [(-count, answer)], sorted
+    self.incorrect_total = 0      # sum of all counts
     self.open_teams = set()
+    # Heap of (open_time, username) for teams that have opened the
+    # puzzle and may still be waiting for hints.  Every team waits the
+    # same hints_available_time, so changing it doesn't reorder this.
+    self.hint_queue = []
     self.submitted_teams = set()
     self.errata = []
     self.hint_replies = []
@@ -2152,7 +2714,7 @@ class Puzzle:
            "unsolved_count": len(self.open_teams) - len(self.solve_durations),
            "errata": True if self.errata else False,
            "median_solve": self.median_solve_duration,
-           "incorrect_count": sum(i[0] for i in self.incorrect_counts),
+           "incorrect_count": self.incorrect_total,
            }
 
     self.cached_admin_data = out
@@ -2412,21 +2974,53 @@ class Puzzle:
   def set_hints_available_time(self, now, new_time, admin_user):
     self.hints_available_time_auto = False
     self.hints_available_time = new_time
+    Scheduler.wake("hints")
     admin_user = login.AdminUser.get_by_username(admin_user)
-    self.puzzle_log.add(now, f"Hint time set to {util.format_duration(new_time)} by {admin_user.fullname}.")
+    self.puzzle_log.add(now, ("hint_time", new_time, admin_user))
     if not save_state.REPLAYING:
       self.maybe_open_hints(now)
       self.invalidate()
 
+  def add_solve_duration(self, team, duration):
+    self.solve_durations[team] = duration
+    s = self.sorted_solve_durations
+    bisect.insort(s, duration)
+    n = len(s)
+    if n % 2:
+      self.median_solve_duration = s[n//2]
+    else:
+      self.median_solve_duration = (s[n//2-1] + s[n//2]) / 2
+
+  def solve_duration_percentile(self, p):
+    """Nearest-rank percentile of the solve durations."""
+    s = self.sorted_solve_durations
+    if not s: return None
+    return s[max(math.ceil(p * len(s) / 100), 1) - 1]
+
+  def add_incorrect_answer(self, answer, team):
+    teams = self.incorrect_answers.setdefault(answer, set())
+    if team in teams: return
+    r = self.incorrect_ranking
+    if teams:
+      del r[bisect.bisect_left(r, (-len(teams), answer))]
+    teams.add(team)
+    bisect.insort(r, (-len(teams), answer))
+    self.incorrect_total += 1
+
+  def get_incorrect_counts(self, offset=0, limit=None):
+    """[(count, answer)] for the incorrect answers submitted by the
+    most teams, ordered by count and then answer."""
+    end = None if limit is None else offset + limit
+    return [(-c, a) for (c, a) in self.incorrect_ranking[offset:end]]
+
   def adjust_hints_available_time(self):
     if not self.hints_available_time_auto: return
     N = CONSTANTS["hint_available_solves"]
-    if len(self.solve_durations) < N: return
-    dur = list(self.solve_durations.values())
-    heapq.heapify(dur)
-    m = max(heapq.nsmallest(N, dur))
+    if len(self.sorted_solve_durations) < N: return
+    m = self.sorted_solve_durations[N-1]
     m = max(m, CONSTANTS["no_hints_before"] * CONSTANTS["time_scale"])
     self.hints_available_time = m
+    Scheduler.wake("hints")
     if not save_state.REPLAYING:
       self.invalidate()
 
@@ -2441,19 +3035,30 @@ class Puzzle:
     open_time = now - Global.STATE.event_start_time
     if open_time < CONSTANTS["global_no_hints_before"] * CONSTANTS["time_scale"]: return
 
-    open_for = []
-    for t in Team.all_teams():
-      ps = t.puzzle_state[self]
-      if (ps.state == PuzzleState.OPEN and
-          not ps.hints_available and
-          now - ps.open_time >= self.hints_available_time):
-        open_for.append(t)
+    open_for = self.due_hint_teams(now)
     if open_for:
       print(f"opening hints for {len(open_for)} team(s)")
-      ps.puzzle.open_hints_for([t.username for t in open_for])
+      self.open_hints_for([t.username for t in open_for])
       for t in open_for:
         asyncio.create_task(t.flush_messages())
 
+  def due_hint_teams(self, now):
+    """Take the teams that have waited long enough for hints off the
+    hint queue, and return the ones that still need them."""
+    q = self.hint_queue
+    out = []
+    while q and now - q[0][0] >= self.hints_available_time:
+      _, username = heapq.heappop(q)
+      t = Team.get_by_username(username)
+      ps = t.puzzle_state[self]
+      if ps.state == PuzzleState.OPEN and not ps.hints_available:
+        out.append(t)
+    return out
+
+  def next_hint_time(self):
+    if self.hint_queue:
+      return self.hint_queue[0][0] + self.hints_available_time
+
   def get_hint_reply_data(self, last=None):
     out = []
     for hm in reversed(self.hint_replies):
@@ -2492,30 +3097,27 @@ class Puzzle:
       return " ".join(text.split()).strip()
 
   @classmethod
-  async def realtime_open_hints(cls):
-    while True:
-      await asyncio.sleep(10.0)
-
-      now = time.time()
-
-      if not Global.STATE.event_start_time: continue
-      open_time = now - Global.STATE.event_start_time
-      if open_time < CONSTANTS["global_no_hints_before"] * CONSTANTS["time_scale"]: continue
-
-      needs_flush = set()
-      for p in Puzzle.all_puzzles():
-        open_for = []
-        for t in p.open_teams:
-          ps = t.puzzle_state[p]
-          if ps.state == PuzzleState.SOLVED: continue
-          if not ps.hints_available and now - ps.open_time >= ps.puzzle.hints_available_time:
-            open_for.append(t.username)
-            needs_flush.add(t)
-        if open_for:
-          p.open_hints_for(open_for)
-
-      for t in needs_flush:
-        asyncio.create_task(t.flush_messages())
+  def open_due_hints(cls, now):
+    """Scheduler task: make hints available to teams that have had a
+    puzzle open long enough."""
+    if not Global.STATE.event_start_time: return None
+    no_hints_before = (Global.STATE.event_start_time +
+                       CONSTANTS["global_no_hints_before"] * CONSTANTS["time_scale"])
+    if now < no_hints_before: return no_hints_before
+
+    due = None
+    needs_flush = set()
+    for p in Puzzle.all_puzzles():
+      open_for = p.due_hint_teams(now)
+      if open_for:
+        p.open_hints_for([t.username for t in open_for])
+        needs_flush.update(open_for)
+      when = p.next_hint_time()
+      if when is not None and (due is None or when < due): due = when
+
+    for t in needs_flush:
+      asyncio.create_task(t.flush_messages())
+    return due
 
 
 class Erratum:
@@ -2548,6 +3150,9 @@ class Global:
 
   SUBMIT_LOG_FILE = None
 
+  # Teams per event loop iteration in catch_up_beams().
+  BEAM_BATCH_SIZE = 25
+
   @classmethod
   def set_submit_log_filename(cls, fn):
     cls.SUBMIT_LOG_FILE = fn
@@ -2574,8 +3179,19 @@ class Global:
 
     self.submit_log = None
     self.submit_writer = None
-
-    if self.SUBMIT_LOG_FILE:
+    self.open_submit_log()
+
+  def open_submit_log(self, offset=None):
+    """Open the submit log CSV.  With an offset (when resuming from a
+    snapshot), keep the first offset bytes of the existing file and
+    append to it; otherwise start a new file."""
+    if not self.SUBMIT_LOG_FILE: return
+    if offset is not None and os.path.exists(self.SUBMIT_LOG_FILE):
+      self.submit_log = open(self.SUBMIT_LOG_FILE, "r+")
+      self.submit_log.truncate(offset)
+      self.submit_log.seek(0, 2)
+      self.submit_writer = csv.writer(self.submit_log)
+    else:
       self.submit_log = open(self.SUBMIT_LOG_FILE, "w")
       self.submit_writer = csv.writer(self.submit_log)
       self.submit_writer.writerow(["time", "unix_time", "team", "puzzle",
@@ -2597,15 +3213,41 @@ class Global:
       team.compute_puzzle_beam(now)
       team.invalidate()
 
+  @save_state
+  def compute_team_beams(self, now, usernames):
+    for username in usernames:
+      team = Team.get_by_username(username)
+      if not team: continue
+      team.compute_puzzle_beam(now)
+      team.invalidate(flush=False)
+    if not save_state.REPLAYING:
+      asyncio.create_task(login.AdminUser.flush_messages())
+
+  async def catch_up_beams(self):
+    """Recompute the beam of every team that's behind on a land
+    opening by time, a batch of teams per event loop iteration so the
+    other work the server's doing doesn't stall."""
+    if not self.event_start_time: return
+    since_start = time.time() - self.event_start_time
+    behind = [t.username for t in Team.all_teams() if t.beam_behind(since_start)]
+    for i in range(0, len(behind), self.BEAM_BATCH_SIZE):
+      batch = behind[i:i+self.BEAM_BATCH_SIZE]
+      self.compute_team_beams(batch)
+      for username in batch:
+        asyncio.create_task(Team.get_by_username(username).flush_messages())
+      await asyncio.sleep(0)
+
   @save_state
   def update_lands(self, now, scores, times, counts):
     for i, land in enumerate(Land.ordered_lands):
       land.open_at_score = scores[i]
       land.open_at_time = times[i]
       land.initial_puzzles = counts[i]
+    Land.index_thresholds()
 
     if self.event_start_time:
       for team in Team.all_teams():
+        team.reset_beam()
         team.compute_puzzle_beam(now)
         team.invalidate()
 
@@ -2619,10 +3261,11 @@ class Global:
     self.errata.insert(0, Erratum(now, puzzle, text, sender))
     self.cached_errata_data = None
 
-    puzzle.puzzle_log.add(now, f"An erratum was posted by <b>{sender.fullname}</b>.")
+    ev = ("erratum", puzzle, sender)
+    puzzle.puzzle_log.add(now, ev)
 
     for t in puzzle.open_teams:
-      t.activity_log.add(now, f"An erratum was posted for {puzzle.html}.")
+      t.activity_log.add(now, ev)
 
   @save_state
   def save_reload(self, now, shortname, sender):
@@ -2633,7 +3276,7 @@ class Global:
     self.reloads.append(Erratum(now, puzzle, "", sender))
     self.cached_errata_data = None
 
-    puzzle.puzzle_log.add(now, f"Puzzle was reloaded by <b>{sender.fullname}</b>.")
+    puzzle.puzzle_log.add(now, ("reload", sender))
 
   @save_state
   def close_hunt(self, now):
@@ -2689,6 +3332,8 @@ class Global:
     if self.event_start_time is not None: return
     self.event_start_time = now
     self.event_hash = hashlib.md5(str(now).encode("ascii")).hexdigest()[:8]
+    Scheduler.wake("submit")
+    Scheduler.wake("hints")
     print(f"starting event at {now} hash is {self.event_hash}")
     for team in Team.BY_USERNAME.values():
       #team.receive_fastpass(now, CONSTANTS["pennypass_expiration"] * CONSTANTS["time_scale"], silent=True)
@@ -1,6 +1,15 @@
+import asyncio
+import pickle
+import random
+import time
+import types
 import unittest
+from unittest import mock
+
+import tornado.web
 
 import game
+import util
 
 class PuzzleTest(unittest.TestCase):
   def test_canonical(self):
@@ -33,6 +42,299 @@ class PuzzleTest(unittest.TestCase):
     check("Multi-line\nresponse.", "Multi-line response.")
 
 
+class LogTest(unittest.TestCase):
+  def test_pages(self):
+    log = game.Log("admin")
+    self.assertEqual(log.get_page(), {"entries": [], "start": 0, "end": 0})
+    for when in (1, 2, 2, 3, 4, 5):
+      log.add(when, ("note", "GC", f"at {when}"))
+    self.assertEqual([e["when"] for e in log.get_data()], [5, 4, 3, 2, 1])
+    self.assertEqual(log.get_data()[3]["htmls"],
+                     ['<span class="adminnote"><b>GC</b> noted: at 2</span>'] * 2)
+
+    page = log.get_page(limit=2)
+    self.assertEqual([e["when"] for e in page["entries"]], [5, 4])
+    self.assertEqual((page["start"], page["end"]), (3, 5))
+    page = log.get_page(before=page["start"], limit=2)
+    self.assertEqual([e["when"] for e in page["entries"]], [3, 2])
+
+    # Catching up repeats the newest entry seen, which may have grown.
+    log.add(5, ("pennypass",))
+    log.add(6, ("pennypass_expired",))
+    page = log.get_page(since=4)
+    self.assertEqual([e["when"] for e in page["entries"]], [6, 5])
+    self.assertEqual(page["entries"][1]["htmls"][1], "Received a PennyPass.")
+    self.assertEqual(log.get_page(since=99)["entries"], [])
+
+  def test_page_arguments(self):
+    log = game.Log("admin")
+    for when in range(1, 6):
+      log.add(when, ("note", "GC", f"at {when}"))
+    def handler(**args):
+      return types.SimpleNamespace(get_argument=lambda name, default: args.get(name, default))
+
+    page = util.get_log_page(handler(log_before="3", log_limit="1"), log)
+    self.assertEqual([e["when"] for e in page["entries"]], [3])
+    self.assertEqual(util.get_int_argument(handler(), "incorrect_limit", 50), 50)
+    # A malformed argument is the client's mistake, not a 500.
+    with self.assertRaises(tornado.web.HTTPError):
+      util.get_log_page(handler(log_since="abc"), log)
+
+
+class PuzzleStateMapTest(unittest.TestCase):
+  def test_closed(self):
+    m = game.PuzzleStateMap()
+    ps = m["some_puzzle"]
+    self.assertIs(ps, game.CLOSED_PUZZLE_STATE)
+    self.assertEqual(ps.state, game.PuzzleState.CLOSED)
+    self.assertEqual(list(m.values()), [])
+    with self.assertRaises(AttributeError):
+      ps.hints_available = True
+    self.assertIs(pickle.loads(pickle.dumps(m))["other"], game.CLOSED_PUZZLE_STATE)
+    self.assertIs(pickle.loads(pickle.dumps(ps)), ps)
+
+  def test_closed_hint_history(self):
+    # Handlers must check for CLOSED before using the state's puzzle
+    # or team, which the closed state doesn't have.
+    import event
+    handler = types.SimpleNamespace(
+      team=types.SimpleNamespace(get_puzzle_state=lambda shortname: game.CLOSED_PUZZLE_STATE),
+      not_found=lambda: "not found",
+      return_json=lambda d: self.fail(f"returned {d}"))
+    self.assertEqual(event.HintHistoryHandler.get.__wrapped__(handler, "closed_puzzle"),
+                     "not found")
+
+
+class IndexedHeapTest(unittest.TestCase):
+  def test_random(self):
+    rng = random.Random(1)
+    h = game.IndexedHeap()
+    expected = {}
+    for _ in range(5000):
+      op = rng.random()
+      item = rng.randrange(100)
+      if op < 0.5:
+        key = rng.randrange(1000)
+        h.push(key, item)
+        expected[item] = key
+      elif op < 0.7:
+        self.assertEqual(h.remove(item), expected.pop(item, None) is not None)
+      elif expected:
+        want = min((k, i) for (i, k) in expected.items())
+        self.assertEqual(h.pop(), want)
+        del expected[want[1]]
+      self.assertEqual(len(h), len(expected))
+    self.assertEqual(sorted(h.heap), sorted((k, i) for (i, k) in expected.items()))
+
+
+class FakeLoop:
+  """Just enough of an event loop for Scheduler, on a clock that only
+  moves when the test advances it."""
+  def __init__(self):
+    self.now = 1000.0
+    self.timers = []
+
+  def time(self):
+    return self.now
+
+  def call_at(self, when, fn, *args):
+    h = types.SimpleNamespace(when=when, fn=fn, args=args, cancelled=False)
+    h.cancel = lambda: setattr(h, "cancelled", True)
+    self.timers.append(h)
+    return h
+
+  def pending(self):
+    return [h for h in self.timers if not h.cancelled]
+
+  def advance(self, dt):
+    end = self.now + dt
+    while True:
+      due = [h for h in self.pending() if h.when <= end]
+      if not due: break
+      h = min(due, key=lambda h: h.when)
+      self.timers.remove(h)
+      self.now = max(self.now, h.when)
+      h.fn(*h.args)
+    self.now = end
+
+
+class SchedulerTest(unittest.TestCase):
+  def setUp(self):
+    self.loop = FakeLoop()
+    patches = [mock.patch.object(game.time, "time", self.loop.time),
+               mock.patch.object(game.asyncio, "get_event_loop", lambda: self.loop)]
+    for p in patches:
+      p.start()
+      self.addCleanup(p.stop)
+
+  def tearDown(self):
+    game.Scheduler.tasks = {}
+
+  def test_wake(self):
+    runs = []
+    def task(now):
+      runs.append(now)
+      # Ask to run again right away; min_interval holds it off.
+      return now if len(runs) < 3 else None
+
+    game.Scheduler.register("t", task, min_interval=0.25)
+    self.loop.advance(0)
+    self.assertEqual(runs, [1000.0])
+    self.loop.advance(1)
+    self.assertEqual(runs, [1000.0, 1000.25, 1000.5])
+
+    # With nothing to do, it idles for MAX_IDLE.
+    [h] = self.loop.pending()
+    self.assertEqual(h.when, 1000.5 + game.Scheduler.MAX_IDLE)
+
+    # An earlier wake replaces the idle timer.
+    game.Scheduler.wake("t", 1001.5)
+    self.assertTrue(h.cancelled)
+    self.loop.advance(0.25)
+    self.assertEqual(len(runs), 3)
+    self.loop.advance(0.25)
+    self.assertEqual(runs[3:], [1001.5])
+
+    # A later one doesn't.
+    [h] = self.loop.pending()
+    game.Scheduler.wake("t", h.when + 5)
+    self.assertEqual(self.loop.pending(), [h])
+
+
+def scan_check_time(ps, land):
+  """The check time of ps's last submission, computed by rescanning
+  all the earlier ones."""
+  guesses = 0
+  last_ding = ps.open_time - land.guess_interval
+  last_reset = 0
+  for sub in ps.submissions[:-1]:
+    if sub.state == sub.RESET:
+      guesses = 0
+      last_ding = sub.sent_time - land.guess_interval
+      last_reset = sub.sent_time
+      continue
+    if not (sub.state in (sub.PENDING, sub.INCORRECT) and not sub.wrong_but_reasonable):
+      continue
+    guesses += int((sub.check_time - last_ding) / land.guess_interval)
+    if guesses > land.guess_max: guesses = land.guess_max
+    guesses -= 1
+    last_ding = sub.check_time
+
+  sub = ps.submissions[-1]
+  virtual_sent_time = max(sub.sent_time, last_reset)
+  gotten = int(max(virtual_sent_time - last_ding, 0) / land.guess_interval)
+  guesses += gotten
+  if guesses > land.guess_max: guesses = land.guess_max
+  if guesses > 0:
+    return virtual_sent_time
+  return last_ding + (gotten+1) * land.guess_interval
+
+
+class GuessRateTest(unittest.TestCase):
+  # Outcomes of checking a submission; None is an incorrect but
+  # reasonable guess.
+  RESULTS = (game.Submission.INCORRECT,) * 4 + (
+    game.Submission.PARTIAL, game.Submission.REQUESTED,
+    game.Submission.CORRECT, None)
+
+  SHORTNAME = "guess_rate_test"
+
+  class Stub:
+    """A stand-in object; unlike SimpleNamespace, usable as a key."""
+    def __init__(self, **kwargs):
+      self.__dict__.update(kwargs)
+
+  def setUp(self):
+    # Run the real submit, check, cancel and reset paths against a
+    # stand-in team and puzzle, with the rest of the game stubbed out.
+    self.saved = [(cls, name, vars(cls)[name]) for (cls, name) in
+                  ((game.Submission, "GLOBAL_SUBMIT_QUEUE"),
+                   (game.Submission, "compute_check_time"),
+                   (game.Scheduler, "wake"),
+                   (game.Global, "STATE"),
+                   (game.Puzzle, "BY_SHORTNAME"))]
+    game.Submission.GLOBAL_SUBMIT_QUEUE = game.IndexedHeap()
+    game.Scheduler.wake = lambda key, when=None: None
+    game.Global.STATE = types.SimpleNamespace(log_submit=lambda *args: None,
+                                              event_start_time=None)
+
+    # Check every computed check time against a scan of all the
+    # submissions.
+    compute = game.Submission.compute_check_time
+    self.computed = 0
+    def compute_check_time(sub):
+      expected = scan_check_time(sub.puzzle_state, sub.puzzle.land)
+      self.computed += 1
+      check_time = compute(sub)
+      self.assertEqual(check_time, expected)
+      return check_time
+    game.Submission.compute_check_time = compute_check_time
+
+  def tearDown(self):
+    for cls, name, value in self.saved:
+      setattr(cls, name, value)
+
+  def run_random(self, rng):
+    land = self.Stub(guess_interval=rng.choice((10, 30, 45.5)),
+                     guess_max=rng.randint(1, 5))
+    log = types.SimpleNamespace(add=lambda *args: None)
+    answers = [f"ANSWER{i}" for i in range(1000)]
+
+    def handle_answer(sub, now):
+      result = rng.choice(self.RESULTS)
+      sub.state = result or sub.INCORRECT
+      sub.wrong_but_reasonable = result is None
+      if sub.state == sub.CORRECT:
+        sub.answer = answers.pop()
+
+    puzzle = self.Stub(
+      shortname=self.SHORTNAME, land=land, max_queued=1000, allow_duplicates=True,
+      answers=set(answers), display_answers=dict((a, a) for a in answers),
+      handle_answer=handle_answer, submitted_teams=set(), puzzle_log=log,
+      add_incorrect_answer=lambda answer, team: None)
+    game.Puzzle.BY_SHORTNAME = {self.SHORTNAME: puzzle}
+
+    team = self.Stub(
+      username="team", next_submit_id=1, last_hour=[], activity_log=log, admin_log=log,
+      beam_dirty_lands=set(), puzzle_state={},
+      send_messages=lambda msgs: None, invalidate=lambda puzzle=None, flush=True: None,
+      invalidate_map=lambda land: None, compute_puzzle_beam=lambda now: None)
+    team.get_puzzle_state = team.puzzle_state.__getitem__
+
+    ps = game.PuzzleState(team, puzzle)
+    ps.state = ps.OPEN
+    ps.open_time = now = rng.uniform(0, 1000)
+    team.puzzle_state[puzzle] = ps
+
+    for _ in range(200):
+      now += rng.expovariate(1 / land.guess_interval)
+      game.Submission.process_submit_queue(now)
+
+      pending = [sub for sub in ps.submissions if sub.state == sub.PENDING]
+      op = rng.random()
+      if op < 0.5 or not pending:
+        game.Team.submit_answer.__wrapped__(team, now, team.next_submit_id,
+                                            self.SHORTNAME, "guess")
+      elif op < 0.8:
+        now = max(now, min(sub.check_time for sub in pending))
+        game.Submission.process_submit_queue(now)
+      elif op < 0.9:
+        game.Team.cancel_submission.__wrapped__(team, now, rng.choice(pending).submit_id,
+                                                self.SHORTNAME)
+      else:
+        ps.reset_and_requeue(now, None)
+
+      # Everything still pending is queued to be checked when due.
+      for sub in ps.submissions:
+        if sub.state == sub.PENDING:
+          self.assertIn(sub, game.Submission.GLOBAL_SUBMIT_QUEUE)
+
+  def test_matches_scan(self):
+    for seed in range(200):
+      self.run_random(random.Random(seed))
+    self.assertGreater(self.computed, 10000)
+
+
 if __name__ == "__main__":
   unittest.main()
 
@@ -8,6 +8,7 @@ import json
 import os
 import resource
 import signal
+import socket
 import sys
 import time
 
@@ -23,6 +24,8 @@ import debug
 import event
 import game
 import login
+import snapshot
+import state
 from state import save_state
 import wait_proxy
 import util
@@ -60,12 +63,10 @@ def dump_info(fn):
   with open(fn, "w") as f:
     json.dump(d, f, indent=True)
 
-async def main_server(options):
-  if options.debug:
-    tornado.log.enable_pretty_logging()
-
-  game.Global.set_submit_log_filename(
-    os.path.join(options.event_dir, "submit_log.csv"))
+def load_event(options):
+  """Load the map config, puzzles, and teams for the event in
+  options.event_dir, leaving everything ready for the state log to be
+  replayed.  Returns the parsed map config."""
 
   with open(os.path.join(os.getenv("HUNT2020_BASE"), "snellen/static/emoji.json")) as f:
     emoji = json.load(f)
@@ -132,11 +133,29 @@ async def main_server(options):
   for team in game.Team.all_teams():
     team.post_init()
 
+  return cfg
+
+async def main_server(options, proxy_socks=None):
+  if options.debug:
+    tornado.log.enable_pretty_logging()
+
+  game.Global.set_submit_log_filename(
+    os.path.join(options.event_dir, "submit_log.csv"))
+
+  cfg = load_event(options)
+
   if options.dump_info:
     dump_info(options.dump_info);
 
-  save_state.open(os.path.join(options.event_dir, "state.log"))
-  replay_count = save_state.replay(advance_time=game.Submission.process_submit_queue)
+  save_state.set_snapshot_handler(snapshot.GameSnapshot)
+  save_state.set_group_commit(
+    options.commit_window_ms / 1000 if options.commit_window_ms >= 0 else None,
+    options.fsync, options.fsync_interval)
+  log_format = state.LOG_FORMATS[options.log_format]
+  save_state.open(os.path.join(options.event_dir, log_format.FILENAME),
+                  options.log_format)
+  replay_count = save_state.replay(advance_time=game.Submission.process_submit_queue,
+                                   use_snapshot=not options.full_replay)
 
   if not login.AdminUser.BY_USERNAME:
     with open(os.path.join(options.event_dir, "admins.json")) as f:
@@ -144,7 +163,8 @@ async def main_server(options):
       for username, d in admins.items():
         login.AdminUser(username, d["pwhash"], d["name"], d.get("roles", ()))
 
-  wait_proxy.Server.init_proxies(options.wait_proxies)
+  wait_proxy.Server.init_proxies(options.wait_proxies, proxy_socks,
+                                 options.shard_wait_proxies)
 
   admin.PuzzleJsonHandler.build()
   admin.TeamJsonHandler.build()
@@ -179,11 +199,15 @@ async def main_server(options):
 
   loop = asyncio.get_event_loop()
   loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=4))
-  loop.create_task(game.Submission.realtime_process_submit_queue())
-  loop.create_task(game.Puzzle.realtime_open_hints())
-  loop.create_task(game.Team.realtime_expire_fastpasses())
-  loop.create_task(game.Team.realtime_trim_last_hour())
+  game.Scheduler.register("submit", game.Submission.run_submit_queue)
+  # Finish any land-by-time beam recompute the last run didn't.
+  loop.create_task(game.Global.STATE.catch_up_beams())
+  game.Scheduler.register("hints", game.Puzzle.open_due_hints)
+  game.Scheduler.register("fastpass", game.Team.expire_fastpasses)
+  game.Scheduler.register("trim", game.Team.trim_all_last_hour, min_interval=20.0)
   loop.create_task(wait_proxy.Server.push_session_cache())
+  if options.snapshot_interval:
+    loop.create_task(save_state.realtime_snapshot(options.snapshot_interval))
   loop.create_task(flush_stdout())
 
   print("Serving...")
@@ -198,9 +222,9 @@ async def flush_stdout():
     await asyncio.sleep(1.0)
 
 
-def wait_server(n, options):
+def wait_server(n, options, sock):
   try:
-    asyncio.run(wait_proxy.Client(n, options).start(), debug=options.debug)
+    asyncio.run(wait_proxy.Client(n, options, sock).start(), debug=options.debug)
   except KeyboardInterrupt:
     pass
 
@@ -232,6 +256,35 @@ def main():
                       help=("Seconds to count down before starting event."))
   parser.add_argument("--dump_info", default=None,
                       help=("Dump all puzzle info to this file"))
+  parser.add_argument("--check_beam", action="store_true",
+                      help=("Check each incremental puzzle beam computation "
+                            "against a full one."))
+
+  # state log configuration
+  parser.add_argument("--snapshot_interval",
+                      type=int, default=600,
+                      help=("Seconds between state snapshots (0 to disable)."))
+  parser.add_argument("--full_replay", action="store_true",
+                      help="Ignore any state snapshot and replay the whole log.")
+  parser.add_argument("--log_format", choices=("json", "binary"),
+                      default="json",
+                      help=("Format of the state log (state.log for json, "
+                            "state.binlog for binary; convert between them "
+                            "with tools/convert_state_log.py)."))
+  parser.add_argument("--commit_window_ms",
+                      type=float, default=-1,
+                      help=("Batch state log writes made within this many ms "
+                            "(0 for one batch per event loop iteration).  "
+                            "A batched change can be lost if the server dies "
+                            "before it's written, even though clients have seen "
+                            "it; the default (negative) writes each record "
+                            "immediately."))
+  parser.add_argument("--fsync", choices=("never", "batch", "interval"),
+                      default="never",
+                      help="When to fsync the state log.")
+  parser.add_argument("--fsync_interval",
+                      type=float, default=1.0,
+                      help="Seconds between fsyncs with --fsync=interval.")
 
   # wait proxy configuration
   parser.add_argument("-w", "--wait_proxies",
@@ -241,6 +294,16 @@ def main():
                       type=int, default=2020,
                       help=("Port for communicating between wait proxy "
                             "and main server"))
+  parser.add_argument("--proxy_transport", choices=("http", "socket"), default="http",
+                      help=("How the main server sends messages to the wait proxies: "
+                            "proxies long-poll it over HTTP, or it streams them "
+                            "over a socketpair."))
+  parser.add_argument("--shard_wait_proxies", action="store_true",
+                      help=("Send each team's messages only to the one wait proxy "
+                            "that owns the team; clients wait at /wait/p<n>/, which "
+                            "the front end must route to proxy n for every n below "
+                            "--wait_proxies.  sys/haproxy.cfg has routes p0-p4, "
+                            "for --wait_proxies 5; change both together."))
 
   options = parser.parse_args()
 
@@ -256,6 +319,7 @@ def main():
   game.OPTIONS = options
   event.OPTIONS = options
   admin.OPTIONS = options
+  game.Team.CHECK_BEAM = options.check_beam
 
   soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
   try:
@@ -264,19 +328,37 @@ def main():
   except ValueError:
     print("Warning: unable to increase file descriptor limit!")
 
+  pairs = [None] * options.wait_proxies
+  if options.proxy_transport == "socket":
+    pairs = [socket.socketpair() for _ in range(options.wait_proxies)]
+
   original_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
   proxy_pids = []
   for i in range(options.wait_proxies):
     pid = os.fork()
     if pid == 0:
-      wait_server(i, options)
+      sock = None
+      for j, pair in enumerate(pairs):
+        if not pair: continue
+        pair[0].close()
+        if j == i:
+          sock = pair[1]
+        else:
+          pair[1].close()
+      wait_server(i, options, sock)
       return
     proxy_pids.append(pid)
   signal.signal(signal.SIGINT, original_handler)
 
+  proxy_socks = None
+  if options.proxy_transport == "socket":
+    for pair in pairs:
+      pair[1].close()
+    proxy_socks = [pair[0] for pair in pairs]
+
   def go():
     try:
-      asyncio.run(main_server(options), debug=options.debug)
+      asyncio.run(main_server(options, proxy_socks), debug=options.debug)
     except KeyboardInterrupt:
       pass
 
@@ -10,6 +10,11 @@ import tornado.httpclient
 import tornado.httpserver
 import tornado.netutil
 
+def resolve_future(fut, result):
+  """Complete fut with result, unless it's already done."""
+  if not fut.done():
+    fut.set_result(result)
+
 class ProxyTeam:
   BY_TEAM = {}
 
@@ -27,7 +32,6 @@ class ProxyTeam:
 
   def __init__(self, team):
     self.team = team
-    self.cv = asyncio.Condition()
     self.waiters = set()
     self.serial = 1
     self.sticky_messages = None
@@ -38,16 +42,15 @@ class ProxyTeam:
   async def send_messages(self, msgs, sticky=None):
     if not msgs: return
     if not self.waiters: return
-    async with self.cv:
-      msgs = [(self.serial+i, json.dumps(m)) for (i, m) in enumerate(msgs)]
-      self.serial += len(msgs)
+    msgs = [(self.serial+i, json.dumps(m)) for (i, m) in enumerate(msgs)]
+    self.serial += len(msgs)
 
-      if sticky:
-        self.sticky_messages = msgs[-sticky:]
+    if sticky:
+      self.sticky_messages = msgs[-sticky:]
 
-      for w in self.waiters:
-        w.q.extend(msgs)
-      self.cv.notify_all()
+    for w in self.waiters:
+      w.q.extend(msgs)
+      w.wake()
 
   def add_waiter(self, waiter):
     self.waiters.add(waiter)
@@ -171,6 +174,10 @@ class Waiter:
     self.q = collections.deque()
     if initial_msgs: self.q.extend(initial_msgs)
 
+    # Futures of the waits in progress (a client may poll again while
+    # its previous request is still held), each resolved with q when
+    # there's something in it or when that wait times out.
+    self.futures = set()
     self.wait_in_progress = False
     self.last_return = time.time()
 
@@ -188,18 +195,24 @@ class Waiter:
     while q and q[0][0] <= received_serial:
       q.popleft()
 
-    allow_empty = False
-    while True:
-      if q or allow_empty:
-        self.wait_in_progress = False
-        self.last_return = time.time()
-        return q
-      allow_empty = True
-      async with self.team.cv:
-        try:
-          await asyncio.wait_for(self.team.cv.wait(), timeout)
-        except asyncio.TimeoutError:
-          pass
+    if not q:
+      loop = asyncio.get_running_loop()
+      fut = loop.create_future()
+      self.futures.add(fut)
+      handle = loop.call_later(timeout, resolve_future, fut, q)
+      try:
+        await fut
+      finally:
+        handle.cancel()
+        self.futures.discard(fut)
+
+    self.wait_in_progress = bool(self.futures)
+    self.last_return = time.time()
+    return q
+
+  def wake(self):
+    for fut in self.futures:
+      resolve_future(fut, self.q)
 
 
 class WaitHandler(tornado.web.RequestHandler):
@@ -0,0 +1,34 @@
+import asyncio
+import unittest
+
+import scrum
+
+class WaiterTest(unittest.TestCase):
+  def test_overlapping_waits(self):
+    async def go():
+      team = scrum.ProxyTeam("t")
+      w = scrum.Waiter(1, team)
+
+      # A client may poll again while its last request is still held;
+      # each wait times out on its own.
+      first = asyncio.ensure_future(w.wait(0, 0.02))
+      await asyncio.sleep(0.01)
+      second = asyncio.ensure_future(w.wait(0, 0.05))
+      self.assertEqual(list(await asyncio.wait_for(first, 1)), [])
+      self.assertFalse(second.done())
+      self.assertEqual(list(await asyncio.wait_for(second, 1)), [])
+      self.assertFalse(w.futures)
+      self.assertFalse(w.wait_in_progress)
+
+      # A message wakes all of them.
+      waits = [asyncio.ensure_future(w.wait(0, 10)) for _ in range(2)]
+      await asyncio.sleep(0)
+      await team.send_messages([{"method": "m"}])
+      for q in await asyncio.wait_for(asyncio.gather(*waits), 1):
+        self.assertEqual(list(q), [(1, '{"method": "m"}')])
+      self.assertFalse(w.futures)
+    asyncio.run(go())
+
+
+if __name__ == "__main__":
+  unittest.main()
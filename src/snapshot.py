@@ -0,0 +1,153 @@
+import asyncio
+
+import game
+import login
+from state import save_state, SnapshotMismatch
+
+
+def lookup(kind, name):
+  """The object from the event config that a snapshot refers to by
+  name (see GameSnapshot.reducers)."""
+  try:
+    if kind == "Team":
+      return game.Team.BY_USERNAME[name]
+    if kind == "Puzzle":
+      return game.Puzzle.BY_SHORTNAME[name]
+    if kind == "Land":
+      return game.Land.BY_SHORTNAME[name]
+    if kind == "MiscLand":
+      return game.MiscLand.get()
+    if kind == "Penny":
+      return game.Workshop.ALL_PENNIES[name]
+  except KeyError:
+    raise SnapshotMismatch(f"no {kind} {name} in the event")
+  raise ValueError(f"unknown snapshot reference {kind} {name}")
+
+
+class GameSnapshot:
+  """Captures and restores everything that replaying the state log
+  builds up, so a restart can load a snapshot and replay only the tail
+  of the log.
+
+  Objects that are created from the event config at startup (teams,
+  puzzles, lands, pennies) are pickled by name and resolved to the
+  freshly loaded objects on restore; only their mutable state is
+  saved."""
+
+  # Team attributes that come from teams.json or are rebuilt at
+  # startup rather than by replaying the log.  Anything named
+  # "cached_*" is also skipped.
+  TEAM_SKIP = {"username", "password_hash", "name", "name_sort", "size",
+               "remote_only", "no_submit", "force_all_puzzles_open",
+               "admin_url", "admin_html",
+               "active_sessions", "message_mu", "message_serial",
+               "pending_messages"}
+
+  PUZZLE_FIELDS = ("hints_available_time", "hints_available_time_auto",
+                   "median_solve_duration", "solve_durations", "sorted_solve_durations",
+                   "incorrect_answers", "incorrect_ranking", "incorrect_total",
+                   "open_teams", "hint_queue", "submitted_teams", "errata",
+                   "hint_replies", "puzzle_log")
+
+  LAND_FIELDS = ("open_at_score", "open_at_time", "initial_puzzles",
+                 "time_unlocked", "open_teams")
+
+  GLOBAL_SKIP = {"stopping", "stop_cv", "submit_log", "submit_writer"}
+
+  @staticmethod
+  def reducers():
+    """Reduction functions, by class, that pickle the objects from the
+    event config as references by name.  The pickler looks these up
+    by exact type, so it handles everything else without calling
+    back into Python."""
+    return {game.Team: lambda t: (lookup, ("Team", t.username)),
+            game.Puzzle: lambda p: (lookup, ("Puzzle", p.shortname)),
+            game.Land: lambda land: (lookup, ("Land", land.shortname)),
+            game.MiscLand: lambda land: (lookup, ("MiscLand", None)),
+            game.Workshop: lambda penny: (lookup, ("Penny", penny.shortname))}
+
+  @classmethod
+  def capture(cls):
+    teams = {}
+    for t in game.Team.all_teams():
+      teams[t.username] = dict((k, v) for (k, v) in t.__dict__.items()
+                               if k not in cls.TEAM_SKIP and not k.startswith("cached_"))
+
+    puzzles = {}
+    for p in game.Puzzle.all_puzzles():
+      puzzles[p.shortname] = dict((k, getattr(p, k)) for k in cls.PUZZLE_FIELDS)
+
+    lands = {}
+    for land in game.Land.BY_SHORTNAME.values():
+      lands[land.shortname] = dict((k, getattr(land, k)) for k in cls.LAND_FIELDS
+                                   if hasattr(land, k))
+
+    g = game.Global.STATE
+    if g:
+      g_state = dict((k, v) for (k, v) in g.__dict__.items()
+                     if k not in cls.GLOBAL_SKIP and not k.startswith("cached_"))
+      g_state["submit_log_offset"] = g.submit_log.tell() if g.submit_log else None
+    else:
+      g_state = None
+
+    admins = dict((k, v) for (k, v) in save_state.instance_index.items()
+                  if isinstance(v, login.AdminUser))
+
+    return {"team_names": sorted(teams.keys()),
+            "puzzle_names": sorted(puzzles.keys()),
+            "teams": teams,
+            "puzzles": puzzles,
+            "lands": lands,
+            "global": g_state,
+            "admins": admins,
+            "admins_by_username": login.AdminUser.BY_USERNAME,
+            "submit_queue": game.Submission.GLOBAL_SUBMIT_QUEUE,
+            "fastpass_queue": game.Team.GLOBAL_FASTPASS_QUEUE}
+
+  @classmethod
+  def restore(cls, data):
+    # The snapshot is only usable if the event has the same teams and
+    # puzzles it was taken with.
+    if (data["team_names"] != sorted(game.Team.BY_USERNAME.keys()) or
+        data["puzzle_names"] != sorted(game.Puzzle.BY_SHORTNAME.keys())):
+      return False
+
+    for username, d in data["teams"].items():
+      game.Team.BY_USERNAME[username].__dict__.update(d)
+
+    for shortname, d in data["puzzles"].items():
+      game.Puzzle.BY_SHORTNAME[shortname].__dict__.update(d)
+      game.Puzzle.BY_SHORTNAME[shortname].cached_admin_data = None
+
+    for shortname, d in data["lands"].items():
+      land = game.Land.BY_SHORTNAME.get(shortname)
+      if land: land.__dict__.update(d)
+    game.Land.index_thresholds()
+
+    save_state.instance_index.update(data["admins"])
+    login.AdminUser.BY_USERNAME.update(data["admins_by_username"])
+    if login.AdminUser.message_mu is None:
+      login.AdminUser.message_mu = asyncio.Lock()
+
+    game.Submission.GLOBAL_SUBMIT_QUEUE = data["submit_queue"]
+    game.Team.GLOBAL_FASTPASS_QUEUE[:] = data["fastpass_queue"]
+
+    d = data["global"]
+    if d:
+      g = game.Global.__new__(game.Global)
+      offset = d.pop("submit_log_offset")
+      g.__dict__.update(d)
+      g.cached_errata_data = None
+      g.stopping = False
+      g.stop_cv = asyncio.Condition()
+      g.submit_log = None
+      g.submit_writer = None
+      g.open_submit_log(offset)
+      g.task_queue.cached_json = None
+      g.task_queue.cached_bbdata = None
+      save_state.instance_index[g._saver_id] = g
+      game.Global.STATE = g
+      asyncio.create_task(g.future_start())
+      asyncio.create_task(g.future_send_preload())
+
+    return True
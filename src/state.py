@@ -1,7 +1,178 @@
+import asyncio
+import copyreg
 import functools
+import hashlib
+import io
 import json
+import marshal
+import mmap
+import os
+import pickle
+import struct
 import sys
 import time
+import zlib
+
+
+class JsonLogFormat:
+  """One JSON array per line.  Lines starting with '#' are comments."""
+
+  NAME = "json"
+  FILENAME = "state.log"
+  MODE = "a+"
+  EMPTY = ""
+
+  def start(self, f):
+    if detect_log_format(f.name) != self.NAME:
+      raise ValueError(f"{f.name} is a binary state log")
+
+  def encode(self, record):
+    return json.dumps(record) + "\n"
+
+  def comment(self, text):
+    return "# " + text + "\n"
+
+  def read(self, f, offset):
+    """Yield records starting at the given offset.  Comments are
+    yielded as strings."""
+    f.seek(offset, 0)
+    for line in f:
+      if line.startswith("#"):
+        yield line[1:].strip()
+      else:
+        yield json.loads(line)
+
+  def get_state(self):
+    return None
+
+  def set_state(self, state):
+    pass
+
+
+class BinaryLogFormat:
+  """Length-prefixed binary records.  Saver ids and method names are
+  interned: each string is written once, in a definition entry ahead
+  of its first use, and records refer to it by index.  Arguments are
+  marshalled, so the file is tied to the marshal version recorded in
+  its header; convert through JSON to move between versions."""
+
+  NAME = "binary"
+  FILENAME = "state.binlog"
+  MODE = "ab+"
+  EMPTY = b""
+
+  MAGIC_PREFIX = b"H2020LOG"
+  MAGIC = MAGIC_PREFIX + bytes([1, marshal.version])
+
+  # kind, length of the string that follows
+  STRING = struct.Struct("<cI")
+  # kind, saver id index, method name index, time, payload length
+  RECORD = struct.Struct("<cIIdI")
+
+  def __init__(self):
+    self.strings = []
+    self.string_index = {}
+
+  def start(self, f):
+    f.seek(0, 2)
+    if f.tell() == 0:
+      f.write(self.MAGIC)
+      f.flush()
+      return
+    with open(f.name, "rb") as g:
+      if g.read(len(self.MAGIC)) != self.MAGIC:
+        raise ValueError(f"{f.name} is not a binary state log for this Python version")
+
+  def intern(self, s, out):
+    i = self.string_index.get(s)
+    if i is None:
+      i = len(self.strings)
+      self.strings.append(s)
+      self.string_index[s] = i
+      b = s.encode("utf-8")
+      out.append(self.STRING.pack(b"S", len(b)))
+      out.append(b)
+    return i
+
+  def encode(self, record):
+    saver_id, name, now, args, kwargs = record
+    out = []
+    si = self.intern(saver_id, out)
+    ni = self.intern(name, out)
+    payload = marshal.dumps((args, kwargs)) if args or kwargs else b""
+    out.append(self.RECORD.pack(b"R", si, ni, now, len(payload)))
+    out.append(payload)
+    return b"".join(out)
+
+  def comment(self, text):
+    b = text.encode("utf-8")
+    return self.STRING.pack(b"#", len(b)) + b
+
+  def read(self, f, offset):
+    """Yield records starting at the given offset.  Comments are
+    yielded as strings."""
+    offset = max(offset, len(self.MAGIC))
+    if offset == len(self.MAGIC):
+      self.strings = []
+    f.flush()
+    if os.fstat(f.fileno()).st_size <= offset: return
+
+    strings = self.strings
+    string_size = self.STRING.size
+    record_size = self.RECORD.size
+    unpack_string = self.STRING.unpack_from
+    unpack_record = self.RECORD.unpack_from
+    loads = marshal.loads
+    empty = ((), {})
+
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      pos = offset
+      end = len(mm)
+      while pos < end:
+        kind = mm[pos]
+        if kind == 82:    # "R"
+          _, si, ni, now, n = unpack_record(mm, pos)
+          pos += record_size
+          if n:
+            args, kwargs = loads(mm[pos:pos+n])
+            pos += n
+          else:
+            args, kwargs = empty
+          yield strings[si], strings[ni], now, args, kwargs
+        else:
+          _, n = unpack_string(mm, pos)
+          pos += string_size
+          s = mm[pos:pos+n].decode("utf-8")
+          pos += n
+          if kind == 83:    # "S"
+            strings.append(s)
+          elif kind == 35:  # "#"
+            yield s
+          else:
+            raise ValueError(f"bad entry in state log at offset {pos}")
+    self.string_index = dict((s, i) for (i, s) in enumerate(strings))
+
+  def get_state(self):
+    return self.strings
+
+  def set_state(self, state):
+    self.strings = list(state)
+    self.string_index = dict((s, i) for (i, s) in enumerate(self.strings))
+
+
+LOG_FORMATS = {"json": JsonLogFormat, "binary": BinaryLogFormat}
+
+
+def detect_log_format(filename):
+  with open(filename, "rb") as f:
+    if f.read(len(BinaryLogFormat.MAGIC_PREFIX)) == BinaryLogFormat.MAGIC_PREFIX:
+      return "binary"
+  return "json"
+
+
+class SnapshotMismatch(Exception):
+  """A snapshot refers to something the current event doesn't have."""
+
 
 class SaverClass:
   instance_index = {}
@@ -11,20 +182,150 @@ class SaverClass:
 
   REPLAYING = False
 
+  # Group commit.  With commit_window set, records are buffered and
+  # written with a single write+flush per batch: window 0 batches
+  # everything logged in the same event loop iteration, a positive
+  # window (in seconds) waits that long after the first buffered
+  # record.  With commit_window None every record is written as it is
+  # logged.
+  commit_window = None
+  FSYNC_POLICIES = ("never", "batch", "interval")
+  fsync_policy = "never"
+  fsync_interval = 1.0
+  pending = []
+  pending_since = None
+  commit_handle = None
+  fsync_handle = None
+  last_fsync = 0
+  commit_stats = {"batches": 0, "records": 0, "max_batch": 0,
+                  "total_latency": 0.0, "max_latency": 0.0, "fsyncs": 0}
+
+  log_format = JsonLogFormat()
+
+  SNAPSHOT_VERSION = 12
+  snapshot_handler = None
+  snapshot_offset = None
+  replay_count = 0
+
   @classmethod
-  def open(cls, filename):
+  def open(cls, filename, log_format="json"):
+    # Don't start a fresh log next to an existing one in the other
+    # format, which would silently start the event over.
+    for name, fmt in LOG_FORMATS.items():
+      other = os.path.join(os.path.dirname(filename), fmt.FILENAME)
+      if (name != log_format and os.path.abspath(other) != os.path.abspath(filename) and
+          os.path.exists(other) and os.path.getsize(other) > 0):
+        raise ValueError(f"{other} is a {name} state log, but the log format is "
+                         f"{log_format}; use --log_format={name}, or convert it "
+                         f"with tools/convert_state_log.py")
     cls.filename = filename
-    cls.log = open(filename, "a+")
-    cls.log.seek(0, 2)  # go to end
+    cls.snapshot_filename = filename + ".snapshot"
+    cls.log_format = LOG_FORMATS[log_format]()
+    cls.log = open(filename, cls.log_format.MODE)
+    cls.log_format.start(cls.log)
+
+  @classmethod
+  def set_snapshot_handler(cls, handler):
+    """Install the object that knows how to capture and restore the
+    game state.  It must provide capture(), restore(data), and
+    reducers(), a dict of extra reduction functions by class for the
+    snapshot's pickler (see copyreg); the functions those pickle may
+    raise SnapshotMismatch on load."""
+    cls.snapshot_handler = handler
 
   @classmethod
   def set_classes(cls, **kwargs):
     cls.class_map.update(kwargs)
 
+  @classmethod
+  def set_group_commit(cls, window, fsync_policy="never", fsync_interval=1.0):
+    assert fsync_policy in cls.FSYNC_POLICIES, f"bad fsync policy {fsync_policy}"
+    cls.commit_window = window
+    cls.fsync_policy = fsync_policy
+    cls.fsync_interval = fsync_interval
+
   @classmethod
   def close(cls):
+    cls.commit()
     cls.log.close()
 
+  @classmethod
+  def write_record(cls, record):
+    if not cls.pending:
+      cls.pending_since = time.time()
+    cls.pending.append(cls.log_format.encode(record))
+
+    if cls.commit_handle: return
+    if cls.commit_window is not None:
+      try:
+        loop = asyncio.get_running_loop()
+      except RuntimeError:
+        loop = None
+      if loop:
+        if cls.commit_window:
+          cls.commit_handle = loop.call_later(cls.commit_window, cls.commit)
+        else:
+          cls.commit_handle = loop.call_soon(cls.commit)
+        return
+    cls.commit()
+
+  @classmethod
+  def commit(cls):
+    """Write out all buffered records."""
+    if cls.commit_handle:
+      cls.commit_handle.cancel()
+      cls.commit_handle = None
+    if not cls.pending: return
+
+    n = len(cls.pending)
+    cls.log.write(cls.log_format.EMPTY.join(cls.pending))
+    cls.pending = []
+    cls.log.flush()
+
+    now = time.time()
+    if cls.fsync_policy == "batch":
+      cls.fsync()
+    elif cls.fsync_policy == "interval":
+      if now - cls.last_fsync >= cls.fsync_interval:
+        cls.fsync()
+      elif cls.fsync_handle is None:
+        try:
+          loop = asyncio.get_running_loop()
+          cls.fsync_handle = loop.call_later(
+            cls.fsync_interval - (now - cls.last_fsync), cls.fsync)
+        except RuntimeError:
+          cls.fsync()
+
+    latency = time.time() - cls.pending_since
+    st = cls.commit_stats
+    st["batches"] += 1
+    st["records"] += n
+    st["max_batch"] = max(st["max_batch"], n)
+    st["total_latency"] += latency
+    st["max_latency"] = max(st["max_latency"], latency)
+
+  @classmethod
+  def fsync(cls):
+    if cls.fsync_handle:
+      cls.fsync_handle.cancel()
+      cls.fsync_handle = None
+    if cls.log.closed: return
+    os.fsync(cls.log.fileno())
+    cls.last_fsync = time.time()
+    cls.commit_stats["fsyncs"] += 1
+
+  @classmethod
+  def get_stats(cls):
+    st = cls.commit_stats
+    batches = st["batches"] or 1
+    return {"log_records": st["records"],
+            "log_batches": st["batches"],
+            "log_avg_batch": st["records"] / batches,
+            "log_max_batch": st["max_batch"],
+            "log_avg_commit_ms": st["total_latency"] * 1000 / batches,
+            "log_max_commit_ms": st["max_latency"] * 1000,
+            "log_fsyncs": st["fsyncs"]}
+
   @classmethod
   def __call__(cls, fn):
     n = fn.__name__
@@ -41,9 +342,7 @@ class SaverClass:
           cls.next_id += 1
           cls.instance_index[self._saver_id] = self
         record = (self._saver_id, fn.__name__, now, args, kwargs)
-        json.dump(record, cls.log)
-        cls.log.write("\n")
-        cls.log.flush()
+        cls.write_record(record)
 
       return wrapped_init
 
@@ -52,9 +351,7 @@ class SaverClass:
       def wrapped_fn(self, *args, **kwargs):
         now = time.time()
         record = (self._saver_id, fn.__name__, now, args, kwargs)
-        json.dump(record, cls.log)
-        cls.log.write("\n")
-        cls.log.flush()
+        cls.write_record(record)
         return fn(self, now, *args, **kwargs)
 
       return wrapped_fn
@@ -65,19 +362,138 @@ class SaverClass:
     cls.instance_index[saver_id] = instance
 
   @classmethod
-  def replay(cls, advance_time=None):
+  def log_prefix_hash(cls, offset):
+    h = hashlib.sha1()
+    with open(cls.filename, "rb") as f:
+      while offset > 0:
+        data = f.read(min(offset, 1 << 20))
+        if not data: return None
+        h.update(data)
+        offset -= len(data)
+    return h.hexdigest()
+
+  @classmethod
+  def write_snapshot(cls):
+    """Write a snapshot of the current state, tagged with the current
+    end of the log, replacing any previous snapshot."""
+    snap = cls.take_snapshot()
+    if snap: cls.save_snapshot(*snap)
+
+  @classmethod
+  def take_snapshot(cls):
+    """Pickle the current state.  Returns the arguments for
+    save_snapshot(), which doesn't touch the game state and so can
+    run in another thread."""
+    if cls.REPLAYING or not cls.snapshot_handler: return None
+    start = time.time()
+    cls.commit()
+    offset = cls.log.tell()
+
+    handler = cls.snapshot_handler
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table.update(handler.reducers())
+    pickler.dump(
+      (cls.log_format.get_state(), handler.capture()))
+
+    header = {"version": cls.SNAPSHOT_VERSION,
+              "offset": offset,
+              "replay_count": cls.replay_count,
+              "next_id": cls.next_id,
+              "log_format": cls.log_format.NAME,
+              "time": start}
+    return header, buf.getbuffer()
+
+  @classmethod
+  def save_snapshot(cls, header, data):
+    offset = header["offset"]
+    header["prefix_sha1"] = cls.log_prefix_hash(offset)
+    with open(cls.snapshot_filename + ".tmp", "wb") as f:
+      f.write(json.dumps(header).encode("utf-8") + b"\n")
+      f.write(zlib.compress(data, 1))
+    os.replace(cls.snapshot_filename + ".tmp", cls.snapshot_filename)
+    cls.snapshot_offset = offset
+
+    dur = int((time.time() - header["time"]) * 1000)
+    print(f"Wrote snapshot at log offset {offset} in {dur} ms.")
+
+  @classmethod
+  async def realtime_snapshot(cls, interval):
+    loop = asyncio.get_running_loop()
+    while True:
+      if cls.pending or cls.log.tell() != cls.snapshot_offset:
+        # Only the pickling holds up the event loop; the hashing,
+        # compression and writing happen in a thread.
+        start = time.time()
+        snap = cls.take_snapshot()
+        if snap:
+          print(f"Took snapshot in {int((time.time() - start) * 1000)} ms.")
+          await loop.run_in_executor(None, cls.save_snapshot, *snap)
+      await asyncio.sleep(interval)
+
+  @classmethod
+  def read_snapshot_header(cls):
+    try:
+      with open(cls.snapshot_filename, "rb") as f:
+        header = json.loads(f.readline())
+    except (OSError, ValueError):
+      return None
+    if header.get("version") != cls.SNAPSHOT_VERSION: return None
+    if header.get("log_format") != cls.log_format.NAME: return None
+    return header
+
+  @classmethod
+  def load_snapshot(cls):
+    """Restore the most recent snapshot, if there is one that matches
+    the current log.  Returns the snapshot header, or None if the
+    whole log needs to be replayed."""
+    if not cls.snapshot_handler: return None
+    header = cls.read_snapshot_header()
+    if not header: return None
+
+    offset = header["offset"]
+    if cls.log_prefix_hash(offset) != header["prefix_sha1"]:
+      print("Snapshot doesn't match state log; ignoring it.")
+      return None
+
+    with open(cls.snapshot_filename, "rb") as f:
+      f.readline()
+      data = zlib.decompress(f.read())
+    try:
+      log_state, data = pickle.loads(data)
+    except SnapshotMismatch as e:
+      print(f"Snapshot doesn't match event config ({e}); ignoring it.")
+      return None
+    if not cls.snapshot_handler.restore(data):
+      print("Snapshot doesn't match event config; ignoring it.")
+      return None
+    cls.log_format.set_state(log_state)
+
+    cls.next_id = max(cls.next_id, header["next_id"])
+    cls.snapshot_offset = offset
+    return header
+
+  @classmethod
+  def replay(cls, advance_time=None, use_snapshot=True):
     start = time.time()
     replay_count = 0
     count = 1
     skipped = set()
     cls.REPLAYING = True
     try:
-      cls.log.seek(0, 0)
-      for line in cls.log:
-        if line.startswith("#"):
+      offset = 0
+      if use_snapshot:
+        header = cls.load_snapshot()
+        if header:
+          offset = header["offset"]
+          replay_count = header["replay_count"]
+          dur = int((time.time() - start) * 1000)
+          print(f"Restored snapshot at log offset {offset} in {dur} ms.")
+      for record in cls.log_format.read(cls.log, offset):
+        if isinstance(record, str):
           replay_count += 1
           continue
-        record = json.loads(line)
         saver_id, name, now, args, kwargs = record
         if advance_time:
           advance_time(now)
@@ -109,7 +525,8 @@ class SaverClass:
     finally:
       cls.REPLAYING = False
 
-    cls.log.write("# replay\n")
+    cls.log.write(cls.log_format.comment("replay"))
+    cls.replay_count = replay_count + 1
 
     if skipped:
       print("Replay skipped references to: " + ", ".join(skipped))
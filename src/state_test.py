@@ -0,0 +1,228 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+import state
+from state import save_state, SaverClass
+
+
+class Counter:
+  BY_NAME = {}
+
+  @save_state
+  def __init__(self, now, name):
+    self.name = name
+    self.total = 0
+    self.history = []
+    self.BY_NAME[name] = self
+
+  @save_state
+  def add(self, now, amount):
+    self.total += amount
+    self.history.append(amount)
+
+
+class Thing:
+  """Stands in for an object from the event config, which snapshots
+  refer to by name."""
+  BY_NAME = {}
+
+  def __init__(self, name):
+    self.name = name
+    self.BY_NAME[name] = self
+
+
+def lookup_thing(name):
+  try:
+    return Thing.BY_NAME[name]
+  except KeyError:
+    raise state.SnapshotMismatch(f"no thing {name}")
+
+
+class CounterSnapshot:
+  @staticmethod
+  def reducers():
+    return {Thing: lambda t: (lookup_thing, (t.name,))}
+
+  @staticmethod
+  def capture():
+    return {"counters": dict(Counter.BY_NAME),
+            "instances": dict(save_state.instance_index),
+            "things": list(Thing.BY_NAME.values())}
+
+  @staticmethod
+  def restore(data):
+    Counter.BY_NAME.update(data["counters"])
+    save_state.instance_index.update(data["instances"])
+    return True
+
+
+class StateTestCase(unittest.TestCase):
+  log_format = "json"
+
+  def setUp(self):
+    Thing.BY_NAME = {}
+    self.dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dir, "state.log")
+    self.reset()
+
+  def tearDown(self):
+    SaverClass.close()
+    shutil.rmtree(self.dir)
+
+  def reset(self):
+    Counter.BY_NAME = {}
+    SaverClass.instance_index = {}
+    SaverClass.next_id = 1
+    SaverClass.snapshot_offset = None
+    SaverClass.set_classes(Counter=Counter)
+    SaverClass.set_snapshot_handler(CounterSnapshot)
+
+  def restart(self, use_snapshot=True):
+    SaverClass.close()
+    self.reset()
+    save_state.open(self.filename, self.log_format)
+    return save_state.replay(use_snapshot=use_snapshot)
+
+
+class SnapshotTest(StateTestCase):
+  def test_snapshot_and_tail(self):
+    save_state.open(self.filename, self.log_format)
+    save_state.replay()
+    a = Counter("a")
+    a.add(3)
+    a.add(4)
+    save_state.write_snapshot()
+    Counter("b").add(10)
+    a.add(5)
+
+    self.restart()
+    self.assertEqual(Counter.BY_NAME["a"].history, [3, 4, 5])
+    self.assertEqual(Counter.BY_NAME["b"].total, 10)
+
+    # Objects created after the restore don't reuse saver ids.
+    c = Counter("c")
+    self.assertEqual(len(set(save_state.instance_index)), 3)
+    self.assertEqual(save_state.instance_index[c._saver_id], c)
+
+  def test_replay_count(self):
+    save_state.open(self.filename, self.log_format)
+    self.assertEqual(save_state.replay(), 0)
+    Counter("a").add(1)
+    save_state.write_snapshot()
+    self.assertEqual(self.restart(), 1)
+    self.assertEqual(self.restart(), 2)
+    self.assertEqual(self.restart(use_snapshot=False), 3)
+
+  def test_mismatched_log_ignored(self):
+    save_state.open(self.filename, self.log_format)
+    save_state.replay()
+    Counter("a").add(1)
+    save_state.write_snapshot()
+    SaverClass.close()
+
+    # Replace the log with a different one; the old snapshot must not
+    # be applied to it.
+    os.remove(self.filename)
+    save_state.open(self.filename, self.log_format)
+    Counter("z")
+    self.restart()
+    self.assertEqual(list(Counter.BY_NAME.keys()), ["z"])
+
+  def test_mismatched_config_ignored(self):
+    Thing("x")
+    save_state.open(self.filename, self.log_format)
+    save_state.replay()
+    Counter("a").add(1)
+    save_state.write_snapshot()
+
+    self.restart()
+    self.assertIsNotNone(SaverClass.snapshot_offset)
+
+    # The event config no longer has something the snapshot refers
+    # to; the whole log is replayed instead.
+    Thing.BY_NAME = {}
+    Counter.BY_NAME["a"].add(2)
+    self.restart()
+    self.assertIsNone(SaverClass.snapshot_offset)
+    self.assertEqual(Counter.BY_NAME["a"].history, [1, 2])
+
+
+class GroupCommitTest(StateTestCase):
+  def tearDown(self):
+    SaverClass.set_group_commit(None)
+    super().tearDown()
+
+  def log_lines(self):
+    with open(self.filename) as f:
+      return [line for line in f if not line.startswith("#")]
+
+  def test_batched(self):
+    save_state.open(self.filename, self.log_format)
+    save_state.replay()
+    SaverClass.set_group_commit(0)
+    batches = SaverClass.commit_stats["batches"]
+
+    async def mutate():
+      a = Counter("a")
+      for i in range(5):
+        a.add(i)
+      self.assertEqual(self.log_lines(), [])
+      await asyncio.sleep(0)
+      self.assertEqual(len(self.log_lines()), 6)
+    asyncio.run(mutate())
+    self.assertEqual(SaverClass.commit_stats["batches"], batches + 1)
+
+    self.restart()
+    self.assertEqual(Counter.BY_NAME["a"].history, [0, 1, 2, 3, 4])
+
+  def test_flush_on_close(self):
+    save_state.open(self.filename, self.log_format)
+    save_state.replay()
+    SaverClass.set_group_commit(10)
+
+    async def mutate():
+      Counter("a").add(7)
+    asyncio.run(mutate())
+    self.assertEqual(self.log_lines(), [])
+
+    self.restart()
+    self.assertEqual(Counter.BY_NAME["a"].total, 7)
+
+
+class BinarySnapshotTest(SnapshotTest):
+  log_format = "binary"
+
+  def test_convert(self):
+    save_state.open(self.filename, self.log_format)
+    save_state.replay()
+    Counter("a").add(2)
+    Counter("b").add(amount=3)
+    SaverClass.close()
+
+    fmt = state.BinaryLogFormat()
+    with open(self.filename, "rb") as f:
+      records = list(fmt.read(f, 0))
+    self.assertEqual(records[0], "replay")
+    self.assertEqual(records[2][1:], ("add", records[2][2], (2,), {}))
+    self.assertEqual(records[4][4], {"amount": 3})
+
+  def test_other_format_present(self):
+    other = os.path.join(self.dir, state.JsonLogFormat.FILENAME)
+    with open(other, "w") as f:
+      f.write("[1, 0, null, null, \"replay\"]\n")
+    binlog = os.path.join(self.dir, state.BinaryLogFormat.FILENAME)
+    with self.assertRaisesRegex(ValueError, "convert_state_log"):
+      save_state.open(binlog, "binary")
+    self.assertFalse(os.path.exists(binlog))
+
+    # An empty one is left over from nothing, and doesn't matter.
+    open(other, "w").close()
+    save_state.open(binlog, "binary")
+    self.assertEqual(save_state.replay(), 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
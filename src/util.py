@@ -110,6 +110,8 @@ class TeamPageHandler(TeamHandler):
       d["css"].append(self.static_content[f"default{css}"])
 
     script.append(f"""var wid = {wid}; var received_serial = {serial};\n""")
+    shard = wait_proxy.Server.shard_for(self.team.username)
+    script.append(f"""var wait_shard = {json.dumps(shard)};\n""")
     script.append(f"""var initial_header = {json.dumps(self.team.get_header_data())};\n""")
     script.append(f"""var eurl = "{self.static_content["emoji"]}";\n""")
     script.append(f"""var edb = "{self.static_content["emoji.json"]}";\n""")
@@ -198,6 +200,7 @@ class AdminPageHandler(AdminHandler):
     script = ["<script>"]
     script.append(f"""var page_class = \"{self.__class__.__name__}\";\n""")
     script.append(f"""var wid = {wid};\n""")
+    script.append(f"""var wait_shard = {json.dumps(wait_proxy.Server.shard_for("__ADMIN"))};\n""")
     script.append(f"""var received_serial = {serial};""")
     script.append(f"""var eurl = "{self.static_content["emoji"]}";\n""")
     script.append(f"""var edb = "{self.static_content["emoji.json"]}";\n""")
@@ -228,6 +231,25 @@ class AdminPageHandler(AdminHandler):
 
     return d
 
+def get_log_page(handler, log, limit=100):
+  """The page of log asked for by the request's log_since, log_before,
+  and log_limit arguments.  The default limit only applies to a first
+  fetch; a reader catching up gets everything since its cursor."""
+  since = get_int_argument(handler, "log_since")
+  before = get_int_argument(handler, "log_before")
+  lim = get_int_argument(handler, "log_limit")
+  if lim is None and since is None: lim = limit
+  return log.get_page(since=since, before=before, limit=lim)
+
+def get_int_argument(handler, name, default=None):
+  """The request's integer argument name; 400 if it isn't one."""
+  v = handler.get_argument(name, None)
+  if v is None: return default
+  try:
+    return int(v)
+  except ValueError:
+    raise tornado.web.HTTPError(http.client.BAD_REQUEST, f"Bad {name}")
+
 def format_duration(sec):
   out = []
   sec = int(sec)
@@ -1,13 +1,14 @@
 import asyncio
-import collections
 import concurrent
 import contextlib
 import copy
 import http.client
 import json
 import random
+import struct
 import sys
 import time
+import zlib
 import tornado.web
 import tornado.httpclient
 import tornado.httpserver
@@ -20,6 +21,62 @@ import login
 PROXY_WAIT_TIMEOUT = 30 # seconds
 
 
+# What the main server sends the proxies is a series of frames, one
+# per batch of messages.  A frame is a JSON header line of [team,
+# serial, [length of each part]] followed by the parts, which for a
+# team's messages are the "[serial,message]" bytes the proxy will hand
+# to waiters as-is.  Each frame is built once and shared by every
+# proxy's queue.
+
+def encode_frame(team, serial, parts):
+  header = json.dumps([team, serial, [len(p) for p in parts]]).encode("utf-8")
+  return b"".join([header, b"\n"] + parts)
+
+# With --proxy_transport=socket, the main server and each proxy talk
+# over a socketpair made before the proxy is forked, instead of the
+# proxy polling /proxywait.  Each record on the stream is a 4-byte
+# length and then that many bytes: a frame going to the proxy, or the
+# proxy's JSON stats coming back.
+STREAM_HEADER = struct.Struct(">I")
+
+# How often a streaming proxy reports its stats.
+STREAM_STATS_INTERVAL = 5 # seconds
+
+async def read_record(reader):
+  """The next record from a proxy stream, or None at EOF."""
+  try:
+    n, = STREAM_HEADER.unpack(await reader.readexactly(STREAM_HEADER.size))
+    return await reader.readexactly(n)
+  except (asyncio.IncompleteReadError, ConnectionError):
+    return None
+
+def write_record(writer, data):
+  writer.write(STREAM_HEADER.pack(len(data)))
+  writer.write(data)
+
+def decode_frames(data):
+  """Split a reply from /proxywait into (team, serial, parts)
+  tuples, without decoding the parts."""
+  out = []
+  pos = 0
+  while pos < len(data):
+    nl = data.index(b"\n", pos)
+    team, serial, lengths = json.loads(data[pos:nl])
+    pos = nl + 1
+    parts = []
+    for n in lengths:
+      parts.append(data[pos:pos+n])
+      pos += n
+    out.append((team, serial, parts))
+  return out
+
+def resolve_future(fut, result):
+  """Complete fut with result, unless it's already done (eg, timed
+  out)."""
+  if not fut.done():
+    fut.set_result(result)
+
+
 ##
 ## server side
 ##
@@ -28,39 +85,117 @@ PROXY_WAIT_TIMEOUT = 30 # seconds
 class Server:
   PROXIES = []
   NEXT_WID = 1
+  # If set, each team's messages go only to the proxy that owns it
+  # (see shard_for) instead of to every proxy.
+  SHARDED = False
 
   def __init__(self, wpid):
     self.wpid = wpid
-    self.cv = asyncio.Condition()
     self.q = []
+    # Future of whoever's waiting to send this proxy frames; it gets
+    # the frames themselves.
+    self.waiter = None
     self.last_stats = {}
     self.ever_connected = False
+    # Set when the proxy's stream breaks; it gets no more frames.
+    self.lost = False
 
   @classmethod
-  def init_proxies(cls, count):
+  def init_proxies(cls, count, socks=None, sharded=False):
+    """socks, if given, are the main server's ends of the proxies'
+    socketpairs."""
+    cls.SHARDED = sharded and count > 0
     for i in range(count):
-      cls.PROXIES.append(Server(i))
+      p = Server(i)
+      cls.PROXIES.append(p)
+      if socks:
+        asyncio.create_task(p.serve_stream(socks[i]))
+
+  async def serve_stream(self, sock):
+    reader, writer = await asyncio.open_connection(sock=sock)
+    self.ever_connected = True
+    asyncio.create_task(self.read_stream_stats(reader, writer))
+    try:
+      while not self.lost:
+        frames = await self.next_frames()
+        for f in frames:
+          write_record(writer, f)
+        await writer.drain()
+    except OSError:
+      pass
+    self.lose_stream(writer)
+
+  async def read_stream_stats(self, reader, writer):
+    while True:
+      data = await read_record(reader)
+      if data is None:
+        self.lose_stream(writer)
+        return
+      self.last_stats = json.loads(data)
+
+  def lose_stream(self, writer):
+    """Stop queueing frames for a proxy whose stream has broken."""
+    if self.lost: return
+    self.lost = True
+    self.q = []
+    print(f"lost stream to proxy waiter #{self.wpid}; no longer sending it messages")
+    if self.waiter is not None:
+      resolve_future(self.waiter, [])
+      self.waiter = None
+    writer.close()
 
   @classmethod
   async def send_message(cls, team, serial, strs):
     if not isinstance(team, str):
       team = team.username
-    x = (team,  tuple((serial+i, s) for (i, s) in enumerate(strs)))
-    for p in cls.PROXIES:
-      async with p.cv:
-        p.q.append(x)
-        p.cv.notify_all()
+    frame = encode_frame(team, serial, [f"[{serial+i},{s}]".encode("utf-8")
+                                        for (i, s) in enumerate(strs)])
+    shard = None if team == "__EXIT" else cls.shard_for(team)
+    await cls.send_frame(frame, None if shard is None else cls.PROXIES[shard])
+
+  @classmethod
+  async def send_frame(cls, frame, proxy=None):
+    """Queue frame for proxy, or for all of them."""
+    for p in (proxy,) if proxy else cls.PROXIES:
+      if p.lost: continue
+      p.q.append(frame)
+      w, p.waiter = p.waiter, None
+      if w is not None and not w.done():
+        frames, p.q = p.q, []
+        w.set_result(frames)
+
+  async def next_frames(self, timeout=None):
+    """Take the frames queued for this proxy, waiting up to timeout
+    for there to be some."""
+    if self.q or timeout == 0:
+      frames, self.q = self.q, []
+      return frames
+    loop = asyncio.get_running_loop()
+    self.waiter = fut = loop.create_future()
+    if timeout is None:
+      return await fut
+    handle = loop.call_later(timeout, resolve_future, fut, [])
+    try:
+      return await fut
+    finally:
+      handle.cancel()
 
   @classmethod
   async def push_session_cache(cls):
     while True:
       data = login.Session.get_all_sessions()
-      for p in cls.PROXIES:
-        async with p.cv:
-          p.q.append(("__SESSION", data))
-          p.cv.notify_all()
+      await cls.send_frame(encode_frame("__SESSION", 0, [json.dumps(data).encode("utf-8")]))
       await asyncio.sleep(10)
 
+  @classmethod
+  def shard_for(cls, group):
+    """The proxy that waiters for group (a team username, or
+    "__ADMIN") must use, or None if any proxy will do.  Pages put it
+    in their wait URL as /wait/p<shard>/..., which the front end
+    routes to that proxy."""
+    if not cls.SHARDED: return None
+    return zlib.crc32(group.encode("utf-8")) % len(cls.PROXIES)
+
   @classmethod
   def new_waiter_id(cls):
     wid, cls.NEXT_WID = cls.NEXT_WID, cls.NEXT_WID+1
@@ -84,20 +219,12 @@ class ProxyWaitHandler(tornado.web.RequestHandler):
 
     proxy.last_stats = json.loads(self.request.body)
 
-    async with proxy.cv:
-      if not proxy.q:
-        try:
-          await asyncio.wait_for(proxy.cv.wait(), timeout)
-        except asyncio.TimeoutError:
-          pass
-
-      content, proxy.q = proxy.q, []
+    content = await proxy.next_frames(timeout)
 
     proxy.ever_connected = True
-    content = json.dumps(content)
-    self.set_header("Content-Type", "application/json")
+    self.set_header("Content-Type", "application/octet-stream")
     self.set_header("Cache-Control", "no-store")
-    self.write(content)
+    self.write(b"".join(content))
 
 
 class CheckSessionHandler(tornado.web.RequestHandler):
@@ -131,50 +258,81 @@ def GetHandlers():
 
 
 class Client:
-  def __init__(self, wpid, options):
+  def __init__(self, wpid, options, sock=None):
     self.wpid = wpid
     self.options = options
+    self.sock = sock
     self.ever_connected = False
+    self.listening = False
 
     self.session_cache = {}
 
   async def start(self):
     self.client = tornado.httpclient.AsyncHTTPClient()
-    await self.fetch()
+    if self.sock:
+      await self.stream()
+    else:
+      await self.fetch()
+
+  def listen(self):
+    if self.listening: return
+    app = tornado.web.Application(
+      [(r"/(admin)?wait/(?:p\d+/)?(\d+)/(\d+)(?:/(\d+))?", WaitHandler, {"proxy_client": self})],
+      cookie_secret=self.options.cookie_secret)
+
+    self.server = tornado.httpserver.HTTPServer(app)
+    socket = tornado.netutil.bind_sockets(self.options.base_port + self.wpid + 1, address="localhost")
+    self.server.add_sockets(socket)
+
+    print(f"proxy waiter #{self.wpid} listening")
+    self.listening = True
+
+  async def handle_frames(self, msgs):
+    """Deliver frames from the main server.  Returns False if told
+    to exit."""
+    for team, serial, parts in msgs:
+      if team == "__EXIT":
+        print(f"proxy waiter #{self.wpid} exiting")
+        return False
+      elif team == "__SESSION":
+        for k, x, t, s in json.loads(parts[0]):
+          if t == "__ADMIN": s = None
+          self.session_cache[k] = (t, x, s)
+        continue
+      team = ProxyTeam.get_team(team)
+      await team.send_messages(serial, parts)
+    return True
 
   async def fetch(self):
     # Give main server time to start up.
     await asyncio.sleep(1.0)
-    listening = False
 
     snapshot = {}
     while True:
       msgs = await self.get_messages(snapshot)
-
-      if not listening:
-        app = tornado.web.Application(
-          [(r"/(admin)?wait/(\d+)/(\d+)(?:/(\d+))?", WaitHandler, {"proxy_client": self})],
-          cookie_secret=self.options.cookie_secret)
-
-        self.server = tornado.httpserver.HTTPServer(app)
-        socket = tornado.netutil.bind_sockets(self.options.base_port + self.wpid + 1, address="localhost")
-        self.server.add_sockets(socket)
-
-        print(f"proxy waiter #{self.wpid} listening")
-        listening = True
-
+      self.listen()
       snapshot = copy.copy(ProxyTeam.team_stats())
-      for team, items in msgs:
-        if team == "__EXIT":
-          print(f"proxy waiter #{self.wpid} exiting")
-          return
-        elif team == "__SESSION":
-          for k, x, t, s in items:
-            if t == "__ADMIN": s = None
-            self.session_cache[k] = (t, x, s)
-          continue
-        team = ProxyTeam.get_team(team)
-        await team.send_messages(items)
+      if not await self.handle_frames(msgs): return
+
+  async def stream(self):
+    reader, writer = await asyncio.open_connection(sock=self.sock)
+    self.listen()
+    asyncio.create_task(self.send_stream_stats(writer))
+    while True:
+      data = await read_record(reader)
+      if data is None:
+        print(f"proxy waiter #{self.wpid} lost main server; exiting")
+        return
+      if not self.ever_connected:
+        print(f"proxy {self.wpid} connected")
+        self.ever_connected = True
+      if not await self.handle_frames(decode_frames(data)): return
+
+  async def send_stream_stats(self, writer):
+    while True:
+      write_record(writer, json.dumps(ProxyTeam.team_stats()).encode("utf-8"))
+      await writer.drain()
+      await asyncio.sleep(STREAM_STATS_INTERVAL)
 
   async def get_messages(self, stats):
     retries = 5
@@ -190,7 +348,7 @@ class Client:
         if not self.ever_connected:
           print(f"proxy {self.wpid} connected")
           self.ever_connected = True
-        return json.loads(response.body)
+        return decode_frames(response.body)
       except tornado.httpclient.HTTPClientError as e:
         print(f"proxy {self.wpid} got {e.code}; retrying")
         await asyncio.sleep(1.0)
@@ -243,7 +401,13 @@ class Client:
 
 class ProxyTeam:
   BY_TEAM = {}
-  OLD_MESSAGE_AGE = 10.0
+
+  # How many of a team's most recent messages (and roughly how many
+  # bytes of them) are kept for waiters that are behind.  The newest
+  # batch is always kept whole.  A waiter that's missed messages that
+  # have been dropped is told to resync.
+  MAX_MESSAGES = 128
+  MAX_BYTES = 64 << 10
 
   @classmethod
   def get_team(cls, team):
@@ -260,42 +424,110 @@ class ProxyTeam:
   def __init__(self, team):
     self.team = team
     self.username = team
-    self.cv = asyncio.Condition()
-    self.q = collections.deque()
+
+    # Ring buffer of encoded messages: message number s is in
+    # ring[s % len(ring)], for start <= s < end.
+    self.ring = [None] * self.MAX_MESSAGES
+    self.start = 0
+    self.end = 0
+    self.size = 0
+    # Whether any message has been dropped to make room.
+    self.trimmed = False
+    # Response bodies for the messages from (key) to end.
+    self.bodies = {}
+    # Futures of the waiters with nothing new to send them yet, by
+    # the serial they've received through.
+    self.waiters = {}
+
     self.wait_stats = {}
 
   def __str__(self):
     return f"<ProxyTeam {self.team}>"
 
-  async def send_messages(self, msgs):
-    if not msgs: return
-
-    now = time.time()
-    for m in msgs:
-      self.q.append((now, m[0], f"[{m[0]},{m[1]}]".encode("utf-8")))
-
-    async with self.cv:
-      self.cv.notify_all()
-
-    cutoff = time.time() - self.OLD_MESSAGE_AGE
-    while self.q and self.q[0][0] < cutoff:
-      el = self.q.popleft()
+  async def send_messages(self, serial, parts):
+    """parts are the encoded messages starting with number serial."""
+    if not parts: return
+
+    if serial != self.end:
+      # Not a continuation of what we have (eg, the main server has
+      # restarted); start over.
+      self.ring = [None] * self.MAX_MESSAGES
+      self.start = self.end = serial
+      self.size = 0
+      self.trimmed = False
+
+    # Make room for the whole batch: waiters that were caught up
+    # need all of it.  The ring grows if the batch alone won't fit,
+    # and shrinks back afterwards.
+    batch_size = sum(len(m) for m in parts)
+    n = max(self.MAX_MESSAGES, len(parts))
+    while self.end > self.start and (self.end - self.start + len(parts) > n or
+                                     self.size + batch_size > self.MAX_BYTES):
+      i = self.start % len(self.ring)
+      self.size -= len(self.ring[i])
+      self.ring[i] = None
+      self.start += 1
+      self.trimmed = True
+    if len(self.ring) != n:
+      old = self.ring
+      self.ring = [None] * n
+      for s in range(self.start, self.end):
+        self.ring[s % n] = old[s % len(old)]
+
+    ring = self.ring
+    for m in parts:
+      ring[self.end % n] = m
+      self.end += 1
+    self.size += batch_size
+    self.bodies.clear()
+
+    # Hand each waiter its response directly; waiters that have seen
+    # the same messages share one body.
+    waiters, self.waiters = self.waiters, {}
+    for received_serial, futs in waiters.items():
+      body = self.response_body(received_serial)
+      if body is None:
+        self.waiters[received_serial] = futs
+        continue
+      for fut in futs:
+        if not fut.done():
+          fut.set_result(body)
+
+  def response_body(self, received_serial):
+    """The wait response for a client that has everything through
+    received_serial, or None if there's nothing new for it."""
+    start = received_serial + 1
+    if start >= self.end: return None
+    if start < self.start:
+      if self.trimmed:
+        return b'[[%d,{"method":"resync"}]]' % (self.end - 1,)
+      start = self.start
+
+    body = self.bodies.get(start)
+    if body is None:
+      if len(self.bodies) >= 8: self.bodies.clear()
+      ring = self.ring
+      n = len(ring)
+      body = b"[" + b",".join([ring[s % n] for s in range(start, self.end)]) + b"]"
+      self.bodies[start] = body
+    return body
 
   async def await_new_messages(self, received_serial, timeout):
-    while True:
-      if self.q and self.q[-1][1] > received_serial:
-        # at least one message to send
-        out = collections.deque()
-        for ts, s, m in reversed(self.q):
-          if s > received_serial:
-            out.appendleft(m)
-        return out
-
-      async with self.cv:
-        try:
-          await asyncio.wait_for(self.cv.wait(), timeout)
-        except asyncio.TimeoutError:
-          return []
+    body = self.response_body(received_serial)
+    if body is not None: return body
+
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    futs = self.waiters.setdefault(received_serial, set())
+    futs.add(fut)
+    handle = loop.call_later(timeout, resolve_future, fut, b"[]")
+    try:
+      return await fut
+    finally:
+      handle.cancel()
+      futs.discard(fut)
+      if not futs and self.waiters.get(received_serial) is futs:
+        del self.waiters[received_serial]
 
   @contextlib.contextmanager
   def track_wait(self, key):
@@ -350,17 +582,10 @@ class WaitHandler(tornado.web.RequestHandler):
     timeout = timeout * random.uniform(0.5, 1.0)
 
     with team.track_wait(key):
-      msgs = await team.await_new_messages(received_serial, timeout)
+      body = await team.await_new_messages(received_serial, timeout)
 
     if False:
-      if msgs:
-        print(f"msgs {msgs[0][0]}..{msgs[-1][0]} to {team} wid {wid}")
-      else:
-        print(f"empty response to {team} wid {wid}")
+      print(f"{len(body)} byte response to {team} wid {wid}")
 
     self.set_header("Content-Type", "application/json")
-    self.write(b"[")
-    for i, m in enumerate(msgs):
-      if i > 0: self.write(b",")
-      self.write(m)
-    self.write(b"]")
+    self.write(body)
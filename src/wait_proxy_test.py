@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import re
+import socket
+import unittest
+
+# wait_proxy imports login, and login and game import each other; the
+# cycle only resolves when game is imported first, as main.py does.
+import game
+import wait_proxy
+
+class FrameTest(unittest.TestCase):
+  def test_round_trip(self):
+    parts = [b'[5,{"method":"a"}]', b"", "[7,\"é\"]".encode("utf-8")]
+    data = (wait_proxy.encode_frame("team", 5, parts) +
+            wait_proxy.encode_frame("__SESSION", 0, [b"[]"]))
+    self.assertEqual(wait_proxy.decode_frames(data),
+                     [("team", 5, parts), ("__SESSION", 0, [b"[]"])])
+    self.assertEqual(wait_proxy.decode_frames(b""), [])
+
+
+class StreamTest(unittest.TestCase):
+  def setUp(self):
+    self.proxies = wait_proxy.Server.PROXIES
+    wait_proxy.Server.PROXIES = []
+
+  def tearDown(self):
+    wait_proxy.Server.PROXIES = self.proxies
+
+  def test_socketpair(self):
+    async def go():
+      ours, theirs = socket.socketpair()
+      wait_proxy.Server.init_proxies(1, socks=[ours])
+      server = wait_proxy.Server.PROXIES[0]
+      reader, writer = await asyncio.open_connection(sock=theirs)
+
+      await wait_proxy.Server.send_message("team", 5, ['{"a":1}', '{"b":2}'])
+      frames = wait_proxy.decode_frames(await wait_proxy.read_record(reader))
+      self.assertEqual(frames, [("team", 5, [b'[5,{"a":1}]', b'[6,{"b":2}]'])])
+
+      wait_proxy.write_record(writer, b'{"team": {"key": 1}}')
+      await writer.drain()
+      await asyncio.sleep(0.01)
+      self.assertEqual(server.last_stats, {"team": {"key": 1}})
+
+      # When the proxy goes away, the server stops queueing for it
+      # and closes its end.
+      writer.close()
+      await asyncio.sleep(0.01)
+      self.assertTrue(server.lost)
+      await wait_proxy.Server.send_message("team", 7, ['{"c":3}'])
+      self.assertEqual(server.q, [])
+      self.assertIsNone(await wait_proxy.read_record(reader))
+    asyncio.run(go())
+
+
+class ShardTest(unittest.TestCase):
+  def setUp(self):
+    self.proxies = wait_proxy.Server.PROXIES
+    wait_proxy.Server.PROXIES = []
+
+  def tearDown(self):
+    wait_proxy.Server.PROXIES = self.proxies
+    wait_proxy.Server.SHARDED = False
+
+  def queued(self):
+    return [[wait_proxy.decode_frames(f)[0][0] for f in p.q]
+            for p in wait_proxy.Server.PROXIES]
+
+  def test_send_message(self):
+    async def go():
+      wait_proxy.Server.init_proxies(3, sharded=True)
+      teams = [f"team{i}" for i in range(20)]
+      for t in teams:
+        await wait_proxy.Server.send_message(t, 1, ['{}'])
+      # Each team's messages go only to the proxy its pages wait on.
+      expect = [[] for _ in range(3)]
+      for t in teams:
+        expect[wait_proxy.Server.shard_for(t)].append(t)
+      self.assertEqual(self.queued(), expect)
+      self.assertTrue(all(expect))
+    asyncio.run(go())
+
+  def test_broadcast(self):
+    async def go():
+      wait_proxy.Server.init_proxies(3, sharded=True)
+      # Sessions and exit go to every proxy, sharded or not.
+      await wait_proxy.Server.send_frame(wait_proxy.encode_frame("__SESSION", 0, [b"{}"]))
+      await wait_proxy.Server.send_message("__EXIT", 0, [""])
+      self.assertEqual(self.queued(), [["__SESSION", "__EXIT"]] * 3)
+    asyncio.run(go())
+
+  def test_unsharded(self):
+    async def go():
+      wait_proxy.Server.init_proxies(2)
+      self.assertIsNone(wait_proxy.Server.shard_for("team"))
+      # Pages get null, and wait at /wait/ on any proxy.
+      self.assertEqual(json.dumps(wait_proxy.Server.shard_for("__ADMIN")), "null")
+      await wait_proxy.Server.send_message("team", 1, ['{}'])
+      self.assertEqual(self.queued(), [["team"], ["team"]])
+    asyncio.run(go())
+
+  def test_front_end_routes(self):
+    # The shipped haproxy config needs a /wait/p<n>/ route for every
+    # proxy the shipped service starts.
+    top = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    with open(os.path.join(top, "sys", "snellen.service")) as f:
+      count = int(re.search(r"--wait_proxies (\d+)", f.read()).group(1))
+    with open(os.path.join(top, "sys", "haproxy.cfg")) as f:
+      routes = set(re.findall(r"path -m beg (/wait/p\d+/) (/adminwait/p\d+/)", f.read()))
+
+    wait_proxy.Server.init_proxies(count, sharded=True)
+    shards = {wait_proxy.Server.shard_for(g)
+              for g in ["__ADMIN"] + [f"team{i}" for i in range(100)]}
+    self.assertEqual(shards, set(range(count)))
+    # As the pages' wait_shard, and then common.js, build the URLs.
+    self.assertEqual(routes, {(f"/wait/p{json.dumps(s)}/", f"/adminwait/p{json.dumps(s)}/")
+                              for s in shards})
+
+
+class RingTest(unittest.TestCase):
+  def messages(self, serial, count, size=8):
+    return [(b"[%d,%s]" % (s, b"0" * size)) for s in range(serial, serial+count)]
+
+  def body(self, serial, count, size=8):
+    return b"[" + b",".join(self.messages(serial, count, size)) + b"]"
+
+  def resync(self, serial):
+    return b'[[%d,{"method":"resync"}]]' % (serial,)
+
+  def test_slices(self):
+    async def go():
+      t = wait_proxy.ProxyTeam("t")
+      self.assertIsNone(t.response_body(0))
+      await t.send_messages(1, self.messages(1, 3))
+      self.assertEqual(t.response_body(0), self.body(1, 3))
+      self.assertEqual(t.response_body(2), self.body(3, 1))
+      self.assertIsNone(t.response_body(3))
+      # Waiters that have seen the same messages share one body.
+      self.assertIs(t.response_body(1), t.response_body(1))
+
+      # Wrap around the ring a few times.
+      n = t.MAX_MESSAGES
+      for s in range(4, 3 * n + 4, 8):
+        await t.send_messages(s, self.messages(s, 8))
+      end = 3 * n + 4
+      self.assertEqual(t.response_body(end - 11), self.body(end - 10, 10))
+      self.assertEqual(t.response_body(end - n - 1), self.body(end - n, n))
+      self.assertEqual(t.response_body(end - n - 2), self.resync(end - 1))
+    asyncio.run(go())
+
+  def test_large_batch(self):
+    async def go():
+      t = wait_proxy.ProxyTeam("t")
+      await t.send_messages(1, self.messages(1, 1))
+      w = asyncio.ensure_future(t.await_new_messages(1, 10))
+      await asyncio.sleep(0)
+
+      # A batch bigger than the ring is kept whole, so the caught-up
+      # waiter gets all of it rather than a resync.
+      n = t.MAX_MESSAGES + 172
+      await t.send_messages(2, self.messages(2, n))
+      self.assertEqual(await w, self.body(2, n))
+      self.assertEqual(t.response_body(1), self.body(2, n))
+      self.assertEqual(t.response_body(0), self.resync(n + 1))
+
+      # So is one bigger than MAX_BYTES.
+      size = t.MAX_BYTES // 4
+      await t.send_messages(n + 2, self.messages(n + 2, 5, size))
+      self.assertEqual(t.response_body(n + 1), self.body(n + 2, 5, size))
+      self.assertEqual(t.response_body(n), self.resync(n + 6))
+
+      # The ring goes back to its usual size afterwards.
+      await t.send_messages(n + 7, self.messages(n + 7, 1))
+      self.assertEqual(len(t.ring), t.MAX_MESSAGES)
+      self.assertEqual(t.response_body(n + 6), self.body(n + 7, 1))
+    asyncio.run(go())
+
+  def test_restart(self):
+    async def go():
+      t = wait_proxy.ProxyTeam("t")
+      await t.send_messages(1, self.messages(1, 2 * t.MAX_MESSAGES))
+
+      # When the serials jump, the old messages are gone, but nothing
+      # was dropped that a waiter for the new ones could need.
+      await t.send_messages(1000001, self.messages(1000001, 2))
+      self.assertEqual(t.response_body(5), self.body(1000001, 2))
+      self.assertEqual(t.response_body(1000001), self.body(1000002, 1))
+      self.assertIsNone(t.response_body(1000002))
+    asyncio.run(go())
+
+  def test_wait(self):
+    async def go():
+      t = wait_proxy.ProxyTeam("t")
+      self.assertEqual(await t.await_new_messages(0, 0.01), b"[]")
+      self.assertEqual(t.waiters, {})
+
+      ws = [asyncio.ensure_future(t.await_new_messages(0, 10)) for _ in range(3)]
+      await asyncio.sleep(0)
+      await t.send_messages(1, self.messages(1, 2))
+      bodies = await asyncio.gather(*ws)
+      self.assertEqual(bodies[0], self.body(1, 2))
+      self.assertIs(bodies[0], bodies[2])
+      self.assertEqual(t.waiters, {})
+    asyncio.run(go())
+
+
+if __name__ == "__main__":
+  unittest.main()
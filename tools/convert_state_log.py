@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+# Converts a state log between the JSON and binary formats.  The input
+# format is detected from the file; the output is the other format
+# unless --to is given.  Snapshots are tied to log offsets, so the
+# server will do a full replay of the converted log the first time.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import state
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Convert a state log between the JSON and binary formats.")
+  parser.add_argument("input", help="State log to read.")
+  parser.add_argument("output", help="File to write the converted log to.")
+  parser.add_argument("--to", choices=tuple(state.LOG_FORMATS.keys()), default=None,
+                      help="Output format (default: whichever the input isn't).")
+  options = parser.parse_args()
+
+  in_name = state.detect_log_format(options.input)
+  out_name = options.to or ("json" if in_name == "binary" else "binary")
+  assert not os.path.exists(options.output), f"{options.output} already exists!"
+
+  in_format = state.LOG_FORMATS[in_name]()
+  out_format = state.LOG_FORMATS[out_name]()
+
+  start = time.time()
+  count = 0
+  with open(options.input, "rb" if in_name == "binary" else "r") as inp, \
+       open(options.output, out_format.MODE) as out:
+    out_format.start(out)
+    for record in in_format.read(inp, 0):
+      if isinstance(record, str):
+        out.write(out_format.comment(record))
+      else:
+        out.write(out_format.encode(record))
+        count += 1
+
+  dur = time.time() - start
+  print(f"Converted {count} records from {in_name} to {out_name} in {dur:.1f} s "
+        f"({os.path.getsize(options.input)} -> {os.path.getsize(options.output)} bytes).")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+
+# Generates a state log for a simulated hunt, without a server.  The
+# output directory is a copy of the event directory (everything but
+# teams.json is symlinked) with a teams.json for the requested number
+# of teams and the resulting state log, so it can be passed to the
+# server or tools/replay_bench.py as --event_dir.
+#
+# The log is produced by calling the real @save_state methods under a
+# simulated clock, so it's exactly what a server would have written
+# for the same sequence of team and admin actions.
+
+import argparse
+import asyncio
+import collections
+import heapq
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+class Clock:
+  """Stands in for the time module in state.py and game.py."""
+  def __init__(self, now):
+    self.now = now
+
+  def time(self):
+    return self.now
+
+
+class Simulation:
+  def __init__(self, options, rng, start):
+    import game
+    self.game = game
+    self.options = options
+    self.rng = rng
+    self.start = start
+    self.end = start + options.hours * 3600
+    self.events = []
+    self.seq = 0
+    self.counts = collections.Counter()
+    self.admins = sorted(game.login.AdminUser.BY_USERNAME.keys())
+
+    # Relative speed of each team; faster teams act more often and
+    # guess right more often.
+    self.skill = {}
+    for t in game.Team.all_teams():
+      self.skill[t] = rng.lognormvariate(0, options.skill_sigma)
+      self.schedule(start + rng.uniform(0, options.arrival_spread * 60), "team", t)
+    self.schedule(start + options.sweep, "sweep", None)
+
+  def schedule(self, when, kind, arg):
+    self.seq += 1
+    heapq.heappush(self.events, (when, self.seq, kind, arg))
+
+  def gap(self, team):
+    mean = self.options.mean_gap / self.skill[team]
+    arrival = self.options.arrival
+    if arrival == "poisson":
+      return self.rng.expovariate(1 / mean)
+    if arrival == "uniform":
+      return self.rng.uniform(0, 2 * mean)
+    # "burst": short gaps while a team is working, with an occasional
+    # long break.
+    if self.rng.random() < mean / (self.options.break_hours * 3600):
+      return self.rng.expovariate(1 / (self.options.break_hours * 3600))
+    return self.rng.expovariate(4 / mean)
+
+  async def run(self, clock):
+    game = self.game
+    while self.events and self.events[0][0] < self.end:
+      now, _, kind, arg = heapq.heappop(self.events)
+      clock.now = now
+
+      _, beam = game.Submission.process_submit_queue(now)
+      if beam:
+        await game.Global.STATE.catch_up_beams()
+
+      if kind == "team":
+        self.team_action(arg, now)
+        self.schedule(now + self.gap(arg), "team", arg)
+      elif kind == "hint_reply":
+        team, shortname = arg
+        team.add_hint_text(shortname, self.rng.choice(self.admins), "Synthetic hint reply.")
+        self.counts["hint reply"] += 1
+      elif kind == "sweep":
+        self.sweep(now)
+        self.schedule(now + self.options.sweep, "sweep", None)
+
+      # Let the message flushing tasks the game creates run.
+      await asyncio.sleep(0)
+
+  def team_action(self, team, now):
+    game = self.game
+    options = self.options
+    rng = self.rng
+
+    if team.fastpasses_available and rng.random() < options.fastpass_rate:
+      lands = team.get_fastpass_eligible_lands()
+      if lands:
+        team.apply_fastpass(rng.choice(lands).shortname)
+        self.counts["pennypass"] += 1
+        return
+
+    open_ps = sorted((ps for ps in team.open_puzzles if ps.state == game.PuzzleState.OPEN),
+                     key=lambda ps: ps.puzzle.shortname)
+    if not open_ps: return
+
+    if (self.admins and team.current_hint_puzzlestate is None and
+        rng.random() < options.hint_rate):
+      hintable = [ps for ps in open_ps if ps.hints_available]
+      if hintable:
+        ps = rng.choice(hintable)
+        team.add_hint_text(ps.puzzle.shortname, None, "Synthetic hint request.")
+        self.counts["hint request"] += 1
+        self.schedule(now + rng.expovariate(1 / options.hint_reply_delay), "hint_reply",
+                      (team, ps.puzzle.shortname))
+        return
+
+    ps = rng.choice(open_ps)
+    p_correct = min(0.95, options.correct_rate * self.skill[team])
+    remaining = sorted(ps.puzzle.answers - ps.answers_found)
+    if remaining and rng.random() < p_correct:
+      answer = rng.choice(remaining)
+      self.counts["correct submit"] += 1
+    else:
+      answer = "WRONG" + "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(6))
+      self.counts["incorrect submit"] += 1
+    team.submit_answer(team.get_submit_id(), ps.puzzle.shortname, answer)
+
+  def sweep(self, now):
+    """Do what the server's periodic tasks and the admins do."""
+    game = self.game
+    options = self.options
+    state = game.Global.STATE
+
+    # The server's scheduler tasks.
+    game.Puzzle.open_due_hints(now)
+    game.Team.expire_fastpasses(now)
+
+    # Occasionally bestow a PennyPass.
+    if self.admins and self.rng.random() < options.bestow_rate:
+      team = self.rng.choice(sorted(game.Team.all_teams(), key=lambda t: t.username))
+      team.bestow_fastpass(game.CONSTANTS["pennypass_expiration"] * game.CONSTANTS["time_scale"],
+                           self.rng.choice(self.admins))
+      self.counts["pennypass bestowed"] += 1
+
+    # Admins claim and complete tasks once they've waited long enough.
+    if self.admins:
+      for key, task in sorted(state.task_queue.tasks.items()):
+        if now - task.when < options.task_delay: continue
+        state.claim_task(key, self.rng.choice(self.admins))
+        state.complete_task(key)
+        self.counts["task completed"] += 1
+
+
+def write_event_dir(options):
+  out = options.output_dir
+  os.makedirs(out, exist_ok=True)
+  for name in os.listdir(options.event_dir):
+    if name == "teams.json" or name.startswith("state.") or name == "submit_log.csv":
+      continue
+    dst = os.path.join(out, name)
+    if not os.path.lexists(dst):
+      os.symlink(os.path.abspath(os.path.join(options.event_dir, name)), dst)
+
+  with open(os.path.join(options.event_dir, "teams.json")) as f:
+    teams = json.load(f)
+
+  # Keep the real teams that behave like ordinary teams, then add
+  # copies of one of them until there are enough.
+  special = ("all_lands_open", "all_puzzles_open", "no_submit")
+  ordinary = dict((u, d) for (u, d) in teams.items()
+                  if not any(d.get("attrs", {}).get(k) for k in special))
+  assert ordinary, "No ordinary teams in teams.json to copy."
+  template = next(iter(ordinary.values()))
+  out_teams = dict(list(ordinary.items())[:options.teams])
+  i = 0
+  while len(out_teams) < options.teams:
+    i += 1
+    d = dict(template)
+    d["name"] = f"Synthetic Team {i}"
+    d["attrs"] = dict((k, v) for (k, v) in d.get("attrs", {}).items() if k != "alt")
+    out_teams[f"synth{i:04d}"] = d
+
+  with open(os.path.join(out, "teams.json"), "w") as f:
+    json.dump(out_teams, f, indent=True)
+
+
+async def generate(options):
+  import game
+  import login
+  import main
+  import state
+  from state import save_state
+
+  log_format = state.LOG_FORMATS[options.log_format]
+  log = os.path.join(options.output_dir, log_format.FILENAME)
+  for fn in (log, log + ".snapshot"):
+    if os.path.exists(fn): os.remove(fn)
+
+  options.event_dir = options.output_dir
+  main.load_event(options)
+  game.Global.set_submit_log_filename(os.path.join(options.output_dir, "submit_log.csv"))
+
+  rng = random.Random(options.seed)
+  clock = Clock(options.start if options.start else time.time())
+  state.time = clock
+  game.time = clock
+
+  save_state.open(log, options.log_format)
+  save_state.replay()
+
+  with open(os.path.join(options.output_dir, "admins.json")) as f:
+    for username, d in json.load(f).items():
+      login.AdminUser(username, d["pwhash"], d["name"], d.get("roles", ()))
+
+  game.Global()
+  game.Global.STATE.start_event(False)
+
+  start = time.time()
+  sim = Simulation(options, rng, clock.now)
+  await sim.run(clock)
+  save_state.close()
+  game.Global.STATE.submit_log.close()
+
+  print()
+  print(f"Simulated {options.hours} hours for {len(game.Team.BY_USERNAME)} teams "
+        f"in {time.time()-start:.1f} s; wrote {os.path.getsize(log)} bytes to {log}.")
+  for k, v in sorted(sim.counts.items()):
+    print(f"  {k:20s} {v:8d}")
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Generate a state log for a simulated hunt.")
+  parser.add_argument("-e", "--event_dir",
+                      help="Path to event content.")
+  parser.add_argument("-o", "--output_dir",
+                      help="Directory to write the simulated event to.")
+  parser.add_argument("--placeholders", action="store_true",
+                      help="Replace all puzzles with placeholders.")
+  parser.add_argument("--log_format", choices=("json", "binary"), default="json",
+                      help="Format of the state log to write.")
+  parser.add_argument("-n", "--teams", type=int, default=300,
+                      help="Number of teams.")
+  parser.add_argument("--hours", type=float, default=48,
+                      help="Length of the simulated hunt.")
+  parser.add_argument("--seed", type=int, default=1,
+                      help="Random seed.")
+  parser.add_argument("--start", type=float, default=None,
+                      help="Unix time the hunt starts (default: now).")
+
+  parser.add_argument("--arrival", choices=("poisson", "uniform", "burst"),
+                      default="poisson",
+                      help="Distribution of the time between a team's actions.")
+  parser.add_argument("--mean_gap", type=float, default=300,
+                      help="Mean seconds between actions for an average team.")
+  parser.add_argument("--arrival_spread", type=float, default=10,
+                      help="Teams make their first move within this many minutes of the start.")
+  parser.add_argument("--break_hours", type=float, default=6,
+                      help="Mean length of a team's breaks with --arrival=burst.")
+  parser.add_argument("--skill_sigma", type=float, default=0.5,
+                      help="Spread (lognormal sigma) of team speed and accuracy.")
+
+  parser.add_argument("--correct_rate", type=float, default=0.3,
+                      help="Chance an average team's submission is correct.")
+  parser.add_argument("--hint_rate", type=float, default=0.05,
+                      help="Chance a team action is a hint request, when hints are open.")
+  parser.add_argument("--hint_reply_delay", type=float, default=300,
+                      help="Mean seconds for an admin to answer a hint request.")
+  parser.add_argument("--fastpass_rate", type=float, default=0.5,
+                      help="Chance a team with a PennyPass uses it on its next action.")
+  parser.add_argument("--bestow_rate", type=float, default=0.01,
+                      help="Chance per sweep that an admin bestows a PennyPass.")
+  parser.add_argument("--task_delay", type=float, default=600,
+                      help="Seconds before an admin completes a task.")
+  parser.add_argument("--sweep", type=float, default=10,
+                      help="Seconds between runs of the periodic server and admin actions.")
+  options = parser.parse_args()
+
+  assert options.event_dir is not None, "Must specify --event_dir."
+  assert options.output_dir is not None, "Must specify --output_dir."
+  assert (os.path.abspath(options.event_dir) !=
+          os.path.abspath(options.output_dir)), "Output must be a different directory."
+
+  import admin
+  import event
+  import game
+  options.debug = False
+  options.start_delay = 0
+  game.OPTIONS = options
+  event.OPTIONS = options
+  admin.OPTIONS = options
+
+  write_event_dir(options)
+  asyncio.run(generate(options))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+# Loads an event and replays its state log without starting the
+# server, and reports how much memory the game state takes: in total,
+# and for the objects there are one of per team per puzzle (or more).
+# Use tools/gen_hunt_log.py to make an event directory with as many
+# teams as you like.  Works on a copy of the log, so it's safe to run
+# against a live event directory.
+
+import argparse
+import asyncio
+import collections
+import gc
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+def rss_mb():
+  """Current resident size, where /proc has it; else the peak."""
+  try:
+    with open("/proc/self/statm") as f:
+      return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+  except OSError:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def object_sizes(classes):
+  """Count and total shallow size (including any instance dict) of
+  the live instances of each of classes."""
+  count = collections.Counter()
+  size = collections.Counter()
+  for obj in gc.get_objects():
+    cls = type(obj)
+    if cls not in classes: continue
+    count[cls] += 1
+    size[cls] += sys.getsizeof(obj)
+    d = getattr(obj, "__dict__", None)
+    if d is not None: size[cls] += sys.getsizeof(d)
+  return count, size
+
+
+def report(label, classes):
+  gc.collect()
+  traced, _ = tracemalloc.get_traced_memory()
+  count, size = object_sizes(classes)
+  print(f"{label}: {traced / 2**20:.1f} MB allocated, RSS {rss_mb():.1f} MB")
+  for cls in classes:
+    n = count[cls]
+    per = size[cls] / n if n else 0
+    print(f"  {cls.__name__:16s} {n:9d} objects {size[cls] / 2**20:8.2f} MB {per:7.0f} bytes each")
+
+
+async def bench(options, log, log_format):
+  import game
+  import main
+  from state import save_state
+
+  classes = (game.PuzzleState, game.Submission, game.HintMessage, game.Task)
+
+  tracemalloc.start()
+  start = time.time()
+  main.load_event(options)
+  print(f"Loaded event in {time.time()-start:.2f} s: "
+        f"{len(game.Team.BY_USERNAME)} teams x {len(game.Puzzle.BY_SHORTNAME)} puzzles.")
+  report("After load", classes)
+
+  if log:
+    save_state.open(log, log_format)
+    start = time.time()
+    save_state.replay(advance_time=game.Submission.process_submit_queue, use_snapshot=False)
+    print(f"Replayed log in {time.time()-start:.2f} s.")
+    save_state.close()
+    report("After replay", classes)
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Measure the memory used by the game state for an event.")
+  parser.add_argument("-e", "--event_dir",
+                      help="Path to event content.")
+  parser.add_argument("--log", default=None,
+                      help="State log to replay (default: the one in the event directory).")
+  parser.add_argument("--no_replay", action="store_true",
+                      help="Only load the event; don't replay any log.")
+  parser.add_argument("--placeholders", action="store_true",
+                      help="Replace all puzzles with placeholders.")
+  parser.add_argument("--debug", action="store_true",
+                      help="Load debug static content.")
+  options = parser.parse_args()
+
+  assert options.event_dir is not None, "Must specify --event_dir."
+
+  import admin
+  import event
+  import game
+  import state
+  options.start_delay = 0
+  game.OPTIONS = options
+  event.OPTIONS = options
+  admin.OPTIONS = options
+
+  src = options.log
+  if src is None and not options.no_replay:
+    for fmt in state.LOG_FORMATS.values():
+      fn = os.path.join(options.event_dir, fmt.FILENAME)
+      if os.path.exists(fn):
+        src = fn
+        break
+
+  with tempfile.TemporaryDirectory() as tmp:
+    log = log_format = None
+    if src and not options.no_replay:
+      log_format = state.detect_log_format(src)
+      log = os.path.join(tmp, os.path.basename(src))
+      shutil.copy(src, log)
+    asyncio.run(bench(options, log, log_format))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+
+# Replays a state log against an event directory without starting the
+# server, and reports where the time goes, broken down by @save_state
+# method.  Works on a copy of the log, so it's safe to run against a
+# live event directory.
+
+import argparse
+import asyncio
+import collections
+import cProfile
+import os
+import pstats
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+class Timings:
+  def __init__(self):
+    self.count = collections.Counter()
+    self.total = collections.Counter()
+    self.max = collections.Counter()
+
+  def wrap(self, key, fn):
+    def timed(*args, **kwargs):
+      start = time.perf_counter()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        d = time.perf_counter() - start
+        self.count[key] += 1
+        self.total[key] += d
+        if d > self.max[key]: self.max[key] = d
+    return timed
+
+  def instrument(self, class_map):
+    """Time every @save_state method of the replayable classes.
+    Replay calls the undecorated function through __wrapped__, so
+    that's what gets replaced."""
+    for cname, klass in class_map.items():
+      for name, fn in list(vars(klass).items()):
+        if not isinstance(fn, types.FunctionType): continue
+        inner = getattr(fn, "__wrapped__", None)
+        if inner is None: continue
+        fn.__wrapped__ = self.wrap(f"{cname}.{name}", inner)
+
+  def instrument_function(self, klass, name):
+    """Time a helper that's called from inside other methods.  Its
+    time is also counted in its callers'."""
+    setattr(klass, name, self.wrap(f"  {klass.__name__}.{name}", getattr(klass, name)))
+
+  def report(self, wall):
+    print(f"{'method':40s} {'calls':>8s} {'total ms':>10s} {'mean us':>9s} {'max ms':>8s} {'%':>6s}")
+    for key, total in self.total.most_common():
+      n = self.count[key]
+      print(f"{key:40s} {n:8d} {total*1000:10.1f} {total/n*1e6:9.1f} "
+            f"{self.max[key]*1000:8.2f} {total/wall*100:6.1f}")
+    other = wall - sum(v for (k, v) in self.total.items() if not k.startswith(" "))
+    print(f"{'(log decoding and dispatch)':40s} {'':8s} {other*1000:10.1f} "
+          f"{'':9s} {'':8s} {other/wall*100:6.1f}")
+
+
+async def bench(options, log, log_format):
+  import game
+  import main
+  from state import save_state
+
+  start = time.time()
+  main.load_event(options)
+  print(f"Loaded event in {time.time()-start:.2f} s.")
+
+  timings = Timings()
+  timings.instrument(save_state.class_map)
+  advance_time = timings.wrap("(advance_time)", game.Submission.process_submit_queue)
+  for fn in options.time:
+    cname, name = fn.split(".")
+    timings.instrument_function(getattr(game, cname), name)
+
+  save_state.open(log, log_format)
+
+  profiler = None
+  if options.pyinstrument:
+    import pyinstrument
+    profiler = pyinstrument.Profiler()
+    profiler.start()
+  elif options.profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+  start = time.perf_counter()
+  save_state.replay(advance_time=advance_time, use_snapshot=False)
+  wall = time.perf_counter() - start
+
+  if options.pyinstrument:
+    profiler.stop()
+    with open(options.pyinstrument, "w") as f:
+      f.write(profiler.output_html())
+    print(f"Wrote pyinstrument report to {options.pyinstrument}.")
+  elif options.profile:
+    profiler.disable()
+    profiler.dump_stats(options.profile)
+    print(f"Wrote cProfile stats to {options.profile}.")
+    pstats.Stats(options.profile).sort_stats("cumulative").print_stats(options.top)
+
+  save_state.close()
+
+  print()
+  calls = sum(v for (k, v) in timings.count.items() if not k.startswith(" "))
+  print(f"Replayed {calls} calls in {wall:.3f} s; "
+        f"{len(game.Team.BY_USERNAME)} teams, {len(game.Puzzle.BY_SHORTNAME)} puzzles; "
+        f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB.")
+  timings.report(wall)
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Benchmark replaying a state log through the game engine.")
+  parser.add_argument("-e", "--event_dir",
+                      help="Path to event content.")
+  parser.add_argument("--log", default=None,
+                      help="State log to replay (default: the one in the event directory).")
+  parser.add_argument("--placeholders", action="store_true",
+                      help="Replace all puzzles with placeholders.")
+  parser.add_argument("--debug", action="store_true",
+                      help="Load debug static content.")
+  parser.add_argument("--time", action="append",
+                      default=["Team.compute_puzzle_beam", "Team.solve_puzzle"],
+                      help="Also time this game.py function (Class.method).")
+  parser.add_argument("--check_beam", action="store_true",
+                      help="Check each incremental puzzle beam computation against a full one.")
+  parser.add_argument("--profile", default=None,
+                      help="Write cProfile stats to this file.")
+  parser.add_argument("--top", type=int, default=30,
+                      help="Number of functions to print from the cProfile stats.")
+  parser.add_argument("--pyinstrument", default=None,
+                      help="Write a pyinstrument HTML report to this file.")
+  options = parser.parse_args()
+
+  assert options.event_dir is not None, "Must specify --event_dir."
+
+  import admin
+  import event
+  import game
+  import state
+  options.start_delay = 0
+  game.OPTIONS = options
+  event.OPTIONS = options
+  admin.OPTIONS = options
+  game.Team.CHECK_BEAM = options.check_beam
+
+  src = options.log
+  if src is None:
+    for fmt in state.LOG_FORMATS.values():
+      src = os.path.join(options.event_dir, fmt.FILENAME)
+      if os.path.exists(src): break
+  log_format = state.detect_log_format(src)
+
+  with tempfile.TemporaryDirectory() as tmp:
+    log = os.path.join(tmp, os.path.basename(src))
+    shutil.copy(src, log)
+    asyncio.run(bench(options, log, log_format))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+
+# Checks that restoring the state snapshot and replaying the tail of
+# the state log produces the same game state as replaying the whole
+# log.  Works on a copy of the log, so it's safe to run against a live
+# event directory.
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+def dump_state():
+  import game
+  import login
+
+  teams = {}
+  for t in game.Team.all_teams():
+    pstates = {}
+    for p, ps in t.puzzle_state.items():
+      if ps.state == ps.CLOSED and not ps.submissions: continue
+      pstates[p.shortname] = {
+        "state": ps.state,
+        "open_time": ps.open_time,
+        "solve_time": ps.solve_time,
+        "answers_found": sorted(ps.answers_found),
+        "hints_available": ps.hints_available,
+        "keeper_answers": ps.keeper_answers,
+        "claim": ps.claim.username if ps.claim else None,
+        "hints": [[h.when, h.text, h.special, getattr(h.sender, "username", None)]
+                  for h in ps.hints],
+        "submissions": [[s.submit_id, s.state, s.answer, s.sent_time,
+                         s.submit_time, s.check_time, s.extra_response]
+                        for s in ps.submissions]}
+    teams[t.username] = {
+      "score": t.score,
+      "score_to_go": t.score_to_go,
+      "outer_lands_state": t.outer_lands_state,
+      "open_lands": sorted([land.shortname, when] for (land, when) in t.open_lands.items()),
+      "fastpasses_available": t.fastpasses_available,
+      "fastpasses_used": sorted([land.shortname, n] for (land, n) in t.fastpasses_used.items()),
+      "pennies": [sorted(p.shortname for p in t.pennies_earned),
+                  sorted(p.shortname for p in t.pennies_collected)],
+      "videos": t.videos,
+      "coin_found": t.coin_found,
+      "hints_open": sorted(p.shortname for p in t.hints_open),
+      "attrs": t.attrs,
+      "activity_log": t.activity_log.get_data(),
+      "admin_log": t.admin_log.get_data(),
+      "puzzles": pstates}
+
+  puzzles = {}
+  for p in game.Puzzle.all_puzzles():
+    puzzles[p.shortname] = {
+      "hints_available_time": p.hints_available_time,
+      "median_solve_duration": p.median_solve_duration,
+      "solve_durations": sorted([t.username, d] for (t, d) in p.solve_durations.items()),
+      "incorrect_counts": p.get_incorrect_counts(),
+      "open_teams": sorted(t.username for t in p.open_teams),
+      "log": p.puzzle_log.get_data()}
+
+  st = game.Global.STATE
+  glob = None
+  if st:
+    glob = {"event_start_time": st.event_start_time,
+            "hunt_closed": st.hunt_closed,
+            "tasks": sorted([k, t.when, getattr(t.claim, "username", None)]
+                            for (k, t) in st.task_queue.tasks.items()),
+            "errata": st.get_errata_data()}
+
+  admins = {}
+  for u in login.AdminUser.all_users():
+    admins[u.username] = {"fullname": u.fullname, "roles": sorted(u.roles)}
+
+  return {"teams": teams, "puzzles": puzzles, "global": glob, "admins": admins}
+
+
+async def replay_and_dump(options):
+  import game
+  import main
+  import snapshot
+  from state import save_state
+
+  main.load_event(options)
+  save_state.set_snapshot_handler(snapshot.GameSnapshot)
+  save_state.open(options.log, options.log_format)
+  save_state.replay(advance_time=game.Submission.process_submit_queue,
+                    use_snapshot=(options.mode == "snapshot"))
+
+  # The live server keeps checking queued answers between log records,
+  # so the snapshot may include checks that a full replay hasn't
+  # reached yet; bring both up to the same point.
+  if options.until:
+    game.Submission.process_submit_queue(options.until)
+
+  json.dump(dump_state(), sys.stdout, sort_keys=True)
+
+
+def compare(a, b, path=""):
+  if type(a) != type(b):
+    yield path
+  elif isinstance(a, dict):
+    for k in sorted(set(a) | set(b)):
+      if k not in a or k not in b:
+        yield f"{path}/{k}"
+      else:
+        yield from compare(a[k], b[k], f"{path}/{k}")
+  elif a != b:
+    yield path
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Verify a state snapshot against a full replay of the state log.")
+  parser.add_argument("-e", "--event_dir",
+                      help="Path to event content.")
+  parser.add_argument("--placeholders", action="store_true",
+                      help="Replace all puzzles with placeholders.")
+  parser.add_argument("--debug", action="store_true",
+                      help="Load debug static content.")
+  parser.add_argument("--log_format", choices=("json", "binary"), default="json",
+                      help="Format of the state log.")
+  parser.add_argument("--mode", choices=("full", "snapshot"), default=None,
+                      help=argparse.SUPPRESS)
+  parser.add_argument("--log", default=None, help=argparse.SUPPRESS)
+  parser.add_argument("--until", type=float, default=None, help=argparse.SUPPRESS)
+  options = parser.parse_args()
+
+  assert options.event_dir is not None, "Must specify --event_dir."
+
+  if options.mode:
+    import admin
+    import event
+    import game
+    options.start_delay = 0
+    game.OPTIONS = options
+    event.OPTIONS = options
+    admin.OPTIONS = options
+    asyncio.run(replay_and_dump(options))
+    return
+
+  import state
+  log_format = state.LOG_FORMATS[options.log_format]
+  event_log = os.path.join(options.event_dir, log_format.FILENAME)
+
+  with tempfile.TemporaryDirectory() as tmp:
+    log = os.path.join(tmp, log_format.FILENAME)
+    shutil.copy(event_log, log)
+    snap = event_log + ".snapshot"
+    if not os.path.exists(snap):
+      print("No snapshot to verify.")
+      sys.exit(1)
+    shutil.copy(snap, log + ".snapshot")
+
+    with open(snap, "rb") as f:
+      header = json.loads(f.readline())
+    until = header["time"]
+    with open(log, "rb" if options.log_format == "binary" else "r") as f:
+      for record in log_format().read(f, 0):
+        if not isinstance(record, str):
+          until = max(until, record[2])
+
+    out = {}
+    for mode in ("full", "snapshot"):
+      cmd = [sys.executable, os.path.abspath(__file__),
+             "--event_dir", options.event_dir, "--mode", mode,
+             "--log", log, "--log_format", options.log_format,
+             "--until", str(until)]
+      if options.placeholders: cmd.append("--placeholders")
+      if options.debug: cmd.append("--debug")
+      # Each replay appends to the log; start both from the same copy.
+      shutil.copy(event_log, log)
+      r = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+      out[mode] = json.loads(r.stdout.decode("utf-8").splitlines()[-1])
+
+  diffs = list(compare(out["full"], out["snapshot"]))
+  if diffs:
+    print(f"Snapshot at log offset {header['offset']} does NOT match full replay:")
+    for d in diffs[:50]:
+      print(f"  {d}")
+    if len(diffs) > 50:
+      print(f"  ... and {len(diffs)-50} more")
+    sys.exit(1)
+
+  print(f"Snapshot at log offset {header['offset']} matches full replay "
+        f"({len(out['full']['teams'])} teams).")
+
+
+if __name__ == "__main__":
+  main()
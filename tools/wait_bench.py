@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+# Measures what it costs to wake a crowd of long-polling waiters when
+# a message is broadcast, the way a global message (eg, the hunt
+# starting) hits every open tab at once.  Parks --waiters waiters on
+# one team in a wait proxy (or a scrum app, with --scrum), sends them
+# a message, and reports how long until each had its response and how
+# many callbacks the event loop ran to get them there.  Nothing is
+# sent over the network.
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+class CountingLoop(asyncio.SelectorEventLoop):
+  """An event loop that counts the callbacks scheduled on it."""
+  def __init__(self):
+    super().__init__()
+    self.callbacks = 0
+
+  def call_soon(self, *args, **kwargs):
+    self.callbacks += 1
+    return super().call_soon(*args, **kwargs)
+
+
+class ProxyTarget:
+  """Waiters on a wait proxy's ProxyTeam."""
+  def __init__(self):
+    # game has to be imported before wait_proxy, as main.py does, for
+    # the import cycle through login to resolve.
+    import game
+    import wait_proxy
+    self.team = wait_proxy.ProxyTeam("bench")
+    self.serial = 1
+
+  def waiter(self, i):
+    return self.team.await_new_messages(self.serial - 1, 600)
+
+  async def broadcast(self):
+    await self.team.send_messages(self.serial, [b'[%d,{"method":"bench"}]' % (self.serial,)])
+    self.serial += 1
+
+
+class ScrumTarget:
+  """Waiters on a scrum app's ProxyTeam."""
+  def __init__(self):
+    import scrum
+    self.team = scrum.ProxyTeam("bench")
+    self.waiters = []
+    self.scrum = scrum
+    self.serial = 0
+
+  def waiter(self, i):
+    if i >= len(self.waiters):
+      self.waiters.append(self.scrum.Waiter(i, self.team))
+    return self.waiters[i].wait(self.serial, 600)
+
+  async def broadcast(self):
+    await self.team.send_messages([{"method": "bench"}])
+    self.serial += 1
+
+
+async def run_round(loop, target, count):
+  done = []
+  async def wait(i):
+    await target.waiter(i)
+    done.append(time.perf_counter())
+
+  tasks = [asyncio.create_task(wait(i)) for i in range(count)]
+  # Let every waiter get as far as waiting.
+  for _ in range(3):
+    await asyncio.sleep(0)
+  assert not done, "Waiters returned before the broadcast."
+
+  loop.callbacks = 0
+  start = time.perf_counter()
+  await target.broadcast()
+  await asyncio.gather(*tasks)
+  callbacks = loop.callbacks
+
+  latency = [d - start for d in done]
+  return statistics.mean(latency), max(latency), callbacks
+
+
+async def bench(options):
+  loop = asyncio.get_running_loop()
+  target = ScrumTarget() if options.scrum else ProxyTarget()
+  results = [await run_round(loop, target, options.waiters)
+             for _ in range(options.rounds)]
+
+  print(f"{options.waiters} waiters, {options.rounds} broadcasts "
+        f"to {'a scrum app' if options.scrum else 'a wait proxy'}:")
+  print(f"  mean wakeup latency   {statistics.mean(r[0] for r in results)*1000:8.3f} ms")
+  print(f"  last wakeup latency   {statistics.mean(r[1] for r in results)*1000:8.3f} ms")
+  print(f"  callbacks/broadcast   {statistics.mean(r[2] for r in results):8.0f}")
+  print(f"  callbacks/waiter      {statistics.mean(r[2] for r in results) / options.waiters:8.2f}")
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Measure waking long-polling waiters on a broadcast.")
+  parser.add_argument("-n", "--waiters", type=int, default=2000,
+                      help="Number of waiters.")
+  parser.add_argument("--rounds", type=int, default=10,
+                      help="Number of broadcasts.")
+  parser.add_argument("--scrum", action="store_true",
+                      help="Wait on a scrum app instead of a wait proxy.")
+  options = parser.parse_args()
+
+  loop = CountingLoop()
+  try:
+    loop.run_until_complete(bench(options))
+  finally:
+    loop.close()
+
+
+if __name__ == "__main__":
+  main()